@@ -1,14 +1,45 @@
 """
 Модуль для умной проверки ответов с учетом морфологии русского языка
 """
+import asyncio
+import importlib.util
+import logging
 import re
-try:
-    import pymorphy3
-    morph = pymorphy3.MorphAnalyzer()
-    PYMORPHY_AVAILABLE = True
-except ImportError:
-    PYMORPHY_AVAILABLE = False
-    morph = None
+import threading
+
+logger = logging.getLogger(__name__)
+
+# pymorphy3 импортируется и загружает словари (несколько секунд) не при импорте модуля,
+# а при первом обращении - обычно в фоне при старте бота (warmup)
+PYMORPHY_AVAILABLE = importlib.util.find_spec("pymorphy3") is not None
+morph = None
+_morph_lock = threading.Lock()
+
+
+def load_morph():
+    """Загрузить морфологический анализатор (повторный вызов ничего не делает)"""
+    global morph, PYMORPHY_AVAILABLE
+    if morph is not None or not PYMORPHY_AVAILABLE:
+        return morph
+    with _morph_lock:
+        if morph is None and PYMORPHY_AVAILABLE:
+            try:
+                import pymorphy3
+                morph = pymorphy3.MorphAnalyzer()
+            except Exception as e:
+                logger.error(f"Не удалось загрузить pymorphy3, проверка без морфологии: {e}")
+                PYMORPHY_AVAILABLE = False
+    return morph
+
+
+def is_ready() -> bool:
+    """Загружен ли анализатор (или морфология недоступна и ждать нечего)"""
+    return morph is not None or not PYMORPHY_AVAILABLE
+
+
+async def warmup():
+    """Загрузить анализатор в отдельном потоке, не блокируя event loop"""
+    await asyncio.to_thread(load_morph)
 
 
 def normalize_text(text: str) -> str:
@@ -61,6 +92,8 @@ def check_answer_flexible(user_answer: str, correct_answer: str) -> bool:
     if not user_answer or not correct_answer:
         return False
     
+    load_morph()
+    
     # Очистка входных данных
     user_answer = str(user_answer).strip()
     correct_answer = str(correct_answer).strip()
@@ -0,0 +1,262 @@
+"""
+Резервные копии базы на ходу: online backup API SQLite, gzip, ротация и проверка целостности
+
+Файл базы нельзя просто скопировать, пока бот пишет: копия может оказаться несогласованной.
+Копия снимается через online backup API (sqlite3.Connection.backup) в отдельном потоке
+пачками по BACKUP_PAGES_PER_STEP страниц с паузой BACKUP_STEP_SLEEP_MS между пачками.
+Соединение-источник держит одну транзакцию чтения на все время копирования: в режиме WAL
+она не мешает записи, а копия получается снимком на момент начала (без перезапусков
+копирования при каждой записи). Event loop бота все это время свободен.
+
+Готовая копия проверяется (PRAGMA integrity_check), сжимается в
+BACKUP_DIR/<имя базы>-<время>.db.gz и хранится в количестве BACKUP_KEEP последних.
+
+Запуск из корня проекта:
+    python -m backups create
+    python -m backups list
+    python -m backups verify backups/riddle_bot-20240304-000000.db.gz
+    python -m backups restore backups/riddle_bot-20240304-000000.db.gz   # бот должен быть остановлен
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))
+# Как часто снимать копию по расписанию (0 - не снимать)
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "6"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = float(os.getenv("BACKUP_STEP_SLEEP_MS", "5"))
+# Уровень gzip: сжатие занимает процессор дольше самого копирования, 1-3 почти не уступают 6-9 по размеру
+BACKUP_COMPRESS_LEVEL = int(os.getenv("BACKUP_COMPRESS_LEVEL", "3"))
+
+# Размер блока при сжатии и распаковке
+COPY_CHUNK = 1024 * 1024
+
+BACKUP_SECONDS = metrics.Gauge("bot_backup_duration_seconds", "Длительность последнего резервного копирования")
+BACKUP_BYTES = metrics.Gauge("bot_backup_size_bytes", "Размер последней резервной копии (сжатой)")
+BACKUP_LAST_SUCCESS = metrics.Gauge("bot_backup_last_success_timestamp", "Время последней успешной копии (unix)")
+BACKUP_ERRORS = metrics.Counter("bot_backup_errors_total", "Неудачные резервные копирования")
+
+
+def _prefix(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def integrity_check(path: str) -> str:
+    """PRAGMA integrity_check для файла базы: "ok" или описание первых ошибок"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check(10)").fetchall()
+    finally:
+        conn.close()
+    return "; ".join(row[0] for row in rows)
+
+
+def copy_database(source_path: str, target_path: str, pages: int = BACKUP_PAGES_PER_STEP,
+                  sleep_ms: float = BACKUP_STEP_SLEEP_MS) -> int:
+    """Скопировать базу online backup API пачками страниц; вернуть число пачек"""
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if remaining and sleep_ms:
+            # Пауза между пачками: запись и чекпоинты бота проходят без очереди
+            time.sleep(sleep_ms / 1000)
+
+    source = sqlite3.connect(source_path, timeout=database.BUSY_TIMEOUT, isolation_level=None)
+    target = sqlite3.connect(target_path)
+    try:
+        # Одна транзакция чтения на все копирование: копия - снимок на момент ее начала
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages, progress=progress)
+        source.execute("ROLLBACK")
+    finally:
+        target.close()
+        source.close()
+    return steps
+
+
+def _compress(source_path: str, target_path: str, sleep_ms: float = BACKUP_STEP_SLEEP_MS):
+    partial = target_path + ".partial"
+    with open(source_path, "rb") as source, \
+            gzip.open(partial, "wb", compresslevel=BACKUP_COMPRESS_LEVEL) as target:
+        while True:
+            chunk = source.read(COPY_CHUNK)
+            if not chunk:
+                break
+            target.write(chunk)
+            if sleep_ms:
+                # Как и при копировании: процессор периодически отдается event loop бота
+                time.sleep(sleep_ms / 1000)
+    os.replace(partial, target_path)
+
+
+def _decompress(source_path: str, target_path: str):
+    with gzip.open(source_path, "rb") as source, open(target_path, "wb") as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK)
+
+
+def list_backups(backup_dir: str = None, db_path: str = None) -> list:
+    """Файлы копий базы db_path, от новых к старым"""
+    backup_dir = backup_dir or BACKUP_DIR
+    pattern = os.path.join(backup_dir, f"{_prefix(db_path or database.DB_PATH)}-*.db.gz")
+    return sorted(glob.glob(pattern), reverse=True)
+
+
+def rotate(backup_dir: str = None, keep: int = None, db_path: str = None) -> list:
+    """Удалить копии сверх keep последних; вернуть удаленные"""
+    keep = BACKUP_KEEP if keep is None else keep
+    removed = list_backups(backup_dir, db_path)[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def create_backup_sync(db_path: str = None, backup_dir: str = None, keep: int = None) -> dict:
+    """Снять, проверить, сжать копию и удалить старые (синхронно - вызывать в потоке)"""
+    db_path = db_path or database.DB_PATH
+    backup_dir = backup_dir or BACKUP_DIR
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.perf_counter()
+    name = f"{_prefix(db_path)}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db.gz"
+    path = os.path.join(backup_dir, name)
+
+    fd, raw_path = tempfile.mkstemp(prefix=".backup-", suffix=".db", dir=backup_dir)
+    os.close(fd)
+    try:
+        steps = copy_database(db_path, raw_path)
+        copied = time.perf_counter()
+        check = integrity_check(raw_path)
+        if check != "ok":
+            raise RuntimeError(f"Копия не прошла проверку целостности: {check}")
+        db_bytes = os.path.getsize(raw_path)
+        _compress(raw_path, path)
+    finally:
+        os.remove(raw_path)
+    removed = rotate(backup_dir, keep, db_path)
+    return {
+        "path": path,
+        "bytes": os.path.getsize(path),
+        "db_bytes": db_bytes,
+        "steps": steps,
+        "copy_seconds": round(copied - started, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+        "removed": removed
+    }
+
+
+async def create_backup(db_path: str = None, backup_dir: str = None, keep: int = None) -> dict:
+    """Снять резервную копию в отдельном потоке, не блокируя event loop"""
+    try:
+        result = await asyncio.to_thread(create_backup_sync, db_path, backup_dir, keep)
+    except Exception:
+        BACKUP_ERRORS.inc()
+        raise
+    BACKUP_SECONDS.set(result["seconds"])
+    BACKUP_BYTES.set(result["bytes"])
+    BACKUP_LAST_SUCCESS.set(time.time())
+    logger.info(
+        "[БЭКАП] Копия %s: %.1f МБ (база %.1f МБ) за %.1f с, удалено старых: %d",
+        result["path"], result["bytes"] / (1024 * 1024), result["db_bytes"] / (1024 * 1024),
+        result["seconds"], len(result["removed"])
+    )
+    return result
+
+
+async def backup_job():
+    """Задача планировщика: резервная копия базы"""
+    await create_backup()
+
+
+def verify_backup(path: str) -> str:
+    """Распаковать копию во временный файл и проверить целостность"""
+    fd, raw_path = tempfile.mkstemp(prefix=".verify-", suffix=".db", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        _decompress(path, raw_path)
+        return integrity_check(raw_path)
+    finally:
+        os.remove(raw_path)
+
+
+def restore(path: str, db_path: str = None) -> str:
+    """Заменить базу копией; текущая база сохраняется рядом (<база>.before-restore-<время>)
+
+    Бот должен быть остановлен: открытые им соединения продолжат писать в старый файл.
+    """
+    db_path = db_path or database.DB_PATH
+    directory = os.path.dirname(os.path.abspath(db_path))
+    fd, raw_path = tempfile.mkstemp(prefix=".restore-", suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        _decompress(path, raw_path)
+        check = integrity_check(raw_path)
+        if check != "ok":
+            raise RuntimeError(f"Копия повреждена: {check}")
+        previous = None
+        if os.path.exists(db_path):
+            # Переносим зафиксированное из WAL в файл базы, чтобы старая база сохранилась целиком
+            conn = sqlite3.connect(db_path, timeout=database.BUSY_TIMEOUT)
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                conn.close()
+            previous = f"{db_path}.before-restore-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+            os.replace(db_path, previous)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.replace(raw_path, db_path)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    logger.warning("[БЭКАП] База %s восстановлена из %s (прежняя: %s)", db_path, path, previous)
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("create", help="снять копию сейчас")
+    subparsers.add_parser("list", help="список копий")
+    verify_parser = subparsers.add_parser("verify", help="проверить целостность копии")
+    verify_parser.add_argument("path")
+    restore_parser = subparsers.add_parser("restore", help="восстановить базу из копии (бот остановлен)")
+    restore_parser.add_argument("path")
+    restore_parser.add_argument("--db", help="файл базы (по умолчанию DB_PATH)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "create":
+        print(json.dumps(asyncio.run(create_backup()), ensure_ascii=False, indent=2))
+    elif args.command == "list":
+        for path in list_backups():
+            print(f"{path}  {os.path.getsize(path) / (1024 * 1024):.1f} МБ")
+    elif args.command == "verify":
+        check = verify_backup(args.path)
+        print(check)
+        raise SystemExit(0 if check == "ok" else 1)
+    else:
+        previous = restore(args.path, args.db)
+        print(f"База восстановлена из {args.path}" + (f", прежняя сохранена в {previous}" if previous else ""))
+
+
+if __name__ == "__main__":
+    main()
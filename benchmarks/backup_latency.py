@@ -0,0 +1,148 @@
+"""
+Задержка ответов пользователям, пока снимается резервная копия базы (backups.py)
+
+Запуск из корня проекта:
+    python -m benchmarks.backup_latency --users 300 --db-mb 200
+
+База дополняется отдельной таблицей до --db-mb мегабайт, затем синтетические пользователи
+играют с ботом, а в режиме backup все это время копии снимаются одна за другой
+(backups.create_backup, как задача планировщика). Режимы:
+- none - без копирования (базовая линия);
+- backup - непрерывное копирование во время нагрузки.
+Каждый режим - отдельный запуск с чистой базой. В отчете - p50/p95/p99 задержки ответа,
+число снятых копий и время одной копии.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.load_test import BOT_TOKEN, FakeBotApi, percentile, synthetic_user
+
+MODES = ("none", "backup")
+
+
+def pad_database(db_path: str, megabytes: float):
+    """Дорастить файл базы до megabytes отдельной таблицей: копируется все, а запросы бота ее не читают"""
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE IF NOT EXISTS bench_padding (id INTEGER PRIMARY KEY, payload BLOB)")
+        while os.path.getsize(db_path) < megabytes * 1024 * 1024:
+            db.executemany("INSERT INTO bench_padding (payload) VALUES (?)", ((os.urandom(512),) for _ in range(20_000)))
+            db.commit()
+
+
+async def run(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="riddle_backup_")
+    os.environ["BOT_TOKEN"] = BOT_TOKEN
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["DB_PATH"] = os.path.join(tmp, "backup.db")
+    os.environ["BACKUP_DIR"] = os.path.join(tmp, "backups")
+    os.environ["LOG_LEVEL"] = "WARNING"
+
+    api = FakeBotApi()
+    os.environ["TELEGRAM_API_URL"] = await api.start()
+
+    import logging
+    import backups
+    import bot
+    import database
+    import riddle_generator
+    logging.getLogger().setLevel(logging.WARNING)
+
+    await database.init_db()
+    await database.add_riddles(riddle_generator.get_catalog())
+    pad_database(database.DB_PATH, args.db_mb)
+    db_mb = os.path.getsize(database.DB_PATH) / (1024 * 1024)
+
+    application = bot.build_application(run_jobs=False)
+    await application.initialize()
+    await application.post_init(application)
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+    await application.start()
+
+    stopped = asyncio.Event()
+    backup_results = []
+
+    async def backup_loop():
+        while not stopped.is_set():
+            backup_results.append(await backups.create_backup(keep=1))
+
+    backup_task = asyncio.create_task(backup_loop()) if args.mode == "backup" else None
+
+    answers = {riddle["question"]: riddle["answer"] for riddle in riddle_generator.get_catalog()}
+    latencies, timeouts = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        synthetic_user(api, 10_000_000 + i, args.actions, answers, 0.6, latencies, timeouts, 30.0)
+        for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - started
+    stopped.set()
+    if backup_task is not None:
+        await backup_task
+
+    await application.updater.stop()
+    await application.stop()
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    await api.stop()
+    return {
+        "mode": args.mode,
+        "db_mb": round(db_mb, 1),
+        "updates": len(latencies) + len(timeouts),
+        "timeouts": len(timeouts),
+        "updates_per_second": round((len(latencies) + len(timeouts)) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies, default=0) * 1000, 1)
+        },
+        "backups": len(backup_results),
+        "backup_seconds": round(statistics.mean(r["seconds"] for r in backup_results), 2) if backup_results else None,
+        "backup_copy_seconds": (
+            round(statistics.mean(r["copy_seconds"] for r in backup_results), 2) if backup_results else None
+        ),
+        "backup_mb": round(backup_results[-1]["bytes"] / (1024 * 1024), 1) if backup_results else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="какие режимы сравнить")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--users", type=int, default=300, help="синтетических пользователей")
+    parser.add_argument("--actions", type=int, default=10, help="действий на пользователя после /start")
+    parser.add_argument("--db-mb", type=float, default=200, help="размер базы, МБ")
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    if args.mode:
+        # Один режим в этом процессе: у бота глобальное состояние (планировщик, метрики)
+        print(json.dumps(asyncio.run(run(args)), ensure_ascii=False))
+        return
+
+    results = []
+    for mode in args.modes:
+        command = [sys.executable, "-m", "benchmarks.backup_latency", "--mode", mode,
+                   "--users", str(args.users), "--actions", str(args.actions), "--db-mb", str(args.db_mb)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        latency = result["latency_ms"]
+        print(f"{mode:<7} p50 {latency['p50']:>7} мс  p95 {latency['p95']:>7} мс  p99 {latency['p99']:>7} мс  "
+              f"{result['updates_per_second']:>6} апдейтов/с  база {result['db_mb']} МБ, копий {result['backups']}, "
+              f"копия {result['backup_seconds']} с (копирование {result['backup_copy_seconds']} с)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""
+Бенчмарк функций database на объемах продакшена: 100k пользователей, 10M попыток, 50k загадок
+
+Запуск из корня проекта:
+    python -m benchmarks.db_scale --json db_scale.json
+    python -m benchmarks.db_scale --scale 0.01 --compare db_scale.json   # быстрый прогон
+
+Синтетическая база строится один раз по схеме из database.init_db и кэшируется
+(--db, по умолчанию benchmarks/.cache/db_scale_<размеры>.db); замеры идут на копии,
+поэтому пишущие функции не портят кэш. Каждая публичная функция database вызывается
+до --calls раз (но не дольше --budget секунд). Отчет - JSON с p50/p95/max по функциям
+и параметрами прогона; --compare печатает разницу с прошлым отчетом.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+CHUNK = 100_000
+
+# Функции, которые не меряются: создание схемы меряется отдельно при генерации,
+# чтение и запись проекций журнала - в benchmarks.event_replay
+NOT_BENCHMARKED = {"init_db", "read_projections", "write_projections"}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def question(riddle_id: int) -> str:
+    return f"Бенчмарк-загадка №{riddle_id}: как называется прием номер {riddle_id} в типографике?"
+
+
+def _chunks(rows, size=CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate(path: str, users: int, attempts: int, riddles: int, seed: int = 1):
+    """Построить синтетическую базу по текущей схеме"""
+    rng = random.Random(seed)
+    database.DB_PATH = path
+    started = time.perf_counter()
+    asyncio.run(database.init_db())
+    init_seconds = time.perf_counter() - started
+
+    conn = sqlite3.connect(path)
+    # Генерация одной транзакцией без журнала; режим WAL возвращается в конце
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    now = datetime.now()
+
+    def timestamp(days_back: float) -> str:
+        return (now - timedelta(days=days_back)).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn.executemany(
+        "INSERT INTO riddles (id, question, answer, hint, created_at) VALUES (?, ?, ?, ?, ?)",
+        ((i, question(i), f"ответ{i}", f"подсказка {i}", timestamp(rng.uniform(0, 365)))
+         for i in range(1, riddles + 1))
+    )
+    conn.executemany(
+        """INSERT INTO users (user_id, username, first_name, total_riddles_solved,
+                              total_riddles_attempted, total_hints_used, rating, bot_active)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        ((i, f"user{i}", f"User{i}", rng.randint(0, 300), rng.randint(0, 900), rng.randint(0, 50),
+          rng.randint(0, 3000), 1 if rng.random() < 0.9 else 0)
+         for i in range(1, users + 1))
+    )
+    for chunk in _chunks(
+        (rng.randint(1, users), rng.randint(1, riddles), "ответ", rng.random() < 0.3, 1,
+         timestamp(rng.uniform(0, 365)))
+        for _ in range(attempts)
+    ):
+        conn.executemany(
+            """INSERT INTO attempts (user_id, riddle_id, answer, is_correct, attempt_number, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            chunk
+        )
+    # Сезоны рейтинга: год недель, в каждой играла пятая часть пользователей;
+    # у закрытых сезонов есть снимок итоговой таблицы
+    seasons = [(season, timestamp(7 * (52 - season)), database.current_week_date(now - timedelta(weeks=52 - season)))
+               for season in range(1, 53)]
+    conn.execute("DELETE FROM seasons")
+    conn.executemany("INSERT INTO seasons (id, started_at, week_date) VALUES (?, ?, ?)", seasons)
+    for season, _, week_date in seasons:
+        conn.executemany(
+            "INSERT INTO season_ratings (season_id, user_id, rating) VALUES (?, ?, ?)",
+            ((season, user_id, rng.randint(0, 3000))
+             for user_id in rng.sample(range(1, users + 1), max(1, users // 5)))
+        )
+        if season < 52:
+            conn.execute(database.SNAPSHOT_LEADERBOARD_SQL, {"season_id": season, "week_date": week_date})
+    # Активная загадка у трети пользователей
+    conn.executemany(
+        "INSERT OR IGNORE INTO user_active_riddles (user_id, riddle_id, wrong_attempts, hints_given) VALUES (?, ?, ?, ?)",
+        ((i, rng.randint(1, riddles), rng.randint(0, 5), 0) for i in range(1, users + 1) if i % 3 == 0)
+    )
+    # Счетчики сложности загадок - по сгенерированной истории, как при миграции
+    conn.execute(database.RIDDLE_STATS_BACKFILL_SQL)
+    # Год истории грантов: по 10 победителей в неделю
+    grants = []
+    for week in range(52):
+        week_date = (now - timedelta(weeks=week + 1)).strftime("%Y-%m-%d")
+        for user_id in rng.sample(range(1, users + 1), min(10, users)):
+            grants.append((user_id, 30000, f"HIST{week:02d}{user_id:08d}", week_date))
+    conn.executemany(
+        """INSERT INTO grants (user_id, grant_amount, promo_code, week_date, exported_at, notified_at)
+           VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)""",
+        grants
+    )
+    conn.execute(
+        """INSERT INTO promo_codes (code, grant_id, issued_at)
+           SELECT promo_code, id, created_at FROM grants"""
+    )
+    conn.executemany(
+        "INSERT INTO promo_codes (code) VALUES (?)",
+        ((f"FREE{i:08d}",) for i in range(1000))
+    )
+    # Журнал событий начинается со снимка сгенерированного состояния, как при миграции
+    conn.execute("DELETE FROM events")
+    for statement in database.EVENT_BASELINE_SQL:
+        conn.execute(statement)
+    conn.execute(
+        "CREATE TABLE bench_meta (users INTEGER, attempts INTEGER, riddles INTEGER, seed INTEGER)"
+    )
+    conn.execute("INSERT INTO bench_meta VALUES (?, ?, ?, ?)", (users, attempts, riddles, seed))
+    conn.commit()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    return {"generate_seconds": round(time.perf_counter() - started, 1), "init_db_seconds": round(init_seconds, 3)}
+
+
+def cached_db(args) -> tuple:
+    """Путь к готовой синтетической базе (построить, если ее нет)"""
+    users = max(1, int(args.users * args.scale))
+    attempts = max(1, int(args.attempts * args.scale))
+    riddles = max(1, int(args.riddles * args.scale))
+    path = args.db or os.path.join(CACHE_DIR, f"db_scale_{users}u_{attempts}a_{riddles}r.db")
+    sizes = {"users": users, "attempts": attempts, "riddles": riddles}
+    if os.path.exists(path) and not args.regenerate:
+        return path, sizes, {}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    print(f"Генерация базы {path}: {sizes}")
+    generation = generate(path, users, attempts, riddles)
+    print(f"Готово за {generation['generate_seconds']} с")
+    return path, sizes, generation
+
+
+def scenarios(sizes: dict, rng: random.Random) -> list:
+    """(функция, аргументы для i-го вызова, сколько вызовов максимум); порядок важен"""
+    users, riddles = sizes["users"], sizes["riddles"]
+    state = {"grant_ids": []}
+    active_users = [u for u in range(3, users + 1, 3)] or [1]
+
+    def user():
+        return rng.randint(1, users)
+
+    def active_user():
+        return rng.choice(active_users)
+
+    def riddle():
+        return rng.randint(1, riddles)
+
+    def week(i):
+        return f"2099-{i // 28 + 1:02d}-{i % 28 + 1:02d}"
+
+    def closed_week(i):
+        # Недели со снимком итоговой таблицы (закрытые сезоны generate)
+        return database.current_week_date(datetime.now() - timedelta(weeks=i % 50 + 1))
+
+    def grant_id(i):
+        return state["grant_ids"][i % len(state["grant_ids"])] if state["grant_ids"] else 1
+
+    async def collect_grants(i):
+        grants = await database.get_week_grants(closed_week(0))
+        state["grant_ids"] = [grant["id"] for grant in grants]
+        return grants
+
+    return [
+        ("get_active_riddle", lambda i: ()),
+        ("get_riddle_by_id", lambda i: (riddle(),)),
+        ("get_riddle_by_question", lambda i: (question(riddle()),)),
+        ("user_has_seen_riddle", lambda i: (user(), question(riddle()))),
+        ("get_unsolved_riddle_for_user", lambda i: (user(),)),
+        ("get_or_create_user", lambda i: (user(), "bench", "Bench")),
+        ("get_user_stats", lambda i: (user(),)),
+        ("get_user_active_riddle_info", lambda i: (active_user(),)),
+        ("get_user_active_riddle_id", lambda i: (active_user(),)),
+        ("check_answer", lambda i: (active_user(), "неправильный ответ")),
+        ("get_hint", lambda i: (active_user(),)),
+        ("set_user_active_riddle", lambda i: (user(), riddle())),
+        ("clear_user_active_riddle", lambda i: (user(),)),
+        ("should_send_course_recommendation", lambda i: (user(),)),
+        ("mark_course_recommendation_sent", lambda i: (user(),)),
+        ("is_bot_active", lambda i: (user(),)),
+        ("set_bot_active", lambda i: (user(), True)),
+        ("get_leaderboard", lambda i: (10,)),
+        ("get_snapshot_weeks", lambda i: (8,)),
+        ("get_leaderboard_snapshot", lambda i: (closed_week(i), 10)),
+        ("get_all_users", lambda i: ()),
+        ("get_users_with_active_riddles", lambda i: ()),
+        ("add_riddle", lambda i: (f"Новая бенчмарк-загадка {i} {rng.random()}", "ответ", "подсказка")),
+        ("add_riddles", lambda i: ([
+            {"question": f"Пакетная бенчмарк-загадка {i}-{n} {rng.random()}", "answer": "ответ", "hint": None}
+            for n in range(20)
+        ],)),
+        ("select_weekly_grant_winners", lambda i: (closed_week(i), 10, 30000)),
+        ("get_week_grants", collect_grants),
+        ("get_pending_grants", lambda i: ()),
+        ("count_free_promo_codes", lambda i: ()),
+        ("add_promo_codes", lambda i: ([f"B{i:04d}{n:04d}{rng.randint(0, 10 ** 6)}" for n in range(100)],)),
+        ("claim_promo_code", lambda i: (grant_id(i),)),
+        ("mark_grant_exported", lambda i: (grant_id(i),)),
+        ("mark_grant_notified", lambda i: (grant_id(i),)),
+        ("acquire_lease", lambda i: (f"bench{i % 3}", f"replica{i % 2}", 15.0)),
+        ("get_lease", lambda i: (f"bench{i % 3}",)),
+        ("release_lease", lambda i: (f"bench{i % 3}", f"replica{i % 2}")),
+        ("claim_job_run", lambda i: ("bench_job", week(i))),
+        ("finish_job_run", lambda i: ("bench_job", week(i))),
+        ("is_job_run_done", lambda i: ("bench_job", week(i))),
+        ("has_job_runs", lambda i: ("bench_job",)),
+        ("get_last_job_runs", lambda i: ()),
+        ("delete_old_job_runs", lambda i: (60,)),
+        ("seal_event_segments", lambda i: ()),
+        ("get_event_log_stats", lambda i: ()),
+        ("get_riddle_stats", lambda i: ()),
+        ("get_riddle_stats_report", lambda i: (list(database.RIDDLE_STATS_ORDERS)[i % 5], 10, 10)),
+        ("get_difficulty_by_question", lambda i: ()),
+        # Перезагрузка пака: у нескольких сотен загадок каталога исправлены ответы
+        ("update_riddles_content", lambda i: ([
+            {"question": question(riddle_id), "answer": f"исправленный ответ {i}", "hint": None}
+            for riddle_id in rng.sample(range(1, riddles + 1), min(300, riddles))
+        ],)),
+        ("get_skill_quantiles", lambda i: (5, 5)),
+        ("get_closed_week", lambda i: ()),
+        ("get_current_season", lambda i: ()),
+        ("reset_weekly_ratings", lambda i: ()),
+    ]
+
+
+async def measure(args, sizes: dict) -> dict:
+    rng = random.Random(args.seed)
+    results = {}
+    for name, make_args in scenarios(sizes, rng):
+        func = getattr(database, name)
+        timings = []
+        deadline = time.perf_counter() + args.budget
+        for i in range(args.calls):
+            if inspect.iscoroutinefunction(make_args):
+                # Сценарий сам вызывает функцию (нужно сохранить результат)
+                started = time.perf_counter()
+                await make_args(i)
+            else:
+                call_args = make_args(i)
+                started = time.perf_counter()
+                await func(*call_args)
+            timings.append(time.perf_counter() - started)
+            if time.perf_counter() > deadline:
+                break
+        results[name] = {
+            "calls": len(timings),
+            "mean_ms": round(statistics.mean(timings) * 1000, 3),
+            "p50_ms": round(statistics.median(timings) * 1000, 3),
+            "p95_ms": round(percentile(timings, 95) * 1000, 3),
+            "max_ms": round(max(timings) * 1000, 3)
+        }
+        print(f"{name:<36} {results[name]['calls']:>4} вызовов  p50 {results[name]['p50_ms']:>10.2f}ms  "
+              f"p95 {results[name]['p95_ms']:>10.2f}ms")
+    return results
+
+
+def public_functions() -> set:
+    return {
+        name for name, func in vars(database).items()
+        if not name.startswith("_") and inspect.iscoroutinefunction(func)
+        and getattr(func, "__module__", None) == database.__name__
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(report: dict, path: str):
+    """Напечатать изменение p50/p95 относительно прошлого отчета"""
+    with open(path, encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\nСравнение с {path} ({old['meta'].get('git', '?')} -> {report['meta'].get('git', '?')}):")
+    for name, new in report["results"].items():
+        before = old["results"].get(name)
+        if not before:
+            print(f"{name:<36} новая функция")
+            continue
+        ratio = new["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        print(f"{name:<36} p50 {before['p50_ms']:>10.2f} -> {new['p50_ms']:>10.2f}ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--attempts", type=int, default=10_000_000)
+    parser.add_argument("--riddles", type=int, default=50_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель размеров (0.01 - быстрый прогон)")
+    parser.add_argument("--db", help="путь к кэшу синтетической базы")
+    parser.add_argument("--regenerate", action="store_true", help="построить базу заново")
+    parser.add_argument("--calls", type=int, default=20, help="вызовов каждой функции")
+    parser.add_argument("--budget", type=float, default=10.0, help="секунд на одну функцию")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="куда сохранить отчет")
+    parser.add_argument("--compare", help="прошлый отчет для сравнения")
+    args = parser.parse_args()
+
+    path, sizes, generation = cached_db(args)
+    work_dir = tempfile.mkdtemp(prefix="db_scale_")
+    work_path = os.path.join(work_dir, "bench.db")
+    shutil.copyfile(path, work_path)
+    database.DB_PATH = work_path
+    try:
+        # Кэш мог быть построен по старой схеме: миграции init_db применяются к копии
+        asyncio.run(database.init_db())
+        results = asyncio.run(measure(args, sizes))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    skipped = sorted(public_functions() - set(results) - NOT_BENCHMARKED)
+    if skipped:
+        print(f"\nБез сценария (добавьте в scenarios): {', '.join(skipped)}")
+    report = {
+        "meta": {
+            "git": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "sizes": sizes,
+            "db_mb": round(os.path.getsize(path) / (1024 * 1024), 1),
+            "calls": args.calls,
+            "budget_seconds": args.budget,
+            **generation
+        },
+        "results": results,
+        "skipped": skipped
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
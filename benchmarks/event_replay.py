@@ -0,0 +1,150 @@
+"""
+Скорость воспроизведения журнала событий (events.py): сколько событий в секунду
+читается, применяется к проекциям и записывается при пересборке
+
+Запуск из корня проекта:
+    python -m benchmarks.event_replay --events 1000000 --users 100000
+
+Синтетический журнал (назначения загадок, ответы, подсказки, новые сезоны) пишется
+прямо в таблицу events, после чего меряются два состояния журнала:
+- tail - все события в таблице events (сегменты не упакованы);
+- segments - полные пачки упакованы в event_segments (database.seal_event_segments).
+Для каждого: чтение и разбор (read), чтение + применение к проекциям (replay)
+и полная пересборка с записью проекций в базу (rebuild). Проверка: после пересборки
+проекции совпадают с журналом (events.rebuild(apply=False) без расхождений).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import database
+import events
+
+CHUNK = 100_000
+
+
+def generate(path: str, count: int, users: int, riddles: int, seed: int = 1):
+    """Записать count событий, похожих на настоящие: у каждого ответа есть назначенная загадка"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("DELETE FROM events")
+    created_at = time.time() - 365 * 86400
+    active, seen = {}, set()
+    season = 1
+
+    def stream():
+        nonlocal created_at, season
+        yield created_at, "season_started", None, json.dumps({"season_id": season})
+        for n in range(count - 1):
+            created_at += 0.01
+            user_id = rng.randint(1, users)
+            if n % max(1, count // 52) == 0 and n:
+                season += 1
+                yield created_at, "season_started", None, json.dumps({"season_id": season})
+            elif user_id not in seen:
+                seen.add(user_id)
+                yield created_at, "user_created", user_id, json.dumps(
+                    {"username": f"user{user_id}", "first_name": f"User{user_id}"}, ensure_ascii=False
+                )
+            elif user_id not in active:
+                active[user_id] = rng.randint(1, riddles)
+                yield created_at, "riddle_assigned", user_id, json.dumps({"riddle_id": active[user_id]})
+            elif rng.random() < 0.1:
+                yield created_at, "hint_given", user_id, json.dumps({"riddle_id": active[user_id]})
+            else:
+                correct = rng.random() < 0.3
+                riddle_id = active.pop(user_id) if correct else active[user_id]
+                yield created_at, "answer_checked", user_id, json.dumps({
+                    "riddle_id": riddle_id, "correct": correct, "first_solve": correct,
+                    "rating_delta": 10 if correct else -5
+                })
+
+    rows = stream()
+    while True:
+        chunk = [row for _, row in zip(range(CHUNK), rows)]
+        if not chunk:
+            break
+        conn.executemany(database.APPEND_EVENT_SQL, chunk)
+    conn.commit()
+    conn.close()
+
+
+async def measure_read() -> tuple:
+    started = time.perf_counter()
+    total = 0
+    async with database.connect() as db:
+        async for batch in database.iter_event_log(db):
+            total += len(batch)
+    return total, time.perf_counter() - started
+
+
+async def measure_replay() -> tuple:
+    started = time.perf_counter()
+    async with database.connect() as db:
+        projections = await events.replay(db)
+    return projections.events, time.perf_counter() - started
+
+
+async def measure_state(label: str) -> dict:
+    read_events, read_seconds = await measure_read()
+    replay_events, replay_seconds = await measure_replay()
+    rebuilt = await events.rebuild()
+    check = await events.rebuild(apply=False)
+    result = {
+        "log": label,
+        "events": replay_events,
+        "read_events_per_second": round(read_events / read_seconds),
+        "replay_events_per_second": round(replay_events / replay_seconds),
+        "rebuild_seconds": rebuilt["seconds"],
+        "rebuild_events_per_second": round(rebuilt["events"] / rebuilt["seconds"]),
+        "consistent": not any(check["mismatches"].values())
+    }
+    print(f"{label:<9} {replay_events} событий: чтение {result['read_events_per_second']:>9} соб/с  "
+          f"воспроизведение {result['replay_events_per_second']:>9} соб/с  пересборка "
+          f"{result['rebuild_seconds']:>6} с ({result['rebuild_events_per_second']} соб/с)  "
+          f"{'OK' if result['consistent'] else 'РАСХОЖДЕНИЯ'}")
+    return result
+
+
+async def run(args) -> list:
+    tmp = tempfile.mkdtemp(prefix="riddle_events_")
+    database.DB_PATH = os.path.join(tmp, "events.db")
+    await database.init_db()
+    started = time.perf_counter()
+    generate(database.DB_PATH, args.events, args.users, args.riddles)
+    print(f"Журнал из {args.events} событий записан за {time.perf_counter() - started:.1f} с")
+
+    results = [await measure_state("tail")]
+    started = time.perf_counter()
+    segments = await database.seal_event_segments()
+    stats = await database.get_event_log_stats()
+    print(f"Упаковано {segments} сегментов за {time.perf_counter() - started:.1f} с: "
+          f"{stats['sealed_bytes'] / (1024 * 1024):.1f} МБ, в хвосте {stats['tail_events']} событий")
+    results.append(await measure_state("segments"))
+    results[-1]["seal_seconds"] = round(time.perf_counter() - started, 1)
+    results[-1]["segments_mb"] = round(stats["sealed_bytes"] / (1024 * 1024), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000, help="событий в журнале")
+    parser.add_argument("--users", type=int, default=100_000, help="пользователей")
+    parser.add_argument("--riddles", type=int, default=50_000, help="загадок")
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Память и скорость выгрузки таблиц в CSV (exports.py) в зависимости от размера таблицы
+
+Запуск из корня проекта:
+    python -m benchmarks.export_memory --attempts 100000 1000000 4000000
+
+Для каждого размера строится синтетическая база (benchmarks.db_scale.generate),
+затем таблица attempts выгружается в отдельном процессе, и в отчете - пиковая память
+этого процесса (VmHWM) и память до выгрузки, строк в секунду, число частей
+и их размер. Память не должна расти с размером таблицы. Проверка: строк во всех частях
+(без заголовков) столько же, сколько в таблице.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import database
+import exports
+from benchmarks.db_scale import generate
+
+
+def count_rows(paths: list) -> int:
+    total = 0
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8", newline="") as f:
+            total += sum(1 for _ in csv.reader(f)) - 1
+    return total
+
+
+def peak_rss_kb() -> int:
+    """Пиковая память процесса, КБ. ru_maxrss на Linux достается процессу от родителя
+    при fork (родитель строил базу), поэтому берется VmHWM, если он есть"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_export(args) -> dict:
+    """Одна выгрузка в этом процессе"""
+    database.DB_PATH = args.db
+    baseline_kb = peak_rss_kb()
+    result = asyncio.run(exports.export_table(
+        args.table, args.dir, args.format == "gz", args.part_mb
+    ))
+    peak_kb = peak_rss_kb()
+    return {
+        "rows": result["rows"],
+        "parts": len(result["parts"]),
+        "mb": round(result["bytes"] / (1024 * 1024), 1),
+        "seconds": result["seconds"],
+        "rows_per_second": round(result["rows"] / result["seconds"]),
+        "start_mb": round(baseline_kb / 1024, 1),
+        "peak_mb": round(peak_kb / 1024, 1),
+        "largest_part_mb": round(max(os.path.getsize(path) for path in result["parts"]) / (1024 * 1024), 1),
+        "paths": result["parts"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attempts", type=int, nargs="+", default=[100_000, 1_000_000, 4_000_000],
+                        help="размеры таблицы attempts")
+    parser.add_argument("--format", choices=exports.FORMATS, default="gz")
+    parser.add_argument("--part-mb", type=float, default=exports.EXPORT_PART_MB, help="размер части, МБ")
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--table", default="attempts", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.db:
+        # Одна выгрузка в этом процессе: пиковая память процесса - только ее
+        print(json.dumps(run_export(args), ensure_ascii=False))
+        return
+
+    results = []
+    for attempts in args.attempts:
+        tmp = tempfile.mkdtemp(prefix="riddle_export_")
+        try:
+            db_path = os.path.join(tmp, "export.db")
+            generate(db_path, users=10_000, attempts=attempts, riddles=1_000)
+            command = [sys.executable, "-m", "benchmarks.export_memory", "--db", db_path,
+                       "--dir", os.path.join(tmp, "out"), "--format", args.format, "--part-mb", str(args.part_mb)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result["consistent"] = count_rows(result.pop("paths")) == attempts == result["rows"]
+        finally:
+            shutil.rmtree(tmp)
+        results.append(result)
+        print(f"{attempts:>9} строк: {result['rows_per_second']:>7} строк/с  {result['seconds']:>6} с  "
+              f"частей {result['parts']} ({result['mb']} МБ, наибольшая {result['largest_part_mb']} МБ)  "
+              f"память {result['start_mb']} -> {result['peak_mb']} МБ  "
+              f"{'OK' if result['consistent'] else 'РАСХОЖДЕНИЕ'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Нагрузочный тест: p99 задержки ответа у обычных пользователей, пока один пользователь флудит
+
+Запуск из корня проекта:
+    python -m benchmarks.flood_latency --users 200 --flood 500
+
+Каждый "апдейт" проходит через user_locks.per_user и те же запросы к настоящей базе
+(временный файл SQLite с настройками database.init_db), что и обработчик ответа в боте:
+регистрация пользователя, проверка ответа, подсказка после ошибок, новая загадка после
+правильного ответа и таблица лидеров. Сравниваются последовательная обработка (как в
+python-telegram-bot по умолчанию) и конкурентная с блокировкой на пользователя.
+
+Ошибки обработчиков не прерывают прогон, а считаются; при конкурентной обработке их
+быть не должно (например, "database is locked" от параллельных записей) - тогда
+бенчмарк завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import database
+from user_locks import per_user
+
+
+def percentile(values, p):
+    """Перцентиль по отсортированной выборке"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def make_update(user_id: int, text: str):
+    """Минимальный объект апдейта, достаточный для per_user"""
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        text=text,
+        received_at=time.perf_counter()
+    )
+
+
+async def answer_handler(update, context):
+    """Обработчик ответа: запросы к базе в том же порядке, что и в bot.handle_message"""
+    user_id = update.effective_user.id
+    try:
+        await database.get_or_create_user(user_id, f"user{user_id}", "Bench")
+        result = await database.check_answer(user_id, update.text)
+        if result.get("is_correct"):
+            # Новая загадка, как send_riddle_to_user
+            riddle_id = context.riddle_ids[user_id % len(context.riddle_ids)]
+            await database.set_user_active_riddle(user_id, riddle_id)
+        elif result.get("wrong_attempts", 0) >= 3:
+            await database.get_hint(user_id)
+        if user_id % 10 == 0:
+            await database.get_leaderboard(limit=10)
+    except Exception as e:
+        context.errors[f"{e.__class__.__name__}: {e}"] += 1
+        return
+    context.latencies.setdefault(user_id, []).append(time.perf_counter() - update.received_at)
+
+
+async def prepare_db(users: int, flooder_id: int) -> list:
+    """Создать пользователей и выдать им активную загадку; вернуть id загадок"""
+    await database.init_db()
+    riddle_ids = [
+        await database.add_riddle(f"Какой цвет получается из красного и синего? ({n})", "Фиолетовый", "Вторичный")
+        for n in range(10)
+    ]
+    for user_id in list(range(1, users + 1)) + [flooder_id]:
+        await database.get_or_create_user(user_id, f"user{user_id}", "Bench")
+        await database.set_user_active_riddle(user_id, riddle_ids[user_id % len(riddle_ids)])
+    return riddle_ids
+
+
+async def run(mode: str, users: int, flood: int, concurrency: int):
+    """Прогнать один сценарий и вернуть задержки обычных пользователей"""
+    flooder_id = 10 ** 9
+    riddle_ids = await prepare_db(users, flooder_id)
+
+    context = SimpleNamespace(latencies={}, errors=Counter(), riddle_ids=riddle_ids)
+    handler = per_user(answer_handler)
+
+    # Флудер отправляет всю пачку первым, обычные пользователи - следом: у каждого
+    # несколько ошибок (подсказка) и правильный ответ (новая загадка)
+    updates = [make_update(flooder_id, "зеленый") for _ in range(flood)]
+    for answer in ("зеленый", "желтый", "синий", "фиолетовый"):
+        updates += [make_update(user_id, answer) for user_id in range(1, users + 1)]
+
+    started = time.perf_counter()
+    if mode == "sequential":
+        for update in updates:
+            await handler(update, context)
+    else:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def process(update):
+            async with semaphore:
+                await handler(update, context)
+
+        await asyncio.gather(*(process(update) for update in updates))
+    elapsed = time.perf_counter() - started
+
+    others = [lat for uid, lats in context.latencies.items() if uid != flooder_id for lat in lats]
+    return elapsed, others, context.errors
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="обычных пользователей")
+    parser.add_argument("--flood", type=int, default=500, help="сообщений от флудера")
+    parser.add_argument("--concurrency", type=int, default=64, help="лимит конкурентных апдейтов")
+    args = parser.parse_args()
+
+    failed = 0
+    for mode in ("sequential", "concurrent"):
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DB_PATH = os.path.join(tmp, "bench.db")
+            elapsed, latencies, errors = await run(mode, args.users, args.flood, args.concurrency)
+        failed += sum(errors.values())
+        print(
+            f"{mode:>10}: всего {elapsed:.2f}s | обычные пользователи: "
+            f"p50={statistics.median(latencies) * 1000:.1f}ms "
+            f"p95={percentile(latencies, 95) * 1000:.1f}ms "
+            f"p99={percentile(latencies, 99) * 1000:.1f}ms | ошибок {sum(errors.values())}"
+        )
+        for error, count in errors.most_common(5):
+            print(f"{'':>12}{count} x {error}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
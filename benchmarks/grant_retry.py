@@ -0,0 +1,119 @@
+"""
+Проверка дообработки грантов (grant_pipeline.py): неудачная отправка и пустой пул промокодов
+
+Запуск из корня проекта:
+    python -m benchmarks.grant_retry
+
+На временной базе три лидера недели, неделя закрыта сбросом рейтинга. Первый запуск
+задачи выдачи (через job_runs.tracked,
+как в планировщике) идет при пустом пуле, который не удается пополнить (в пуле только
+--codes кодов), и с ботом, у которого первая отправка одному из победителей падает с
+NetworkError. Ожидается: запуск завершается GrantsPending, слот в job_runs - failed.
+Второй запуск (пул пополняется, отправки проходят) должен дообработать все гранты:
+у каждого победителя промокод и notified_at, слот - done, каждому ушло ровно одно сообщение.
+Код возврата 1, если что-то из этого не так.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from collections import Counter
+
+from apscheduler.triggers.cron import CronTrigger
+from telegram.error import NetworkError
+
+import database
+import grant_pipeline
+import job_runs
+import promo_pool
+
+
+class FlakyBot:
+    """Бот, у которого первая отправка пользователю fail_user падает"""
+
+    def __init__(self, fail_user: int):
+        self.fail_user = fail_user
+        self.failed = False
+        self.delivered = Counter()
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if chat_id == self.fail_user and not self.failed:
+            self.failed = True
+            raise NetworkError("соединение сброшено")
+        self.delivered[chat_id] += 1
+        return True
+
+
+async def prepare(users: int, codes: int):
+    await database.init_db()
+    async with database.connect() as db:
+        for user_id in range(1, users + 1):
+            await db.execute(
+                "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+                (user_id, f"user{user_id}", "Bench")
+            )
+            await db.execute(database.CHANGE_RATING_SQL, {"user_id": user_id, "delta": 100 * user_id})
+        await db.commit()
+    await database.add_promo_codes([f"RETRY{n:04d}" for n in range(codes)])
+    # Закрытие недели (как сброс рейтинга в понедельник): снимок итогов - вход выдачи
+    await database.reset_weekly_ratings()
+
+
+async def run_job(job, bot) -> str:
+    try:
+        await job(bot)
+    except grant_pipeline.GrantsPending as e:
+        return f"GrantsPending: {e}"
+    return "ok"
+
+
+async def main(args) -> bool:
+    await prepare(args.users, args.codes)
+    trigger = CronTrigger(day_of_week="mon", hour=0, minute=5)
+    job = job_runs.tracked("weekly_grant_distribution", trigger)(grant_pipeline.run_weekly_grants)
+    slot = job_runs.slot_key(trigger)
+    # Коды из пула достаются победителям по порядку мест: у лидера (fail_user) код будет,
+    # но первая отправка ему упадет; последнему месту кода не хватит
+    bot = FlakyBot(fail_user=args.users)
+
+    refill = promo_pool.refill
+
+    async def refill_fails(target: int = promo_pool.POOL_SIZE) -> int:
+        return 0
+
+    promo_pool.refill = refill_fails
+    first = await run_job(job, bot)
+    first_status = await database.is_job_run_done("weekly_grant_distribution", slot)
+    first_pending = await database.get_pending_grants()
+    print(f"запуск 1: {first}; слот выполнен: {first_status}; незавершенных грантов: {len(first_pending)}")
+
+    promo_pool.refill = refill
+    second = await run_job(job, bot)
+    second_status = await database.is_job_run_done("weekly_grant_distribution", slot)
+    grants = await database.get_week_grants(await database.get_closed_week())
+    print(f"запуск 2: {second}; слот выполнен: {second_status}; незавершенных грантов: "
+          f"{len([g for g in grants if not g['promo_code'] or not g['notified_at']])}")
+    for grant in grants:
+        print(f"  пользователь {grant['user_id']}: промокод {grant['promo_code']}, "
+              f"уведомлен {grant['notified_at'] is not None}, сообщений {bot.delivered[grant['user_id']]}")
+
+    return (
+        first.startswith("GrantsPending") and not first_status
+        and second == "ok" and second_status
+        and len(grants) == args.users
+        and all(grant["promo_code"] and grant["notified_at"] for grant in grants)
+        and all(bot.delivered[grant["user_id"]] == 1 for grant in grants)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=3, help="победителей")
+    parser.add_argument("--codes", type=int, default=2, help="кодов в пуле при первом запуске")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "grant_retry.db")
+        ok = asyncio.run(main(args))
+    print("OK" if ok else "ОШИБКА: гранты не дообработаны")
+    sys.exit(0 if ok else 1)
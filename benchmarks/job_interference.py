@@ -0,0 +1,192 @@
+"""
+Задержка ответов пользователям, пока идет массовая задача планировщика: задача в том же
+процессе (RUN_MODE=all) и в отдельном процессе (RUN_MODE=bot + RUN_MODE=scheduler)
+
+Запуск из корня проекта:
+    python -m benchmarks.job_interference --users 300 --job-users 5000 --rate 200
+
+Фоновая задача - рассылка напоминаний (bot.send_riddles_to_users) --job-users
+пользователям с активной загадкой. Режимы:
+- none - задачи нет (базовая линия);
+- inline - задача в event loop бота, как при RUN_MODE=all;
+- process - задача в отдельном процессе с той же базой, как при RUN_MODE=scheduler.
+Каждый режим - отдельный запуск с чистой базой. --rate поднимает лимит sender, чтобы задача
+нагружала бота сильнее, чем настоящая рассылка. Отдельный процесс выигрывает, только если
+у него есть свое ядро: на одном ядре он отнимает процессор у бота так же, как задача в loop.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from benchmarks.load_test import BOT_TOKEN, FakeBotApi, percentile, synthetic_user
+
+MODES = ("none", "inline", "process")
+REMINDER_PREFIX = "⏰"
+
+
+class JobAwareBotApi(FakeBotApi):
+    """Заглушка Bot API, которая не засчитывает напоминания как ответы пользователям"""
+
+    def __init__(self):
+        super().__init__()
+        self.reminders = 0
+
+    async def _call(self, method: str, params: dict):
+        if method == "sendMessage" and params.get("text", "").startswith(REMINDER_PREFIX):
+            self.reminders += 1
+            return {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params["text"]
+            }
+        return await super()._call(method, params)
+
+
+def seed_job_users(db_path: str, count: int, riddle_ids: list):
+    """Пользователи, которым задача отправит напоминание (id 1..count, не пересекаются с нагрузкой)"""
+    with sqlite3.connect(db_path) as db:
+        db.executemany(
+            "INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+            ((user_id, f"job{user_id}", f"Job{user_id}") for user_id in range(1, count + 1))
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO user_active_riddles (user_id, riddle_id) VALUES (?, ?)",
+            ((user_id, riddle_ids[user_id % len(riddle_ids)]) for user_id in range(1, count + 1))
+        )
+
+
+def job_process(rate: float):
+    """Отдельный процесс задач (как RUN_MODE=scheduler): та же база, свой Bot"""
+    asyncio.run(_run_job(rate))
+
+
+async def _run_job(rate: float):
+    import bot
+    import sender
+    sender.MESSAGES_PER_SECOND = rate
+    application = bot.build_application(run_jobs=False)
+    await application.initialize()
+    await bot.send_riddles_to_users(SimpleNamespace(bot=application.bot))
+    await application.shutdown()
+
+
+async def run(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="riddle_jobs_")
+    os.environ["BOT_TOKEN"] = BOT_TOKEN
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["DB_PATH"] = os.path.join(tmp, "jobs.db")
+    os.environ["LOG_LEVEL"] = "WARNING"
+
+    api = JobAwareBotApi()
+    os.environ["TELEGRAM_API_URL"] = await api.start()
+
+    import logging
+    import bot
+    import database
+    import riddle_generator
+    import sender
+    logging.getLogger().setLevel(logging.WARNING)
+    sender.MESSAGES_PER_SECOND = args.rate
+
+    await database.init_db()
+    await database.add_riddles(riddle_generator.get_catalog())
+    with sqlite3.connect(database.DB_PATH) as db:
+        riddle_ids = [row[0] for row in db.execute("SELECT id FROM riddles")]
+    seed_job_users(database.DB_PATH, args.job_users, riddle_ids)
+
+    application = bot.build_application(run_jobs=False)
+    await application.initialize()
+    await application.post_init(application)
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+    await application.start()
+
+    job_started = time.perf_counter()
+    job_task = process = None
+    if args.mode == "inline":
+        job_task = asyncio.create_task(bot.send_riddles_to_users(application))
+    elif args.mode == "process":
+        process = multiprocessing.get_context("spawn").Process(target=job_process, args=(args.rate,))
+        process.start()
+
+    answers = {riddle["question"]: riddle["answer"] for riddle in riddle_generator.get_catalog()}
+    latencies, timeouts = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        synthetic_user(api, 10_000_000 + i, args.actions, answers, 0.6, latencies, timeouts, 30.0)
+        for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - started
+    reminders_during_load = api.reminders
+
+    if job_task is not None:
+        await job_task
+    if process is not None:
+        await asyncio.to_thread(process.join)
+    job_seconds = time.perf_counter() - job_started
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+    return {
+        "mode": args.mode,
+        "updates": len(latencies) + len(timeouts),
+        "timeouts": len(timeouts),
+        "updates_per_second": round((len(latencies) + len(timeouts)) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies, default=0) * 1000, 1)
+        },
+        "reminders_during_load": reminders_during_load,
+        "reminders": api.reminders,
+        "job_seconds": round(job_seconds, 1) if args.mode != "none" else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="какие режимы сравнить")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--users", type=int, default=300, help="синтетических пользователей")
+    parser.add_argument("--actions", type=int, default=10, help="действий на пользователя после /start")
+    parser.add_argument("--job-users", type=int, default=5000, help="получателей напоминаний")
+    parser.add_argument("--rate", type=float, default=200, help="лимит sender, сообщений в секунду")
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    if args.mode:
+        # Один режим в этом процессе: у бота глобальное состояние (планировщик, метрики)
+        print(json.dumps(asyncio.run(run(args)), ensure_ascii=False))
+        return
+
+    results = []
+    for mode in args.modes:
+        command = [sys.executable, "-m", "benchmarks.job_interference", "--mode", mode,
+                   "--users", str(args.users), "--actions", str(args.actions),
+                   "--job-users", str(args.job_users), "--rate", str(args.rate)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        latency = result["latency_ms"]
+        print(f"{mode:<8} p50 {latency['p50']:>7} мс  p95 {latency['p95']:>7} мс  p99 {latency['p99']:>7} мс  "
+              f"{result['updates_per_second']:>6} апдейтов/с  напоминаний во время нагрузки "
+              f"{result['reminders_during_load']}, задача {result['job_seconds']} с")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
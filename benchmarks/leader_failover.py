@@ -0,0 +1,202 @@
+"""
+Переход задач планировщика к другой реплике, когда ведущая останавливается посреди задачи
+
+Запуск из корня проекта:
+    python -m benchmarks.leader_failover --replicas 3 --ttl 2 --renew 0.5
+
+Запускаются --replicas процессов с leader.LeaderElection над одной базой. Ведущий
+выполняет "задачу" - шаги по --step секунд, перед каждым шагом проверяя holds_lease(),
+и пишет каждый шаг в общий журнал. Посреди задачи ведущего останавливают:
+- kill - SIGKILL (падение): аренду заберут после истечения, не дольше ttl + renew;
+- term - SIGTERM (штатная остановка): аренда отпускается сразу, переход - не дольше renew;
+- stop - SIGSTOP на время больше ttl, затем SIGCONT (зависание): после пробуждения
+  бывший ведущий не должен сделать ни одного шага.
+
+Проверки: шаги двух реплик не пересекаются (номер срока аренды в журнале шагов
+не убывает) и время перехода укладывается в границу. Код выхода 1 - проверка не прошла.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+
+MODES = ("kill", "term", "stop")
+# Запас на старт процесса и планирование ОС при проверке времени перехода (секунды)
+SLACK = 1.0
+
+
+def replica_main(db_path: str, journal: str, ttl: float, renew: float, step: float):
+    """Процесс-реплика: выбор ведущего и задача из шагов"""
+    os.environ["DB_PATH"] = db_path
+    asyncio.run(_replica(journal, ttl, renew, step))
+
+
+async def _replica(journal: str, ttl: float, renew: float, step: float):
+    import database
+    import leader
+
+    await database.init_db()
+    job = None
+
+    def write(event: str, term):
+        with open(journal, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"t": time.time(), "pid": os.getpid(), "term": term, "event": event}) + "\n")
+
+    async def run_job():
+        while True:
+            if not election.holds_lease():
+                write("fenced", election.term)
+                return
+            write("step", election.term)
+            await asyncio.sleep(step)
+
+    def on_elected():
+        nonlocal job
+        write("elected", election.term)
+        job = asyncio.create_task(run_job())
+
+    def on_lost():
+        if job is not None:
+            job.cancel()
+        write("lost", election.term)
+
+    election = leader.LeaderElection(
+        "failover_test", on_elected=on_elected, on_lost=on_lost, ttl=ttl, renew_interval=renew
+    )
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(election.stop()))
+    await election.start()
+
+
+def read_journal(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def wait_for(predicate, timeout: float, journal: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        events = read_journal(journal)
+        found = predicate(events)
+        if found:
+            return found
+        time.sleep(0.02)
+    return None
+
+
+def current_leader_step(events: list, exclude=()):
+    """Последний шаг задачи реплики, которой нет в exclude"""
+    steps = [event for event in events if event["event"] == "step" and event["pid"] not in exclude]
+    return steps[-1] if steps else None
+
+
+def check_order(events: list) -> list:
+    """Нарушения: шаг со сроком аренды меньше, чем у уже сделанного шага другой реплики"""
+    violations, max_term = [], 0
+    for event in sorted((e for e in events if e["event"] == "step"), key=lambda e: e["t"]):
+        if event["term"] < max_term:
+            violations.append(event)
+        max_term = max(max_term, event["term"])
+    return violations
+
+
+def run_mode(mode: str, args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="riddle_leader_")
+    db_path, journal = os.path.join(tmp, "leader.db"), os.path.join(tmp, "journal.jsonl")
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    for _ in range(args.replicas):
+        process = context.Process(target=replica_main, args=(db_path, journal, args.ttl, args.renew, args.step))
+        process.start()
+        processes[process.pid] = process
+
+    bound = {"kill": args.ttl + args.renew, "term": args.renew, "stop": args.ttl + args.renew}[mode] + SLACK
+    failovers, stopped, removed = [], [], set()
+    try:
+        for _ in range(args.replicas - 1):
+            step = wait_for(lambda events: current_leader_step(events, removed), args.ttl * 5 + 10, journal)
+            if step is None:
+                raise RuntimeError("Ни одна реплика не стала ведущей")
+            leader_pid = step["pid"]
+            # Останавливаем посреди задачи: между шагами
+            time.sleep(args.step / 2)
+            stopped_at = time.time()
+            if mode == "kill":
+                os.kill(leader_pid, signal.SIGKILL)
+            elif mode == "term":
+                os.kill(leader_pid, signal.SIGTERM)
+            else:
+                os.kill(leader_pid, signal.SIGSTOP)
+                stopped.append(leader_pid)
+            removed.add(leader_pid)
+
+            next_step = wait_for(
+                lambda events: next((e for e in events if e["event"] == "step" and e["pid"] not in removed
+                                     and e["t"] > stopped_at), None),
+                bound + 10, journal
+            )
+            if next_step is None:
+                raise RuntimeError("Задачи не перешли к другой реплике")
+            failovers.append(round(next_step["t"] - stopped_at, 2))
+
+            if mode == "stop":
+                # Пробуждаем замороженного ведущего, когда его аренда уже у другой реплики
+                time.sleep(max(0.0, stopped_at + args.ttl + args.renew - time.time()))
+                os.kill(leader_pid, signal.SIGCONT)
+                time.sleep(args.renew * 2 + args.step)
+    finally:
+        for pid in stopped:
+            try:
+                os.kill(pid, signal.SIGCONT)
+            except ProcessLookupError:
+                pass
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join(10)
+
+    events = read_journal(journal)
+    violations = check_order(events)
+    return {
+        "mode": mode,
+        "failover_seconds": failovers,
+        "bound_seconds": round(bound, 2),
+        "steps": sum(1 for event in events if event["event"] == "step"),
+        "fenced": sum(1 for event in events if event["event"] == "fenced"),
+        "overlaps": len(violations),
+        "ok": not violations and all(seconds <= bound for seconds in failovers)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="как останавливать ведущего")
+    parser.add_argument("--replicas", type=int, default=3, help="число реплик")
+    parser.add_argument("--ttl", type=float, default=2.0, help="срок аренды, с")
+    parser.add_argument("--renew", type=float, default=0.5, help="интервал продления, с")
+    parser.add_argument("--step", type=float, default=0.2, help="длительность шага задачи, с")
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        result = run_mode(mode, args)
+        results.append(result)
+        print(f"{mode:<5} переход: {result['failover_seconds']} с (граница {result['bound_seconds']} с), "
+              f"шагов {result['steps']}, остановлено проверкой аренды {result['fenced']}, "
+              f"пересечений {result['overlaps']} - {'OK' if result['ok'] else 'ОШИБКА'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if all(result["ok"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
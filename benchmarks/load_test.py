@@ -0,0 +1,317 @@
+"""
+Сквозной нагрузочный тест: настоящее приложение из bot.build_application против
+локального поддельного Bot API
+
+Запуск из корня проекта:
+    python -m benchmarks.load_test --users 1000 --actions 10 --json report.json
+
+Поддельный сервер отдает апдейты через getUpdates (long polling) и принимает
+sendMessage/answerCallbackQuery. Синтетические пользователи делают /start, отвечают
+на загадки (часть ответов правильные), просят подсказку inline-кнопкой и жмут
+"Лидерборд". Задержка - от появления апдейта в getUpdates до первого sendMessage
+этому пользователю.
+
+Отчет: пропускная способность, p50/p95/p99 задержки, рост размера БД и RSS процесса.
+С --workers N бот работает как в проде при WORKERS=N: фронт в этом процессе, N воркеров
+в отдельных процессах (shards.py); RSS - сумма по фронту и воркерам.
+Режим webhook не поддерживается: он требует python-telegram-bot[webhooks].
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+BOT_TOKEN = "123456:LOADTEST"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def rss_mb(pid="self") -> float:
+    """Текущий RSS процесса (Linux), иначе пиковый"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def db_size_mb(path: str) -> float:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)) / (1024 * 1024)
+
+
+class FakeBotApi:
+    """Минимальный Bot API: очередь апдейтов для getUpdates и прием исходящих сообщений"""
+
+    def __init__(self):
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.new_updates = asyncio.Event()
+        # chat_id -> (время появления апдейта, future первого ответа)
+        self.waiting = {}
+        # chat_id -> текст последнего сообщения бота
+        self.last_text = {}
+        self.sent = 0
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/bot"
+
+    async def stop(self):
+        # Отпускаем висящий long polling, чтобы сервер закрылся без ожидания таймаута
+        self.new_updates.set()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def push(self, chat_id: int, payload: dict) -> asyncio.Future:
+        """Поставить апдейт в очередь; future завершится при первом ответе бота в этот чат"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[chat_id] = (time.perf_counter(), future)
+        self.updates.append({"update_id": next(self.update_ids), **payload})
+        self.new_updates.set()
+        return future
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                method = request_line.decode("latin-1").split()[1].rsplit("/", 1)[-1]
+                result = await self._call(method, self._parse(body, headers.get("content-type", "")))
+                data = json.dumps({"ok": True, "result": result}).encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse(body: bytes, content_type: str) -> dict:
+        if not body:
+            return {}
+        if "json" in content_type:
+            return json.loads(body)
+        return {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+    async def _call(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "load_test_bot"}
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            self.sent += 1
+            self.last_text[chat_id] = params.get("text", "")
+            waiting = self.waiting.pop(chat_id, None)
+            if waiting and not waiting[1].done():
+                waiting[1].set_result(time.perf_counter() - waiting[0])
+            return {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", "")
+            }
+        # answerCallbackQuery, deleteWebhook и прочее
+        return True
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:100]
+
+
+def message_update(user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+    message = {
+        "message_id": user_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user,
+        "text": text
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"message": message}
+
+
+def callback_update(user_id: int, data: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+    return {
+        "callback_query": {
+            "id": f"{user_id}-{time.perf_counter_ns()}",
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {"message_id": 1, "date": int(time.time()), "chat": {"id": user_id, "type": "private"}}
+        }
+    }
+
+
+async def synthetic_user(api: FakeBotApi, user_id: int, actions: int, answers: dict,
+                         correct_rate: float, latencies: list, timeouts: list, reply_timeout: float):
+    """Сценарий одного пользователя: /start, затем ответы, подсказки и лидерборд"""
+    import router
+
+    async def act(payload):
+        try:
+            latencies.append(await asyncio.wait_for(api.push(user_id, payload), reply_timeout))
+        except asyncio.TimeoutError:
+            timeouts.append(user_id)
+        # Пауза "на подумать" - заодно дает боту дослать остальные сообщения ответа
+        await asyncio.sleep(random.uniform(0.2, 1.0))
+
+    await asyncio.sleep(random.uniform(0, 2))
+    await act(message_update(user_id, "/start"))
+    for _ in range(actions):
+        roll = random.random()
+        if roll < 0.1:
+            await act(message_update(user_id, router.BTN_LEADERBOARD))
+        elif roll < 0.2:
+            await act(callback_update(user_id, router.encode_callback("hint")))
+        else:
+            text = api.last_text.get(user_id, "")
+            answer = next((a for q, a in answers.items() if q in text), None)
+            if answer is None or random.random() > correct_rate:
+                answer = random.choice(["не знаю", "синий", "кернинг", "Helvetica"])
+            await act(message_update(user_id, answer))
+
+
+async def run(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="riddle_load_")
+    os.environ["BOT_TOKEN"] = BOT_TOKEN
+    os.environ.setdefault("METRICS_PORT", "0")
+
+    api = FakeBotApi()
+    os.environ["TELEGRAM_API_URL"] = await api.start()
+
+    # Воркеры - отдельные процессы, настройки им передаются через окружение
+    os.environ["DB_PATH"] = os.path.join(tmp, "load.db")
+    os.environ["LOG_LEVEL"] = args.log_level
+
+    import bot
+    import database
+    import riddle_generator
+    import shards
+    # Логи бота на каждый апдейт заглушили бы отчет
+    logging.getLogger().setLevel(args.log_level)
+
+    front = application = None
+    if args.workers > 1:
+        front = shards.Front(args.workers)
+        await front.start()
+        front_task = asyncio.create_task(front.run())
+    else:
+        application = bot.build_application()
+        await application.initialize()
+        await application.post_init(application)
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        await application.start()
+
+    def total_rss() -> float:
+        pids = [process.pid for process in front.processes] if front else []
+        return rss_mb() + sum(rss_mb(pid) for pid in pids)
+
+    db_before, rss_before = db_size_mb(database.DB_PATH), total_rss()
+    answers = {riddle["question"]: riddle["answer"] for riddle in riddle_generator.get_catalog()}
+    latencies, timeouts = [], []
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        synthetic_user(api, 10_000 + i, args.actions, answers, args.correct_rate,
+                       latencies, timeouts, args.reply_timeout)
+        for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "workers": args.workers,
+        "users": args.users,
+        "updates": len(latencies) + len(timeouts),
+        "replies": api.sent,
+        "timeouts": len(timeouts),
+        "seconds": round(elapsed, 2),
+        "updates_per_second": round((len(latencies) + len(timeouts)) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies, default=0) * 1000, 1)
+        },
+        "db_mb": {"before": round(db_before, 2), "after": round(db_size_mb(database.DB_PATH), 2)},
+        "rss_mb": {"before": round(rss_before, 1), "after": round(total_rss(), 1)}
+    }
+
+    if front is not None:
+        front_task.cancel()
+        await asyncio.gather(front_task, return_exceptions=True)
+        await front.stop()
+    else:
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+        await application.shutdown()
+    await api.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="синтетических пользователей")
+    parser.add_argument("--actions", type=int, default=10, help="действий на пользователя после /start")
+    parser.add_argument("--correct-rate", type=float, default=0.6, help="доля правильных ответов")
+    parser.add_argument("--reply-timeout", type=float, default=30.0, help="сколько ждать ответа бота, с")
+    parser.add_argument("--workers", type=int, default=1, help="процессов-воркеров (как WORKERS у бота)")
+    parser.add_argument("--json", help="куда сохранить отчет в JSON")
+    parser.add_argument("--log-level", default="WARNING", help="уровень логов бота во время теста")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Стоимость логирования на один апдейт в event loop: было (basicConfig, запись в поток
+прямо в обработчике, f-строки на INFO) и стало (QueueHandler/QueueListener, ленивое
+форматирование, подробности ответа на DEBUG с выборкой)
+
+Запуск из корня проекта:
+    python -m benchmarks.logging_cost --updates 20000 --write-latency-ms 0.05
+
+Один апдейт - ответ на загадку с теми же вызовами логгера, что в handle_message,
+database.check_answer и send_riddle_to_user, плюс строки httpx на запросы к Bot API.
+Вывод идет в поток, каждая запись в который "блокируется" на --write-latency-ms
+(stderr в pipe сборщика логов, медленный диск). Время меряется в вызывающем потоке,
+то есть это время, на которое логирование занимает event loop.
+"""
+import argparse
+import io
+import json
+import logging
+import time
+
+import logging_setup
+
+ANSWER = "кернинг между буквами"
+CORRECT = "кернинг"
+
+
+class SlowStream(io.TextIOBase):
+    """Поток, запись в который занимает заданное время"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        if self.latency:
+            deadline = time.perf_counter() + self.latency
+            while time.perf_counter() < deadline:
+                pass
+        self.lines += text.count("\n")
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def update_before(user_id: int, riddle_id: int):
+    """Вызовы логгера на один ответ до переделки"""
+    bot_log = logging.getLogger("bot")
+    db_log = logging.getLogger("database")
+    http_log = logging.getLogger("httpx")
+    bot_log.info(f"[СООБЩЕНИЕ] Пользователь {user_id} отправил: '{ANSWER}'")
+    bot_log.info(f"[ОТВЕТ] Пользователь {user_id} отправил ответ: '{ANSWER}'")
+    db_log.info(f"[ПРОВЕРКА ОТВЕТА] User ID: {user_id}, Riddle ID: {riddle_id}")
+    db_log.info(f"[ПРОВЕРКА ОТВЕТА] Ответ пользователя (raw): '{ANSWER}' -> (clean): '{ANSWER}'")
+    db_log.info(f"[ПРОВЕРКА ОТВЕТА] Правильный ответ (raw): '{CORRECT}' -> (clean): '{CORRECT}'")
+    db_log.info(f"[ПРОВЕРКА ОТВЕТА] Результат: {True}")
+    http_log.info('HTTP Request: POST http://127.0.0.1/bot123/sendMessage "HTTP/1.1 200 OK"')
+    bot_log.info(f"[ПРАВИЛЬНЫЙ ОТВЕТ] Генерация и отправка новой уникальной загадки пользователю {user_id}")
+    bot_log.info(f"[НОВАЯ ЗАГАДКА] Генерация новой загадки для пользователя {user_id}")
+    bot_log.info(f"Используем существующую загадку #{riddle_id} для пользователя {user_id}")
+    bot_log.info(f"Установлена активная загадка #{riddle_id} для пользователя {user_id}")
+    http_log.info('HTTP Request: POST http://127.0.0.1/bot123/sendMessage "HTTP/1.1 200 OK"')
+    bot_log.info(f"Загадка отправлена пользователю {user_id}")
+    bot_log.info(f"[УСПЕХ] Новая уникальная загадка отправлена пользователю {user_id}")
+
+
+def update_after(user_id: int, riddle_id: int):
+    """Вызовы логгера на один ответ после переделки"""
+    bot_log = logging.getLogger("bot")
+    db_log = logging.getLogger("database")
+    http_log = logging.getLogger("httpx")
+    answer_log = logging.getLogger(logging_setup.ANSWER_LOGGER)
+    answer_log.debug("[СООБЩЕНИЕ] Пользователь %s отправил: %r", user_id, ANSWER)
+    answer_log.debug(
+        "[ПРОВЕРКА ОТВЕТА] User ID: %s, Riddle ID: %s, ответ: %r, правильный: %r, результат: %s",
+        user_id, riddle_id, ANSWER, CORRECT, True
+    )
+    http_log.info('HTTP Request: POST http://127.0.0.1/bot123/sendMessage "HTTP/1.1 200 OK"')
+    bot_log.debug("[ПРАВИЛЬНЫЙ ОТВЕТ] Генерация и отправка новой уникальной загадки пользователю %s", user_id)
+    bot_log.debug("[НОВАЯ ЗАГАДКА] Генерация новой загадки для пользователя %s", user_id)
+    bot_log.debug("Используем существующую загадку #%s для пользователя %s", riddle_id, user_id)
+    db_log.debug("Установлена активная загадка #%s для пользователя %s", riddle_id, user_id)
+    http_log.info('HTTP Request: POST http://127.0.0.1/bot123/sendMessage "HTTP/1.1 200 OK"')
+    bot_log.info("Загадка #%s отправлена пользователю %s", riddle_id, user_id)
+
+
+def setup_before(stream):
+    logging_setup.stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    logging.getLogger("httpx").setLevel(logging.NOTSET)
+    logging.basicConfig(format=logging_setup.TEXT_FORMAT, level=logging.INFO, stream=stream)
+
+
+def measure(name: str, update, updates: int, stream: SlowStream) -> dict:
+    started = time.perf_counter()
+    for i in range(updates):
+        update(10_000 + i, i % 500)
+    elapsed = time.perf_counter() - started
+    # Дожидаемся, пока поток логирования допишет очередь (во время апдейта это не входит)
+    logging_setup.stop_logging()
+    return {
+        "scenario": name,
+        "us_per_update": round(elapsed / updates * 1e6, 2),
+        "lines_per_update": round(stream.lines / updates, 2)
+    }
+
+
+def run(args) -> list:
+    latency = args.write_latency_ms / 1000
+    results = []
+
+    stream = SlowStream(latency)
+    setup_before(stream)
+    results.append(measure("было: basicConfig, INFO", update_before, args.updates, stream))
+
+    for fmt in ("text", "json"):
+        stream = SlowStream(latency)
+        logging_setup.setup_logging("INFO", fmt, stream=stream)
+        results.append(measure(f"стало: очередь, INFO, {fmt}", update_after, args.updates, stream))
+
+    stream = SlowStream(latency)
+    logging_setup.setup_logging("DEBUG", "text", answer_sample_rate=args.sample_rate, stream=stream)
+    results.append(measure(
+        f"стало: очередь, DEBUG, выборка ответов {args.sample_rate}", update_after, args.updates, stream
+    ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000, help="сколько апдейтов сымитировать")
+    parser.add_argument("--write-latency-ms", type=float, default=0.05, help="время одной записи в поток вывода")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="доля DEBUG-записей о каждом ответе")
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+    for result in results:
+        print(f"{result['scenario']:<45} {result['us_per_update']:>9.2f} мкс/апдейт  "
+              f"{result['lines_per_update']:>5.2f} строк/апдейт")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Загрузка и перезагрузка паков загадок (riddle_packs.py) на большом паке
+
+Запуск из корня проекта:
+    python -m benchmarks.pack_load --riddles 100000
+
+Генерируется пак из --riddles загадок в каждом формате (jsonl, json, yaml - если есть
+PyYAML), и для каждого в отдельном процессе меряется:
+- холодная загрузка: разбор файла и сборка каталога, пиковая память процесса (VmHWM);
+- повторная проверка без изменений: только stat файлов;
+- файл перезаписан тем же содержимым (mtime другой): хэш файла без разбора;
+- исправлен ответ одной загадки: хэш, разбор, сборка каталога и diff со старым.
+Проверка: в каталоге столько загадок, сколько сгенерировано, а diff правки - одна
+измененная загадка.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import riddle_packs
+from benchmarks.export_memory import peak_rss_kb
+
+
+def write_pack(directory: str, fmt: str, riddles: int, edited: bool = False) -> str:
+    """Синтетический пак; edited - у загадки 0 другой ответ"""
+    items = (
+        {
+            "question": f"Загадка номер {i}: что это за шрифт?",
+            "answer": "Другой" if edited and i == 0 else f"Шрифт {i}",
+            "hint": f"Подсказка {i}" if i % 2 else None
+        }
+        for i in range(riddles)
+    )
+    header = {"pack": "bench", "version": 2 if edited else 1}
+    path = os.path.join(directory, f"bench.{fmt}")
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "jsonl":
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        elif fmt == "json":
+            json.dump({**header, "riddles": list(items)}, f, ensure_ascii=False)
+        else:
+            dumper = getattr(riddle_packs.yaml, "CSafeDumper", riddle_packs.yaml.SafeDumper)
+            riddle_packs.yaml.dump({**header, "riddles": list(items)}, f, Dumper=dumper, allow_unicode=True)
+    return path
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def run_format(args) -> dict:
+    """Все замеры для одного формата в этом процессе"""
+    directory = args.dir
+    baseline_kb = peak_rss_kb()
+    files, parse_seconds = timed(riddle_packs.load_files, directory)
+    catalog, build_seconds = timed(riddle_packs.Catalog, files)
+    peak_kb = peak_rss_kb()
+
+    rescan, rescan_seconds = timed(riddle_packs.load_files, directory, files)
+    path = next(iter(files))
+    os.utime(path)
+    touched, touch_seconds = timed(riddle_packs.load_files, directory, rescan)
+
+    write_pack(directory, args.format, args.riddles, edited=True)
+    started = time.perf_counter()
+    edited_files = riddle_packs.load_files(directory, touched)
+    edited_catalog = riddle_packs.Catalog(edited_files)
+    changes = riddle_packs.diff(catalog, edited_catalog)
+    edit_seconds = round(time.perf_counter() - started, 3)
+
+    return {
+        "format": args.format,
+        "riddles": len(catalog.riddles),
+        "file_mb": round(os.path.getsize(path) / (1024 * 1024), 1),
+        "cold_seconds": round(parse_seconds + build_seconds, 3),
+        "parse_seconds": round(parse_seconds, 3),
+        "build_seconds": round(build_seconds, 3),
+        "start_mb": round(baseline_kb / 1024, 1),
+        "peak_mb": round(peak_kb / 1024, 1),
+        "rescan_ms": round(rescan_seconds * 1000, 3),
+        "touch_seconds": round(touch_seconds, 3),
+        "edit_seconds": edit_seconds,
+        "consistent": (
+            len(catalog.riddles) == args.riddles
+            and rescan[path] is files[path] and touched[path] is files[path]
+            and len(changes["edited"]) == 1 and not changes["added"] and not changes["removed"]
+        )
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--riddles", type=int, default=100_000, help="загадок в паке")
+    parser.add_argument("--formats", nargs="+", default=["jsonl", "json", "yaml"])
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--format", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.dir:
+        print(json.dumps(run_format(args), ensure_ascii=False))
+        return
+
+    results = []
+    for fmt in args.formats:
+        if fmt in ("yaml", "yml") and riddle_packs.yaml is None:
+            print(f"{fmt}: PyYAML не установлен, пропуск")
+            continue
+        tmp = tempfile.mkdtemp(prefix="riddle_packs_")
+        try:
+            write_pack(tmp, fmt, args.riddles)
+            command = [sys.executable, "-m", "benchmarks.pack_load", "--dir", tmp,
+                       "--format", fmt, "--riddles", str(args.riddles)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+        finally:
+            shutil.rmtree(tmp)
+        results.append(result)
+        print(f"{fmt:<5} {result['riddles']} загадок ({result['file_mb']} МБ): загрузка {result['cold_seconds']} с "
+              f"(разбор {result['parse_seconds']}, каталог {result['build_seconds']})  "
+              f"память {result['start_mb']} -> {result['peak_mb']} МБ  "
+              f"без изменений {result['rescan_ms']} мс  перезапись {result['touch_seconds']} с  "
+              f"правка {result['edit_seconds']} с  {'OK' if result['consistent'] else 'РАСХОЖДЕНИЕ'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Подбор загадок по уровню (riddle_selector.py): стоимость выбора и качество совпадения
+
+Запуск из корня проекта:
+    python -m benchmarks.riddle_selection --catalog 55 5000 50000 500000
+
+1. Стоимость: индекс строится по каталогу каждого размера, затем меряется выбор
+   загадки (DifficultyIndex.bucket_for + pick) - он не должен зависеть от размера каталога.
+2. Качество: синтетические игроки с известным умением решают синтетические загадки
+   с известной сложностью (вероятность решить с одной попытки - логистическая от разницы).
+   Раунд за раундом счетчики копятся, индекс пересобирается, как в боте. Сравнивается
+   случайный выбор (как раньше) и подбор: среднее |умение - сложность| у назначенных
+   загадок и доля решивших у слабой и сильной четверти игроков.
+"""
+import argparse
+import json
+import math
+import random
+import time
+
+import riddle_selector
+
+
+def synthetic_catalog(size: int) -> list:
+    return [{"question": f"Загадка {i}", "answer": "ответ", "hint": None} for i in range(size)]
+
+
+def measure_pick(size: int, calls: int, rng: random.Random) -> dict:
+    catalog = synthetic_catalog(size)
+    counts = {riddle["question"]: (rng.randint(0, 500), rng.randint(0, 500)) for riddle in catalog}
+    counts = {question: (assigned, min(assigned, solved)) for question, (assigned, solved) in counts.items()}
+    bounds = sorted(rng.random() for _ in range(riddle_selector.SELECTOR_BUCKETS - 1))
+    started = time.perf_counter()
+    index = riddle_selector.build_index(catalog, counts, bounds)
+    build_seconds = time.perf_counter() - started
+
+    players = [(rng.randint(0, 300), rng.randint(0, 900)) for _ in range(1000)]
+    started = time.perf_counter()
+    for i in range(calls):
+        solved, attempted = players[i % len(players)]
+        index.pick(index.bucket_for(solved, attempted), rng=rng)
+    pick_seconds = time.perf_counter() - started
+    return {
+        "catalog": size,
+        "build_seconds": round(build_seconds, 3),
+        "pick_us": round(pick_seconds / calls * 1e6, 2)
+    }
+
+
+def skill_bounds(players: list, buckets: int) -> list:
+    """Как database.get_skill_quantiles, по счетчикам в памяти"""
+    skills = sorted(riddle_selector.skill(p["solved"], p["attempted"]) for p in players if p["attempted"])
+    if not skills:
+        return []
+    return [skills[min(len(skills) - 1, (len(skills) * (n + 1)) // buckets - 1)] for n in range(buckets - 1)]
+
+
+def simulate(adaptive: bool, args, seed: int) -> dict:
+    rng = random.Random(seed)
+    catalog = synthetic_catalog(args.riddles)
+    difficulty = {riddle["question"]: rng.random() for riddle in catalog}
+    players = [{"skill": rng.random(), "solved": 0, "attempted": 0} for _ in range(args.players)]
+    counts = {}
+    index = riddle_selector.build_index(catalog, counts, [])
+    gaps, solved_by_quarter, assigned_by_quarter = [], [0, 0, 0, 0], [0, 0, 0, 0]
+
+    for round_number in range(args.rounds):
+        measured = round_number >= args.rounds // 2
+        for player in players:
+            if adaptive:
+                riddle = index.pick(index.bucket_for(player["solved"], player["attempted"]), rng=rng)
+            else:
+                riddle = rng.choice(catalog)
+            question = riddle["question"]
+            chance = 1 / (1 + math.exp(-6 * (player["skill"] - difficulty[question])))
+            solved = False
+            for _ in range(args.max_attempts):
+                player["attempted"] += 1
+                if rng.random() < chance:
+                    solved = True
+                    break
+            player["solved"] += solved
+            assigned, solves = counts.get(question, (0, 0))
+            counts[question] = (assigned + 1, solves + solved)
+            if measured:
+                quarter = min(3, int(player["skill"] * 4))
+                gaps.append(abs(player["skill"] - difficulty[question]))
+                assigned_by_quarter[quarter] += 1
+                solved_by_quarter[quarter] += solved
+        index = riddle_selector.build_index(catalog, counts, skill_bounds(players, riddle_selector.SELECTOR_BUCKETS))
+
+    return {
+        "mode": "adaptive" if adaptive else "random",
+        "mean_gap": round(sum(gaps) / len(gaps), 3),
+        "solve_rate_weakest_quarter": round(solved_by_quarter[0] / max(1, assigned_by_quarter[0]), 3),
+        "solve_rate_strongest_quarter": round(solved_by_quarter[3] / max(1, assigned_by_quarter[3]), 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog", type=int, nargs="+", default=[55, 5000, 50000, 500000], help="размеры каталога")
+    parser.add_argument("--calls", type=int, default=200_000, help="выборов на размер каталога")
+    parser.add_argument("--players", type=int, default=2000, help="игроков в симуляции")
+    parser.add_argument("--riddles", type=int, default=500, help="загадок в симуляции")
+    parser.add_argument("--rounds", type=int, default=30, help="раундов (загадок на игрока)")
+    parser.add_argument("--max-attempts", type=int, default=6, help="попыток на загадку")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {"pick": [], "quality": []}
+    for size in args.catalog:
+        result = measure_pick(size, args.calls, rng)
+        results["pick"].append(result)
+        print(f"каталог {size:>7}: сборка индекса {result['build_seconds']:>7} с, выбор {result['pick_us']:>6} мкс")
+    for adaptive in (False, True):
+        result = simulate(adaptive, args, args.seed)
+        results["quality"].append(result)
+        print(f"{result['mode']:<9} |умение - сложность| {result['mean_gap']:.3f}  решают: слабая четверть "
+              f"{result['solve_rate_weakest_quarter']:.0%}, сильная {result['solve_rate_strongest_quarter']:.0%}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
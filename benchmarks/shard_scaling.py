@@ -0,0 +1,59 @@
+"""
+Масштабирование по ядрам: сквозной нагрузочный тест (benchmarks.load_test) при разном
+числе процессов-воркеров
+
+Запуск из корня проекта:
+    python -m benchmarks.shard_scaling --workers 1 2 4 --users 1000 --actions 10
+
+Каждый прогон - отдельный процесс с чистой базой. Чтобы рост был виден, нагрузка должна
+упираться в процессор бота (по умолчанию 1000 пользователей с паузой 0.2-1 с между
+действиями), а ядер должно быть больше числа воркеров: заглушка Bot API и синтетические
+пользователи тоже занимают ядро.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def run_load_test(workers: int, args) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        report_path = f.name
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.load_test", "--workers", str(workers),
+             "--users", str(args.users), "--actions", str(args.actions), "--json", report_path],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        with open(report_path, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        os.unlink(report_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="числа воркеров для прогонов")
+    parser.add_argument("--users", type=int, default=1000, help="синтетических пользователей")
+    parser.add_argument("--actions", type=int, default=10, help="действий на пользователя после /start")
+    parser.add_argument("--json", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    print(f"Ядер: {os.cpu_count()}")
+    results = []
+    for workers in args.workers:
+        report = run_load_test(workers, args)
+        results.append(report)
+        base = results[0]["updates_per_second"] or 1
+        print(f"воркеров {workers:>2}: {report['updates_per_second']:>7.1f} апдейтов/с "
+              f"(x{report['updates_per_second'] / base:.2f})  p50 {report['latency_ms']['p50']} мс  "
+              f"p99 {report['latency_ms']['p99']} мс  таймаутов {report['timeouts']}  RSS {report['rss_mb']['after']} МБ")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "runs": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
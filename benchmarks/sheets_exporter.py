@@ -0,0 +1,131 @@
+"""
+Проверка и бенчмарк SheetsExporter на локальной заглушке Google Sheets
+
+Запуск из корня проекта:
+    python -m benchmarks.sheets_exporter --rows 500 --latency 0.2
+
+Заглушка имитирует задержку сети на каждый HTTP-запрос и может "падать".
+Сценарий: запись во время недоступности уходит в спул, после восстановления
+спул дописывается одним запросом; параллельно меряется задержка event loop.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import google_sheets
+
+
+class FakeWorksheetNotFound(Exception):
+    """Повторяет имя исключения gspread, по которому экспортер создает лист"""
+
+
+FakeWorksheetNotFound.__name__ = "WorksheetNotFound"
+
+
+class FakeWorksheet:
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.rows = []
+
+    def append_rows(self, rows, value_input_option=None):
+        self.sheets.request()
+        self.rows.extend(rows)
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.worksheets = {}
+
+    def worksheet(self, name):
+        self.sheets.request()
+        if name not in self.worksheets:
+            raise FakeWorksheetNotFound(name)
+        return self.worksheets[name]
+
+    def add_worksheet(self, title, rows, cols):
+        self.sheets.request()
+        self.worksheets[title] = FakeWorksheet(self.sheets)
+        return self.worksheets[title]
+
+
+class FakeSheets:
+    """Клиент-заглушка: задержка на запрос, счетчик запросов, режим недоступности"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.available = True
+        self.requests = 0
+        self.authorizations = 0
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def request(self):
+        self.requests += 1
+        time.sleep(self.latency)
+        if not self.available:
+            raise ConnectionError("Sheets недоступен")
+
+    def factory(self):
+        self.authorizations += 1
+        return self
+
+    def open_by_key(self, key):
+        self.request()
+        return self.spreadsheet
+
+
+async def measure_loop_lag(stop: asyncio.Event, samples: list, interval: float = 0.01):
+    """Насколько позже запланированного просыпается event loop"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка одного запроса к заглушке, с")
+    args = parser.parse_args()
+
+    sheets = FakeSheets(args.latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        exporter = google_sheets.SheetsExporter(
+            "fake-sheet", client_factory=sheets.factory, spool_path=os.path.join(tmp, "spool.jsonl")
+        )
+        rows = [google_sheets.make_grant_row(i, f"user{i}", "Bench", f"BBE-{i:04d}") for i in range(args.rows)]
+        half = len(rows) // 2
+
+        stop = asyncio.Event()
+        lags = []
+        lag_task = asyncio.create_task(measure_loop_lag(stop, lags))
+
+        # Sheets недоступен: первая половина строк уходит в спул
+        sheets.available = False
+        started = time.perf_counter()
+        await exporter.append_rows(rows[:half])
+        spooled = len(exporter._read_spool())
+
+        # Sheets восстановился: вторая половина пишется вместе со спулом
+        sheets.available = True
+        await exporter.append_rows(rows[half:])
+        await exporter.sync_spool()
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await lag_task
+
+        written = sheets.spreadsheet.worksheets[google_sheets.SHEET_NAME].rows
+        assert len(written) == len(rows) + 1, "все строки и заголовок должны быть записаны"
+        assert not os.path.exists(exporter.spool_path), "спул должен быть пуст после синхронизации"
+
+    print(f"строк: {len(rows)}, в спуле во время недоступности: {spooled}")
+    print(f"HTTP-запросов к Sheets: {sheets.requests} (по одному на строку было бы {len(rows) * 3})")
+    print(f"авторизаций: {sheets.authorizations}, время: {elapsed:.2f}s")
+    print(f"макс. задержка event loop: {max(lags) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
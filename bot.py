@@ -1,6 +1,9 @@
 import asyncio
+import html
 import logging
+import signal
 from datetime import datetime
+from functools import partial, wraps
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -8,22 +11,57 @@ from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
 import random
 
+import answer_checker
+import backups
 import config
 import database
 import riddle_generator
+import riddle_packs
+import riddle_selector
 import course_recommendations
-import promo_generator
+import events
+import exports
 import google_sheets
+import grant_pipeline
+import health
+import job_runs
+import leader
+import logging_setup
+import metrics
+import profiler
+import promo_pool
+import query_log
+import router
+import sender
+import shards
+import startup
+from user_locks import per_user
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Логирование настраивается в main() (logging_setup.setup_logging)
 logger = logging.getLogger(__name__)
+answer_log = logging.getLogger(logging_setup.ANSWER_LOGGER)
 
-# Глобальный планировщик
-scheduler = AsyncIOScheduler()
+# Глобальный планировщик: опоздавший запуск (занятый loop, пауза) выполняется один раз,
+# если опоздание меньше JOB_GRACE_SECONDS; пропуски за время простоя догоняет job_runs
+scheduler = AsyncIOScheduler(job_defaults={
+    "coalesce": True,
+    "misfire_grace_time": int(job_runs.JOB_GRACE_SECONDS)
+})
+
+# Сколько догонять пропущенный запуск, если не JOB_GRACE_SECONDS (секунды). Загадки на день
+# догоняются весь день (и на новой базе): так при первом старте за день создается начальный набор
+CATCH_UP_GRACE = {"generate_daily_riddles": 24 * 3600}
+# Выдача грантов идет по снимку недели, который пишет сброс рейтинга: догоняется после него
+CATCH_UP_DEPENDENCIES = {"weekly_grant_distribution": "update_weekly_ratings"}
+
+# Загадки, назначенные реже, в /riddlestats не показываются: доли по паре ответов случайны
+RIDDLE_STATS_MIN_ASSIGNED = 10
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+background_tasks = set()
+
+# Выбор ведущей реплики для задач планировщика (создается в post_init)
+election = None
 
 
 async def generate_new_riddle():
@@ -43,103 +81,34 @@ async def generate_new_riddle():
 
 
 async def generate_daily_riddles():
-    """Генерировать загадки на день (20 загадок)"""
+    """Генерировать загадки на день (20 загадок, одной транзакцией)"""
     try:
-        count = 0
-        for _ in range(20):
-            riddle_id = await generate_new_riddle()
-            if riddle_id:
-                count += 1
+        riddles = [riddle_generator.get_random_riddle() for _ in range(20)]
+        count = await database.add_riddles(riddles)
         logger.info(f"Сгенерировано {count} загадок на день")
     except Exception as e:
         logger.error(f"Ошибка при генерации ежедневных загадок: {e}")
+        raise
 
 
 async def update_weekly_ratings():
     """Очистить турнирную таблицу - сбросить рейтинг всех пользователей каждый понедельник в 00:00"""
     try:
-        await database.reset_weekly_ratings()
-        logger.info("✅ Турнирная таблица очищена: рейтинг всех пользователей сброшен до 1000")
+        season = await database.reset_weekly_ratings()
+        logger.info(f"✅ Турнирная таблица очищена: начат сезон #{season}")
     except Exception as e:
         logger.error(f"❌ Ошибка при очистке турнирной таблицы: {e}", exc_info=True)
+        raise
 
 
 async def weekly_grant_raffle(context: ContextTypes.DEFAULT_TYPE):
-    """Выдача грантов 30 000₽ топ-10 лидерам каждое воскресенье в 00:00"""
+    """Выдача грантов 30 000₽ топ-10 лидерам закрытой недели каждый понедельник в 00:05"""
     try:
-        # Получаем топ-10 лидеров
-        leaders = await database.get_weekly_leaderboard(limit=10)
-        
-        if not leaders or len(leaders) == 0:
-            logger.info("Нет лидеров для выдачи грантов")
-            return
-        
-        # Получаем все существующие промокоды
-        existing_codes = await database.get_all_promo_codes()
-        
-        # Фильтруем лидеров, которые еще не получали грант
-        eligible_leaders = []
-        for leader in leaders:
-            has_received = await database.has_ever_received_grant(leader["user_id"])
-            if not has_received:
-                eligible_leaders.append(leader)
-        
-        if not eligible_leaders:
-            logger.info("Все топ-10 лидеры уже получали грант ранее")
-            return
-        
-        bot = context.bot
-        granted_count = 0
-        
-        # Выдаем грант каждому подходящему лидеру
-        for leader in eligible_leaders:
-            try:
-                leader_id = leader["user_id"]
-                
-                # Генерируем уникальный промокод
-                promo_code = promo_generator.generate_unique_promo_code(existing_codes, prefix="BBE")
-                existing_codes.append(promo_code)  # Добавляем в список, чтобы избежать дубликатов
-                
-                # Сохраняем победителя с промокодом в базу данных
-                await database.save_grant_winner(leader_id, promo_code, grant_amount=30000)
-                
-                # Записываем в Google Sheets
-                await google_sheets.add_grant_to_sheet(
-                    user_id=leader_id,
-                    username=leader.get("username"),
-                    first_name=leader.get("first_name"),
-                    promo_code=promo_code,
-                    grant_amount=30000
-                )
-                
-                # Отправляем сообщение с промокодом
-                message = (
-                    "🎉 <b>Поздравляем!</b>\n\n"
-                    "Привет, мы видели твои классные способности, вот тебе грант на 30 тысяч на любую профессию школы Банбэнк Эдюкейшн.\n\n"
-                    f"🎫 <b>Твой промокод:</b> <code>{promo_code}</code>\n\n"
-                    "🔗 <a href='https://bangbangeducation.ru/sale'>Bang Bang Education</a>"
-                )
-                
-                await bot.send_message(
-                    chat_id=leader_id,
-                    text=message,
-                    parse_mode='HTML',
-                    disable_web_page_preview=False
-                )
-                
-                granted_count += 1
-                logger.info(f"Грант с промокодом {promo_code} отправлен пользователю {leader_id} ({leader.get('username', leader.get('first_name', 'Unknown'))})")
-                
-                # Небольшая задержка между отправками
-                await asyncio.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"Ошибка при выдаче гранта пользователю {leader.get('user_id')}: {e}", exc_info=True)
-        
-        logger.info(f"Выдано {granted_count} грантов из {len(eligible_leaders)} подходящих лидеров")
-        
+        # Конвейер идемпотентен: повторный запуск за ту же неделю дообработает незавершенное
+        await grant_pipeline.run_weekly_grants(context.bot, holds_lease=holds_scheduler_lease)
     except Exception as e:
         logger.error(f"Ошибка при выдаче грантов: {e}", exc_info=True)
+        raise
 
 
 async def send_riddles_to_users(context: ContextTypes.DEFAULT_TYPE):
@@ -155,6 +124,12 @@ async def send_riddles_to_users(context: ContextTypes.DEFAULT_TYPE):
         sent_count = 0
         
         for user_id in users:
+            # Реплика, потерявшая аренду посреди рассылки, останавливается: новая ведущая
+            # разошлет напоминания сама, и пользователи не получат их дважды
+            if not holds_scheduler_lease():
+                logger.warning("Рассылка напоминаний остановлена: аренда планировщика потеряна "
+                               "(отправлено %s)", sent_count)
+                return
             try:
                 # Дополнительная проверка, что бот активен (на всякий случай)
                 if not await database.is_bot_active(user_id):
@@ -176,12 +151,8 @@ async def send_riddles_to_users(context: ContextTypes.DEFAULT_TYPE):
                     f"Отправьте свой ответ сообщением!"
                 )
                 
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=message,
-                    parse_mode='HTML'
-                )
-                sent_count += 1
+                if await sender.send_message(bot, user_id, message, parse_mode='HTML'):
+                    sent_count += 1
             except Exception as e:
                 logger.error(f"Ошибка при отправке напоминания пользователю {user_id}: {e}")
         
@@ -196,16 +167,17 @@ async def send_riddle_to_user(user_id: int, bot, active_riddle=None, is_new=True
         if not active_riddle:
             if is_new:
                 # Если is_new=True, ВСЕГДА создаем новую загадку
-                logger.info(f"[НОВАЯ ЗАГАДКА] Генерация новой загадки для пользователя {user_id}")
+                logger.debug("[НОВАЯ ЗАГАДКА] Генерация новой загадки для пользователя %s", user_id)
                 
                 # Генерируем новую загадку, проверяя что она уникальна для пользователя
                 max_attempts = 10  # Максимум попыток найти уникальную загадку
                 riddle = None
                 riddle_id = None
+                bucket = await riddle_selector.user_bucket(user_id)
                 
                 for attempt in range(max_attempts):
-                    # Получаем случайную загадку
-                    riddle = riddle_generator.get_random_riddle()
+                    # Загадка по уровню пользователя (после неудач - и из соседних корзин)
+                    riddle = riddle_selector.pick_for(bucket, attempt)
                     
                     # Проверяем, не видел ли пользователь эту загадку
                     user_saw_this = await database.user_has_seen_riddle(user_id, riddle["question"])
@@ -223,7 +195,7 @@ async def send_riddle_to_user(user_id: int, bot, active_riddle=None, is_new=True
                                 "answer": existing_riddle["answer"],
                                 "hint": existing_riddle.get("hint")
                             }
-                            logger.info(f"Используем существующую загадку #{riddle_id} для пользователя {user_id}")
+                            logger.debug("Используем существующую загадку #%s для пользователя %s", riddle_id, user_id)
                             break
                         else:
                             # Загадки нет в базе, добавляем новую
@@ -241,14 +213,14 @@ async def send_riddle_to_user(user_id: int, bot, active_riddle=None, is_new=True
                                 "answer": riddle["answer"],
                                 "hint": riddle.get("hint")
                             }
-                            logger.info(f"Создана новая загадка #{riddle_id} для пользователя {user_id}")
+                            logger.info("Создана новая загадка #%s для пользователя %s", riddle_id, user_id)
                             break
                     else:
-                        logger.info(f"Попытка {attempt + 1}: пользователь {user_id} уже видел эту загадку, пробуем другую")
+                        logger.debug("Попытка %s: пользователь %s уже видел эту загадку, пробуем другую", attempt + 1, user_id)
                 
                 if not active_riddle:
                     # Если не удалось найти уникальную загадку, создаем любую новую
-                    logger.warning(f"Не удалось найти уникальную загадку для {user_id}, создаем любую новую")
+                    logger.warning("Не удалось найти уникальную загадку для %s, создаем любую новую", user_id)
                     riddle = riddle_generator.get_random_riddle()
                     riddle_id = await database.add_riddle(
                         question=riddle["question"],
@@ -266,13 +238,13 @@ async def send_riddle_to_user(user_id: int, bot, active_riddle=None, is_new=True
                     }
             else:
                 # Если is_new=False, пытаемся найти нерешенную загадку
-                logger.info(f"Поиск нерешенной загадки для пользователя {user_id}")
+                logger.debug("Поиск нерешенной загадки для пользователя %s", user_id)
                 active_riddle = await database.get_unsolved_riddle_for_user(user_id)
                 
                 # Если нерешенных загадок нет, создаем новую
                 if not active_riddle:
-                    logger.info(f"Нет нерешенных загадок, создаем новую для пользователя {user_id}")
-                    riddle = riddle_generator.get_random_riddle()
+                    logger.debug("Нет нерешенных загадок, создаем новую для пользователя %s", user_id)
+                    riddle = riddle_selector.pick_for(await riddle_selector.user_bucket(user_id))
                     riddle_id = await database.add_riddle(
                         question=riddle["question"],
                         answer=riddle["answer"],
@@ -287,13 +259,13 @@ async def send_riddle_to_user(user_id: int, bot, active_riddle=None, is_new=True
                         "answer": riddle["answer"],
                         "hint": riddle.get("hint")
                     }
-                    logger.info(f"Создана новая загадка #{riddle_id} для пользователя {user_id}")
+                    logger.info("Создана новая загадка #%s для пользователя %s", riddle_id, user_id)
                 else:
-                    logger.info(f"Найдена нерешенная загадка #{active_riddle['id']} для пользователя {user_id}")
+                    logger.debug("Найдена нерешенная загадка #%s для пользователя %s", active_riddle['id'], user_id)
         
         # Установить активную загадку для пользователя
         await database.set_user_active_riddle(user_id, active_riddle['id'])
-        logger.info(f"Установлена активная загадка #{active_riddle['id']} для пользователя {user_id}")
+        logger.debug("Установлена активная загадка #%s для пользователя %s", active_riddle['id'], user_id)
         
         if is_new:
             message = f"🎨 <b>Новая дизайнерская загадка!</b>\n\n{active_riddle['question']}\n\nОтправьте свой ответ сообщением!"
@@ -303,20 +275,20 @@ async def send_riddle_to_user(user_id: int, bot, active_riddle=None, is_new=True
         # Создаем клавиатуру с кнопками
         keyboard = [
             [
-                InlineKeyboardButton("💡 Подсказка", callback_data=f"hint_{user_id}"),
-                InlineKeyboardButton("📊 Статистика", callback_data=f"stats_{user_id}")
+                InlineKeyboardButton("💡 Подсказка", callback_data=router.encode_callback("hint")),
+                InlineKeyboardButton("📊 Статистика", callback_data=router.encode_callback("stats"))
             ],
             [
-                InlineKeyboardButton("🏆 Лидерборд", callback_data=f"leaderboard_{user_id}"),
-                InlineKeyboardButton("🎲 Новая загадка", callback_data=f"new_riddle_{user_id}")
+                InlineKeyboardButton("🏆 Лидерборд", callback_data=router.encode_callback("leaderboard")),
+                InlineKeyboardButton("🎲 Новая загадка", callback_data=router.encode_callback("new_riddle"))
             ]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await bot.send_message(chat_id=user_id, text=message, parse_mode='HTML', reply_markup=reply_markup)
-        logger.info(f"Загадка отправлена пользователю {user_id}")
+        logger.info("Загадка #%s отправлена пользователю %s", active_riddle['id'], user_id)
     except Exception as e:
-        logger.error(f"Ошибка в send_riddle_to_user для пользователя {user_id}: {e}", exc_info=True)
+        logger.error("Ошибка в send_riddle_to_user для пользователя %s: %s", user_id, e, exc_info=True)
         raise
 
 
@@ -325,12 +297,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user = update.effective_user
         
-        # Убеждаемся, что БД инициализирована
-        try:
-            await database.init_db()
-        except Exception as e:
-            logger.warning(f"БД уже инициализирована или ошибка: {e}")
-        
+        # Схему БД создает post_init до приема апдейтов
         await database.get_or_create_user(
             user_id=user.id,
             username=user.username,
@@ -354,17 +321,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         bot_is_active = await database.is_bot_active(user.id)
         
         # Создаем постоянную клавиатуру с основными командами
-        if bot_is_active:
-            main_keyboard = [
-                [KeyboardButton("🎲 Новая загадка"), KeyboardButton("📊 Моя статистика")],
-                [KeyboardButton("🏆 Лидерборд"), KeyboardButton("💡 Подсказка")],
-                [KeyboardButton("⏸ Остановить бота")]
-            ]
-        else:
-            main_keyboard = [
-                [KeyboardButton("▶️ Начать разгадывать загадки")]
-            ]
-        reply_markup = ReplyKeyboardMarkup(main_keyboard, resize_keyboard=True)
+        reply_markup = build_reply_markup(router.MAIN_KEYBOARD if bot_is_active else router.PAUSED_KEYBOARD)
         
         await update.message.reply_text(welcome_message, parse_mode='HTML', reply_markup=reply_markup)
         
@@ -389,56 +346,132 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"Произошла ошибка: {str(e)}")
 
 
-async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать статистику пользователя"""
-    user = update.effective_user if update.message else update.callback_query.from_user
-    user_id = user.id
+def build_reply_markup(labels) -> ReplyKeyboardMarkup:
+    """Собрать постоянную клавиатуру из надписей кнопок"""
+    return ReplyKeyboardMarkup(
+        [[KeyboardButton(label) for label in row] for row in labels],
+        resize_keyboard=True
+    )
+
+
+async def reply(update: Update, message: str, **kwargs):
+    """Ответить на сообщение или на нажатие inline-кнопки"""
+    if update.message:
+        await update.message.reply_text(message, **kwargs)
+    elif update.callback_query:
+        await update.callback_query.message.reply_text(message, **kwargs)
+
+
+async def build_stats_message(user_id: int) -> str:
+    """Текст статистики пользователя"""
     stats_data = await database.get_user_stats(user_id)
     
     if not stats_data:
-        message = "Статистика не найдена. Используйте /start"
-    else:
-        message = (
-            f"📊 <b>Ваша статистика:</b>\n\n"
-            f"✅ Решено загадок: {stats_data['total_riddles_solved']}\n"
-            f"📝 Попыток всего: {stats_data['total_riddles_attempted']}\n"
-            f"💡 Подсказок использовано: {stats_data['total_hints_used']}\n"
-            f"⭐ Рейтинг: {stats_data['rating']}\n"
-        )
-        
-        if stats_data['total_riddles_attempted'] > 0:
-            success_rate = (stats_data['total_riddles_solved'] / stats_data['total_riddles_attempted']) * 100
-            message += f"📈 Процент успеха: {success_rate:.1f}%"
+        return "Статистика не найдена. Используйте /start"
     
-    if update.message:
-        await update.message.reply_text(message, parse_mode='HTML')
-    elif update.callback_query:
-        await update.callback_query.message.reply_text(message, parse_mode='HTML')
+    message = (
+        f"📊 <b>Ваша статистика:</b>\n\n"
+        f"✅ Решено загадок: {stats_data['total_riddles_solved']}\n"
+        f"📝 Попыток всего: {stats_data['total_riddles_attempted']}\n"
+        f"💡 Подсказок использовано: {stats_data['total_hints_used']}\n"
+        f"⭐ Рейтинг: {stats_data['rating']}\n"
+    )
+    
+    if stats_data['total_riddles_attempted'] > 0:
+        success_rate = (stats_data['total_riddles_solved'] / stats_data['total_riddles_attempted']) * 100
+        message += f"📈 Процент успеха: {success_rate:.1f}%"
+    return message
 
 
-async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать таблицу лидеров"""
+async def build_leaderboard_message() -> str:
+    """Текст таблицы лидеров"""
     leaders = await database.get_leaderboard(limit=10)
     
     if not leaders:
-        message = "Пока нет участников в рейтинге"
-    else:
-        message = "🏆 <b>Таблица лидеров:</b>\n\n"
-        
-        medals = ["🥇", "🥈", "🥉"]
-        for i, leader in enumerate(leaders, 1):
-            medal = medals[i-1] if i <= 3 else f"{i}."
-            name = leader['username'] or leader['first_name'] or f"User {leader['user_id']}"
-            message += (
-                f"{medal} <b>{name}</b>\n"
-                f"   ⭐ Рейтинг: {leader['rating']} | "
-                f"✅ Решено: {leader['total_riddles_solved']}\n\n"
-            )
+        return "Пока нет участников в рейтинге"
     
-    if update.message:
-        await update.message.reply_text(message, parse_mode='HTML')
-    elif update.callback_query:
-        await update.callback_query.message.reply_text(message, parse_mode='HTML')
+    message = "🏆 <b>Таблица лидеров:</b>\n\n"
+    
+    medals = ["🥇", "🥈", "🥉"]
+    for i, leader in enumerate(leaders, 1):
+        medal = medals[i-1] if i <= 3 else f"{i}."
+        name = leader['username'] or leader['first_name'] or f"User {leader['user_id']}"
+        message += (
+            f"{medal} <b>{name}</b>\n"
+            f"   ⭐ Рейтинг: {leader['rating']} | "
+            f"✅ Решено: {leader['total_riddles_solved']}\n\n"
+        )
+    return message
+
+
+async def build_history_message(week_date: str = None) -> str:
+    """Текст итоговой таблицы лидеров прошлой недели (по умолчанию - последней сохраненной)"""
+    weeks = await database.get_snapshot_weeks(limit=8)
+    if not weeks:
+        return "История пока пуста: итоги сохраняются после окончания недели"
+    week_date = week_date or weeks[0]
+    leaders = await database.get_leaderboard_snapshot(week_date, limit=10)
+    if not leaders:
+        return f"Нет итогов недели {html.escape(week_date)}. Доступны: {', '.join(weeks)}"
+    
+    message = f"📜 <b>Итоги недели с {week_date}:</b>\n\n"
+    
+    medals = ["🥇", "🥈", "🥉"]
+    for leader in leaders:
+        position = leader['position']
+        medal = medals[position-1] if position <= 3 else f"{position}."
+        name = leader['username'] or leader['first_name'] or f"User {leader['user_id']}"
+        message += (
+            f"{medal} <b>{html.escape(name)}</b>\n"
+            f"   ⭐ Рейтинг: {leader['rating']} | "
+            f"✅ Решено: {leader['total_riddles_solved']}\n\n"
+        )
+    others = [week for week in weeks if week != week_date]
+    if others:
+        message += f"Другие недели: /history {others[0]}" + "".join(f", {week}" for week in others[1:])
+    return message
+
+
+async def build_hint_message(user_id: int) -> str:
+    """Текст подсказки (или сколько ошибок осталось до нее)"""
+    hint_text = await database.get_hint(user_id)
+    
+    if hint_text:
+        return f"💡 <b>Подсказка:</b> {hint_text}"
+    
+    # Получим информацию об активной загадке
+    riddle_info = await database.get_user_active_riddle_info(user_id)
+    if not riddle_info:
+        return "У вас нет активной загадки. Используйте /riddle чтобы получить загадку"
+    
+    wrong_attempts = riddle_info["wrong_attempts"]
+    hints_given = riddle_info["hints_given"]
+    needed = (hints_given + 1) * 3
+    remaining = needed - wrong_attempts
+    return (
+        f"❌ Недостаточно ошибок для подсказки!\n"
+        f"Нужно еще {remaining} неправильных попыток (всего {needed} для следующей подсказки)"
+    )
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать статистику пользователя"""
+    user = update.effective_user if update.message else update.callback_query.from_user
+    message = await build_stats_message(user.id)
+    await reply(update, message, parse_mode='HTML')
+
+
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать таблицу лидеров"""
+    message = await build_leaderboard_message()
+    await reply(update, message, parse_mode='HTML')
+
+
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать таблицу лидеров прошлой недели: /history [YYYY-MM-DD]"""
+    week_date = context.args[0] if context.args else None
+    message = await build_history_message(week_date)
+    await reply(update, message, parse_mode='HTML')
 
 
 async def riddle(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -455,42 +488,264 @@ async def riddle(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await send_riddle_to_user(user_id, context.bot, active_riddle=None, is_new=True)
     except Exception as e:
         logger.error(f"Ошибка при отправке загадки: {e}")
-        error_msg = "Произошла ошибка. Попробуйте позже."
-        if update.message:
-            await update.message.reply_text(error_msg)
-        elif update.callback_query:
-            await update.callback_query.message.reply_text(error_msg)
+        await reply(update, "Произошла ошибка. Попробуйте позже.")
 
 
 async def hint(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получить подсказку"""
     user = update.effective_user if update.message else update.callback_query.from_user
-    user_id = user.id
-    hint_text = await database.get_hint(user_id)
+    message = await build_hint_message(user.id)
+    await reply(update, message, parse_mode='HTML')
+
+
+async def stop_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка "Остановить бота": отключить напоминания"""
+    user = update.effective_user
+    await database.set_bot_active(user.id, False)
+    await update.message.reply_text(
+        "⏸ <b>Бот остановлен</b>\n\n"
+        "Вы больше не будете получать напоминания о загадках.\n"
+        "Когда захотите вернуться, нажмите кнопку \"Начать разгадывать загадки\" - "
+        "вы вернетесь к текущей загадке.",
+        parse_mode='HTML',
+        reply_markup=build_reply_markup(router.PAUSED_KEYBOARD)
+    )
+
+
+async def resume_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка "Начать разгадывать загадки": вернуть пользователя к текущей загадке"""
+    user = update.effective_user
+    await database.set_bot_active(user.id, True)
+    reply_markup = build_reply_markup(router.MAIN_KEYBOARD)
     
-    if not hint_text:
-        # Получим информацию об активной загадке
-        riddle_info = await database.get_user_active_riddle_info(user_id)
-        if not riddle_info:
-            message = "У вас нет активной загадки. Используйте /riddle чтобы получить загадку"
-        else:
-            wrong_attempts = riddle_info["wrong_attempts"]
-            hints_given = riddle_info["hints_given"]
-            needed = (hints_given + 1) * 3
-            remaining = needed - wrong_attempts
-            message = (
-                f"❌ Недостаточно ошибок для подсказки!\n"
-                f"Нужно еще {remaining} неправильных попыток (всего {needed} для следующей подсказки)"
+    # Проверяем, есть ли у пользователя активная загадка
+    riddle_id = await database.get_user_active_riddle_id(user.id)
+    riddle_data = await database.get_riddle_by_id(riddle_id) if riddle_id else None
+    if riddle_data:
+        # Отправляем текущую загадку (на которой остановился)
+        active_riddle = {
+            "id": riddle_id,
+            "question": riddle_data["question"],
+            "answer": riddle_data["answer"],
+            "hint": riddle_data.get("hint")
+        }
+        await update.message.reply_text(
+            "✅ <b>Добро пожаловать обратно!</b>\n\n"
+            "Вы вернулись к текущей загадке.",
+            parse_mode='HTML',
+            reply_markup=reply_markup
+        )
+        await send_riddle_to_user(user.id, context.bot, active_riddle=active_riddle, is_new=False)
+    else:
+        # Если нет активной загадки (или она не найдена), отправляем новую
+        await update.message.reply_text(
+            "✅ <b>Добро пожаловать обратно!</b>\n\n"
+            "Отправляю новую загадку.",
+            parse_mode='HTML',
+            reply_markup=reply_markup
+        )
+        await send_riddle_to_user(user.id, context.bot, active_riddle=None, is_new=True)
+
+
+async def hint_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-кнопка "Подсказка" """
+    query = update.callback_query
+    await query.message.reply_text(await build_hint_message(query.from_user.id), parse_mode='HTML')
+
+
+async def stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-кнопка "Статистика" """
+    query = update.callback_query
+    await query.message.reply_text(await build_stats_message(query.from_user.id), parse_mode='HTML')
+
+
+async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-кнопка "Лидерборд" """
+    query = update.callback_query
+    await query.message.reply_text(await build_leaderboard_message(), parse_mode='HTML')
+
+
+async def new_riddle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-кнопка "Новая загадка" """
+    await send_riddle_to_user(update.callback_query.from_user.id, context.bot, active_riddle=None, is_new=True)
+
+
+# Кнопки ReplyKeyboard (плюс те же надписи без эмодзи, набранные вручную)
+router.message_router.add("new_riddle", riddle, router.BTN_NEW_RIDDLE, "Новая загадка")
+router.message_router.add("stats", stats, router.BTN_STATS, "Моя статистика", "Статистика")
+router.message_router.add("leaderboard", leaderboard, router.BTN_LEADERBOARD, "Лидерборд")
+router.message_router.add("hint", hint, router.BTN_HINT, "Подсказка")
+router.message_router.add("stop", stop_bot, router.BTN_STOP, "Остановить бота")
+router.message_router.add("resume", resume_bot, router.BTN_RESUME, "Начать разгадывать загадки")
+
+# Inline-кнопки под загадкой
+router.callback_router.add("hint", hint_callback, "hint")
+router.callback_router.add("stats", stats_callback, "stats")
+router.callback_router.add("leaderboard", leaderboard_callback, "leaderboard")
+router.callback_router.add("new_riddle", new_riddle_callback, "new_riddle")
+
+
+def is_admin(user_id: int) -> bool:
+    """Является ли пользователь администратором бота (config.ADMIN_IDS)"""
+    return user_id in config.ADMIN_IDS
+
+
+async def querylog_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Админ: /querylog on|off|reset|top - запись SQL-запросов и самые тяжелые из них"""
+    if not is_admin(update.effective_user.id):
+        return
+    action = context.args[0].lower() if context.args else "top"
+    
+    if action == "on":
+        query_log.enable()
+        message = "✅ Запись SQL-запросов включена"
+    elif action == "off":
+        query_log.disable()
+        message = "⏸ Запись SQL-запросов выключена"
+    elif action == "reset":
+        query_log.reset()
+        message = "🧹 Статистика SQL-запросов сброшена"
+    else:
+        state = "включена" if query_log.enabled else "выключена"
+        message = f"📈 <b>SQL-запросы</b> (запись {state})\n\n"
+        for item in query_log.top(limit=5):
+            message += (
+                f"<code>{html.escape(item['fingerprint'][:200])}</code>\n"
+                f"   {item['count']} раз, всего {item['seconds'] * 1000:.1f}ms, "
+                f"макс {item['max_seconds'] * 1000:.1f}ms, строк {item['rows']}\n"
+                f"   {html.escape(', '.join(item['sites'][:3]))}\n\n"
             )
+    await update.message.reply_text(message, parse_mode='HTML')
+
+
+async def jobs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Админ: /jobs - последний запуск и следующий запуск каждой задачи планировщика"""
+    if not is_admin(update.effective_user.id):
+        return
+    next_runs = {job.id: job.next_run_time for job in scheduler.get_jobs()}
+    runs = {run["job_id"]: run for run in await database.get_last_job_runs()}
+    
+    if election is not None and election.is_leader:
+        message = "🗓 <b>Задачи планировщика</b> (эта реплика ведущая)\n\n"
     else:
-        message = f"💡 <b>Подсказка:</b> {hint_text}"
+        message = "🗓 <b>Задачи планировщика</b> (задачи выполняет другая реплика)\n\n"
+    for job_id in sorted(set(next_runs) | set(runs)):
+        run = runs.get(job_id)
+        message += f"<b>{html.escape(job_id)}</b>\n"
+        if run:
+            message += f"   последний: {run['slot']} - {run['status']}"
+            if run["attempts"] > 1:
+                message += f" (попыток: {run['attempts']})"
+            message += "\n"
+            if run["error"]:
+                message += f"   <code>{html.escape(run['error'][:200])}</code>\n"
+        if next_runs.get(job_id):
+            message += f"   следующий: {next_runs[job_id].isoformat(timespec='minutes')}\n"
+    await update.message.reply_text(message, parse_mode='HTML')
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Админ: /profile [секунды] [sample|cprofile] - профиль event loop в файлы"""
+    if not is_admin(update.effective_user.id):
+        return
+    args = context.args or []
+    try:
+        seconds = float(args[0]) if args else profiler.PROFILE_SECONDS
+    except ValueError:
+        await update.message.reply_text("Использование: /profile [секунды] [sample|cprofile]")
+        return
+    mode = args[1].lower() if len(args) > 1 else "sample"
+    if mode not in profiler.MODES or profiler.is_running():
+        await update.message.reply_text(
+            "⏳ Профилирование уже идет" if profiler.is_running()
+            else "Использование: /profile [секунды] [sample|cprofile]"
+        )
+        return
     
-    # Отправляем сообщение (работает и для обычных сообщений, и для callback)
-    if update.message:
-        await update.message.reply_text(message, parse_mode='HTML')
-    elif update.callback_query:
-        await update.callback_query.answer()
-        await update.callback_query.message.reply_text(message, parse_mode='HTML')
+    await update.message.reply_text(f"🔬 Профилирование ({mode}) запущено на {min(seconds, profiler.MAX_SECONDS):.0f} с")
+    
+    async def run_and_report():
+        try:
+            result = await profiler.profile(seconds, mode)
+        except Exception as e:
+            logger.error("Ошибка профилирования: %s", e, exc_info=True)
+            await update.message.reply_text(f"❌ Ошибка профилирования: {html.escape(str(e))}", parse_mode='HTML')
+            return
+        await update.message.reply_text(
+            f"✅ Профиль сохранен в <code>{html.escape(result['dir'])}</code>\n"
+            f"Медленных колбэков: {result['slow_callbacks']}\n\n"
+            f"<pre>{html.escape(result['summary'][:3000])}</pre>",
+            parse_mode='HTML'
+        )
+    
+    # Профилирование идет в фоне, чтобы не занимать слот обработки апдейтов
+    task = asyncio.create_task(run_and_report())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def riddlestats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Админ: /riddlestats [hard|easy|attempts|hints|abandon] [N] - сложность загадок по счетчикам"""
+    if not is_admin(update.effective_user.id):
+        return
+    args = [arg.lower() for arg in context.args or []]
+    order = args[0] if args else "hard"
+    try:
+        limit = min(int(args[1]), 30) if len(args) > 1 else 10
+    except ValueError:
+        limit = 0
+    if order not in database.RIDDLE_STATS_ORDERS or limit <= 0:
+        await update.message.reply_text(
+            f"Использование: /riddlestats [{'|'.join(database.RIDDLE_STATS_ORDERS)}] [N]"
+        )
+        return
+    
+    report = await database.get_riddle_stats_report(order, limit, RIDDLE_STATS_MIN_ASSIGNED)
+    message = f"🧩 <b>Сложность загадок</b> ({order}, от {RIDDLE_STATS_MIN_ASSIGNED} назначений)\n\n"
+    if not report:
+        message += "Пока мало данных"
+    for item in report:
+        mean_attempts = f"{item['mean_attempts']:.1f}" if item["mean_attempts"] is not None else "-"
+        message += (
+            f"<b>#{item['riddle_id']}</b> {html.escape((item['question'] or '')[:80])}\n"
+            f"   решают {item['solve_rate']:.0%} ({item['solved']}/{item['assigned']}), "
+            f"попыток до решения {mean_attempts}, подсказок {item['hint_rate']:.2f}, "
+            f"бросают {item['abandon_rate']:.0%}\n\n"
+        )
+    await update.message.reply_text(message, parse_mode='HTML')
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Админ: /export attempts|users|grants ... [csv] - таблицы файлами CSV.gz в этот чат"""
+    if not is_admin(update.effective_user.id):
+        return
+    args = [arg.lower() for arg in context.args or []]
+    compress = "csv" not in args
+    tables = [arg for arg in args if arg not in exports.FORMATS]
+    usage = f"Использование: /export {'|'.join(database.EXPORT_TABLES)} ... [csv]"
+    if not tables or any(table not in database.EXPORT_TABLES for table in tables):
+        await update.message.reply_text(usage)
+        return
+    if exports.is_running():
+        await update.message.reply_text("⏳ Выгрузка уже идет")
+        return
+    
+    await update.message.reply_text(f"📦 Выгрузка {', '.join(tables)} запущена, файлы придут сюда")
+    
+    async def run_and_send():
+        try:
+            results = await exports.export_to_chat(context.bot, update.effective_chat.id, tables, compress)
+        except Exception as e:
+            logger.error("Ошибка выгрузки %s: %s", tables, e, exc_info=True)
+            await update.message.reply_text(f"❌ Ошибка выгрузки: {html.escape(str(e))}", parse_mode='HTML')
+            return
+        summary = ", ".join(f"{result['table']} - {result['rows']} строк" for result in results)
+        await update.message.reply_text(f"✅ Выгрузка готова: {summary}")
+    
+    # Выгрузка и отправка больших файлов идут в фоне, не занимая слот обработки апдейтов
+    task = asyncio.create_task(run_and_send())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
 
 
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -502,7 +757,11 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.from_user.id
-    data = query.data
+    action, _ = router.decode_callback(query.data)
+    route = router.callback_router.resolve(action)
+    if not route:
+        logger.warning(f"Неизвестный callback_data от пользователя {user_id}: {query.data!r}")
+        return
     
     # Регистрируем пользователя, если его нет
     await database.get_or_create_user(
@@ -512,63 +771,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     try:
-        if data.startswith("hint_"):
-            hint_text = await database.get_hint(user_id)
-            if not hint_text:
-                riddle_info = await database.get_user_active_riddle_info(user_id)
-                if not riddle_info:
-                    message = "У вас нет активной загадки. Используйте /riddle чтобы получить загадку"
-                else:
-                    wrong_attempts = riddle_info["wrong_attempts"]
-                    hints_given = riddle_info["hints_given"]
-                    needed = (hints_given + 1) * 3
-                    remaining = needed - wrong_attempts
-                    message = (
-                        f"❌ Недостаточно ошибок для подсказки!\n"
-                        f"Нужно еще {remaining} неправильных попыток (всего {needed} для следующей подсказки)"
-                    )
-            else:
-                message = f"💡 <b>Подсказка:</b> {hint_text}"
-            await query.message.reply_text(message, parse_mode='HTML')
-            
-        elif data.startswith("stats_"):
-            stats_data = await database.get_user_stats(user_id)
-            if not stats_data:
-                message = "Статистика не найдена. Используйте /start"
-            else:
-                message = (
-                    f"📊 <b>Ваша статистика:</b>\n\n"
-                    f"✅ Решено загадок: {stats_data['total_riddles_solved']}\n"
-                    f"📝 Попыток всего: {stats_data['total_riddles_attempted']}\n"
-                    f"💡 Подсказок использовано: {stats_data['total_hints_used']}\n"
-                    f"⭐ Рейтинг: {stats_data['rating']}\n"
-                )
-                if stats_data['total_riddles_attempted'] > 0:
-                    success_rate = (stats_data['total_riddles_solved'] / stats_data['total_riddles_attempted']) * 100
-                    message += f"📈 Процент успеха: {success_rate:.1f}%"
-            await query.message.reply_text(message, parse_mode='HTML')
-            
-        elif data.startswith("leaderboard_"):
-            leaders = await database.get_leaderboard(limit=10)
-            if not leaders:
-                message = "Пока нет участников в рейтинге"
-            else:
-                message = "🏆 <b>Таблица лидеров:</b>\n\n"
-                medals = ["🥇", "🥈", "🥉"]
-                for i, leader in enumerate(leaders, 1):
-                    medal = medals[i-1] if i <= 3 else f"{i}."
-                    name = leader['username'] or leader['first_name'] or f"User {leader['user_id']}"
-                    message += (
-                        f"{medal} <b>{name}</b>\n"
-                        f"   ⭐ Рейтинг: {leader['rating']} | "
-                        f"✅ Решено: {leader['total_riddles_solved']}\n\n"
-                    )
-            await query.message.reply_text(message, parse_mode='HTML')
-            
-        elif data.startswith("new_riddle_"):
-            # Отправляем новую загадку
-            await send_riddle_to_user(user_id, context.bot, active_riddle=None, is_new=True)
-            
+        await router.callback_router.dispatch(*route, update, context)
     except Exception as e:
         logger.error(f"Ошибка в handle_callback: {e}", exc_info=True)
         await query.message.reply_text("Произошла ошибка. Попробуйте позже.")
@@ -578,113 +781,23 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений (ответы на загадки и кнопки)"""
     user = update.effective_user
     user_answer = update.message.text.strip()
-    user_answer_lower = user_answer.lower()
     
-    logger.info(f"[СООБЩЕНИЕ] Пользователь {user.id} отправил: '{user_answer}'")
+    answer_log.debug("[СООБЩЕНИЕ] Пользователь %s отправил: %r", user.id, user_answer)
     
     # Игнорируем команды
     if user_answer.startswith('/'):
         return
     
-    # ВАЖНО: Сначала проверяем ВСЕ кнопки ReplyKeyboard
-    # Это защищает от списания баллов когда пользователь нажимает кнопку
-    
-    # Проверка на кнопку "Новая загадка"
-    if "новая загадка" in user_answer_lower or "🎲" in user_answer:
-        logger.info(f"[КНОПКА] Пользователь {user.id} нажал 'Новая загадка'")
-        await riddle(update, context)
-        return
-    
-    # Проверка на кнопку "Статистика"  
-    if "статистика" in user_answer_lower or "📊" in user_answer:
-        logger.info(f"[КНОПКА] Пользователь {user.id} нажал 'Статистика'")
-        await stats(update, context)
-        return
-    
-    # Проверка на кнопку "Лидерборд"
-    if "лидерборд" in user_answer_lower or "🏆" in user_answer:
-        logger.info(f"[КНОПКА] Пользователь {user.id} нажал 'Лидерборд'")
-        await leaderboard(update, context)
-        return
-    
-    # Проверка на кнопку "Подсказка"
-    if "подсказка" in user_answer_lower or "💡" in user_answer:
-        logger.info(f"[КНОПКА] Пользователь {user.id} нажал 'Подсказка'")
-        await hint(update, context)
-        return
-    
-    # Проверка на кнопку "Остановить бота"
-    if "остановить" in user_answer_lower or "⏸" in user_answer:
-        logger.info(f"[КНОПКА] Пользователь {user.id} нажал 'Остановить бота'")
-        await database.set_bot_active(user.id, False)
-        # Обновляем клавиатуру
-        main_keyboard = [
-            [KeyboardButton("▶️ Начать разгадывать загадки")]
-        ]
-        reply_markup = ReplyKeyboardMarkup(main_keyboard, resize_keyboard=True)
-        await update.message.reply_text(
-            "⏸ <b>Бот остановлен</b>\n\n"
-            "Вы больше не будете получать напоминания о загадках.\n"
-            "Когда захотите вернуться, нажмите кнопку \"Начать разгадывать загадки\" - "
-            "вы вернетесь к текущей загадке.",
-            parse_mode='HTML',
-            reply_markup=reply_markup
-        )
-        return
-    
-    # Проверка на кнопку "Начать разгадывать загадки"
-    if "начать разгадывать" in user_answer_lower or "▶️" in user_answer:
-        logger.info(f"[КНОПКА] Пользователь {user.id} нажал 'Начать разгадывать загадки'")
-        await database.set_bot_active(user.id, True)
-        # Обновляем клавиатуру
-        main_keyboard = [
-            [KeyboardButton("🎲 Новая загадка"), KeyboardButton("📊 Моя статистика")],
-            [KeyboardButton("🏆 Лидерборд"), KeyboardButton("💡 Подсказка")],
-            [KeyboardButton("⏸ Остановить бота")]
-        ]
-        reply_markup = ReplyKeyboardMarkup(main_keyboard, resize_keyboard=True)
-        
-        # Проверяем, есть ли у пользователя активная загадка
-        riddle_id = await database.get_user_active_riddle_id(user.id)
-        if riddle_id:
-            # Отправляем текущую загадку (на которой остановился)
-            riddle_data = await database.get_riddle_by_id(riddle_id)
-            if riddle_data:
-                active_riddle = {
-                    "id": riddle_id,
-                    "question": riddle_data["question"],
-                    "answer": riddle_data["answer"],
-                    "hint": riddle_data.get("hint")
-                }
-                await update.message.reply_text(
-                    "✅ <b>Добро пожаловать обратно!</b>\n\n"
-                    "Вы вернулись к текущей загадке.",
-                    parse_mode='HTML',
-                    reply_markup=reply_markup
-                )
-                await send_riddle_to_user(user.id, context.bot, active_riddle=active_riddle, is_new=False)
-            else:
-                # Если загадка не найдена, отправляем новую
-                await update.message.reply_text(
-                    "✅ <b>Добро пожаловать обратно!</b>\n\n"
-                    "Отправляю новую загадку.",
-                    parse_mode='HTML',
-                    reply_markup=reply_markup
-                )
-                await send_riddle_to_user(user.id, context.bot, active_riddle=None, is_new=True)
-        else:
-            # Если нет активной загадки, отправляем новую
-            await update.message.reply_text(
-                "✅ <b>Добро пожаловать обратно!</b>\n\n"
-                "Отправляю новую загадку.",
-                parse_mode='HTML',
-                reply_markup=reply_markup
-            )
-            await send_riddle_to_user(user.id, context.bot, active_riddle=None, is_new=True)
+    # ВАЖНО: Сначала проверяем кнопки ReplyKeyboard (точное совпадение надписи)
+    # Это защищает от списания баллов когда пользователь нажимает кнопку,
+    # и не перехватывает ответы, в которых просто встречаются те же слова
+    route = router.message_router.resolve(user_answer)
+    if route:
+        logger.debug("[КНОПКА] Пользователь %s нажал %r", user.id, route[0])
+        await router.message_router.dispatch(*route, update, context)
         return
     
     # Если дошли до этой точки - значит это ОТВЕТ на загадку, не кнопка
-    logger.info(f"[ОТВЕТ] Пользователь {user.id} отправил ответ: '{user_answer}'")
     
     # Регистрируем пользователя, если его нет
     await database.get_or_create_user(
@@ -705,7 +818,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             await send_riddle_to_user(user.id, context.bot, active_riddle=None, is_new=True)
         except Exception as e:
-            logger.error(f"Ошибка при отправке загадки: {e}")
+            logger.error("Ошибка при отправке загадки: %s", e)
             await update.message.reply_text("Используйте /riddle чтобы получить загадку")
         return
     
@@ -731,13 +844,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # СРАЗУ отправляем НОВУЮ загадку (всегда генерируем новую уникальную)
         try:
-            logger.info(f"[ПРАВИЛЬНЫЙ ОТВЕТ] Генерация и отправка новой уникальной загадки пользователю {user.id}")
+            logger.debug("[ПРАВИЛЬНЫЙ ОТВЕТ] Генерация и отправка новой уникальной загадки пользователю %s", user.id)
             
             # Используем send_riddle_to_user с is_new=True - она сама найдет уникальную загадку
             await send_riddle_to_user(user.id, context.bot, active_riddle=None, is_new=True)
-            logger.info(f"[УСПЕХ] Новая уникальная загадка отправлена пользователю {user.id}")
         except Exception as e:
-            logger.error(f"[ОШИБКА] Не удалось отправить новую загадку пользователю {user.id}: {e}", exc_info=True)
+            logger.error("[ОШИБКА] Не удалось отправить новую загадку пользователю %s: %s", user.id, e, exc_info=True)
             try:
                 await update.message.reply_text("Произошла ошибка. Используйте /riddle для новой загадки")
             except:
@@ -765,7 +877,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if riddle_info:
                 current_riddle = await database.get_riddle_by_id(riddle_info["riddle_id"])
         except Exception as e:
-            logger.error(f"Ошибка при получении информации о загадке: {e}")
+            logger.error("Ошибка при получении информации о загадке: %s", e)
         
         # Проверяем, нужно ли дать подсказку (первая подсказка после 3 ошибок)
         if hints_given == 0 and wrong_attempts >= 3:
@@ -816,46 +928,112 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     
                     # Отмечаем, что рекомендация отправлена сегодня
                     await database.mark_course_recommendation_sent(user.id)
-                    logger.info(f"Рекомендация курса отправлена пользователю {user.id}")
+                    logger.info("Рекомендация курса отправлена пользователю %s", user.id)
                 except Exception as e:
-                    logger.error(f"Ошибка при отправке рекомендации курса: {e}", exc_info=True)
+                    logger.error("Ошибка при отправке рекомендации курса: %s", e, exc_info=True)
             else:
-                logger.info(f"Рекомендация курса уже была отправлена пользователю {user.id} сегодня, пропускаем")
+                logger.debug("Рекомендация курса уже была отправлена пользователю %s сегодня, пропускаем", user.id)
         
         # Если после подсказки было 3 ошибки - отправляем новую загадку
         if hints_given > 0 and wrong_attempts_after_hint >= 3:
             # Удаляем текущую активную загадку
             try:
                 await database.clear_user_active_riddle(user.id)
-                logger.info(f"Удалена активная загадка для пользователя {user.id} после 3 ошибок после подсказки")
+                logger.info("Удалена активная загадка для пользователя %s после 3 ошибок после подсказки", user.id)
             except Exception as e:
-                logger.error(f"Ошибка при удалении активной загадки: {e}")
+                logger.error("Ошибка при удалении активной загадки: %s", e)
             
             # Небольшая задержка, затем отправляем новую загадку
             await asyncio.sleep(0.5)
             
             try:
-                logger.info(f"[3 ОШИБКИ ПОСЛЕ ПОДСКАЗКИ] Отправка новой уникальной загадки пользователю {user.id}")
+                logger.debug("[3 ОШИБКИ ПОСЛЕ ПОДСКАЗКИ] Отправка новой уникальной загадки пользователю %s", user.id)
                 await send_riddle_to_user(user.id, context.bot, active_riddle=None, is_new=True)
-                logger.info(f"[УСПЕХ] Новая уникальная загадка отправлена пользователю {user.id}")
             except Exception as e:
-                logger.error(f"[ОШИБКА] Не удалось отправить новую загадку пользователю {user.id}: {e}", exc_info=True)
+                logger.error("[ОШИБКА] Не удалось отправить новую загадку пользователю %s: %s", user.id, e, exc_info=True)
                 try:
                     await update.message.reply_text("Используйте /riddle для новой загадки")
                 except:
                     pass
 
 
-async def post_init(app: Application):
-    """Инициализация после запуска бота"""
+async def run_in_background(coro, phase: str):
+    """Фоновая задача старта: ошибки логируются, завершение отмечается в фазах старта"""
+    try:
+        await coro
+        startup.mark(phase)
+    except Exception as e:
+        logger.error("Ошибка фоновой задачи старта %s: %s", phase, e, exc_info=True)
+
+
+def start_background(coro, phase: str):
+    task = asyncio.create_task(run_in_background(coro, phase))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def post_init(app: Application, run_jobs: bool = True, metrics_port: int = None):
+    """Инициализация после запуска бота
+    
+    До начала приема апдейтов выполняется только то, без чего их нельзя обработать
+    (схема БД); загадки на день и словари морфологии загружаются в фоне.
+    """
+    # HTTP-сервер метрик и проверок (/metrics, /healthz, /readyz) поднимается первым:
+    # пока идет инициализация, /readyz отвечает 503
+    health.register_routes()
+    await metrics.start_http_server(config.METRICS_PORT if metrics_port is None else metrics_port, config.METRICS_HOST)
+    
+    # Сторож event loop: задержка loop в метрики, стек в лог при блокировке
+    background_tasks.add(health.watchdog.start())
+    
     # Инициализация БД
     await database.init_db()
-    logger.info("База данных инициализирована")
+    startup.mark("init_db")
+    
+    # Каталог загадок из паков - до приема апдейтов (разбор в потоке); затем паки
+    # проверяются на диске, изменения подхватываются на ходу вместе с индексом подбора
+    await riddle_packs.reload()
+    startup.mark("riddles_loaded")
+    start_background(riddle_packs.sync_database(), "riddles_synced")
+    riddle_packs.on_change(riddle_selector.rebuild)
+    watcher = riddle_packs.start_watcher()
+    if watcher is not None:
+        background_tasks.add(watcher)
+    
+    # Индекс подбора загадок по сложности строится в фоне и пересобирается периодически;
+    # до первой сборки загадка выбирается случайно
+    background_tasks.add(riddle_selector.start())
+    
+    # Профилирование по сигналу: kill -USR1 <pid>
+    profiler.install_signal_handler()
     
-    # Генерируем начальный набор загадок
-    await generate_daily_riddles()
+    # Словари pymorphy3 - в фоне, бот уже отвечает. Начальный набор загадок на день
+    # генерирует ведущая реплика при старте планировщика (догон запуска за сегодня)
+    start_background(answer_checker.warmup(), "morph_loaded")
     
-    # Настраиваем планировщик
+    # Задачи планировщика - только в процессе, который за них отвечает, и только
+    # у ведущей реплики: аренда в базе (leader.py), задачи не выполняются дважды
+    if run_jobs:
+        global election
+        election = leader.LeaderElection(
+            leader.SCHEDULER_LEASE,
+            on_elected=partial(start_scheduler, app),
+            on_lost=stop_scheduler
+        )
+        background_tasks.add(election.start())
+    startup.mark("serving")
+
+
+async def post_shutdown(app: Application):
+    """Остановка: отпустить аренду, чтобы другая реплика сразу забрала задачи"""
+    if election is not None:
+        await election.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+
+
+async def start_scheduler(app: Application):
+    """Зарегистрировать и запустить задачи планировщика, догнать пропущенные запуски"""
     # Генерация загадок каждый день в полночь
     scheduler.add_job(
         generate_daily_riddles,
@@ -872,10 +1050,10 @@ async def post_init(app: Application):
         replace_existing=True
     )
     
-    # Выдача грантов топ-10 лидерам каждое воскресенье
+    # Выдача грантов топ-10 лидерам недели - после ее закрытия, по снимку итоговой таблицы
     scheduler.add_job(
         weekly_grant_raffle,
-        trigger=CronTrigger(day_of_week='sun', hour=0, minute=0),
+        trigger=CronTrigger(day_of_week='mon', hour=0, minute=5),
         args=[app],
         id='weekly_grant_distribution',
         replace_existing=True
@@ -890,31 +1068,176 @@ async def post_init(app: Application):
         replace_existing=True
     )
     
-    scheduler.start()
+    # Дозапись строк, накопленных пока Google Sheets был недоступен
+    scheduler.add_job(
+        google_sheets.sync_spool,
+        trigger=IntervalTrigger(minutes=15),
+        id='sync_sheets_spool',
+        replace_existing=True
+    )
+    
+    # Пополнение пула промокодов (первый запуск - сразу после старта)
+    scheduler.add_job(
+        promo_pool.refill_job,
+        trigger=IntervalTrigger(hours=1),
+        next_run_time=datetime.now(),
+        id='refill_promo_pool',
+        replace_existing=True
+    )
+    
+    # Упаковка журнала событий в сегменты
+    scheduler.add_job(
+        events.seal_job,
+        trigger=IntervalTrigger(minutes=events.SEAL_INTERVAL_MINUTES),
+        id='seal_event_log',
+        replace_existing=True
+    )
+    
+    # Резервная копия базы (online backup API, в отдельном потоке)
+    if backups.BACKUP_INTERVAL_HOURS > 0:
+        scheduler.add_job(
+            backups.backup_job,
+            trigger=IntervalTrigger(hours=backups.BACKUP_INTERVAL_HOURS),
+            id='backup_database',
+            replace_existing=True
+        )
+    
+    # Длительность и ошибки задач планировщика попадают в метрики, запуски - в job_runs
+    for job in scheduler.get_jobs():
+        job.modify(func=metrics.job(job.id)(leader_only(job_runs.tracked(job.id, job.trigger)(job.func))))
+    
+    if scheduler.running:
+        scheduler.resume()
+    else:
+        scheduler.start()
+    await job_runs.catch_up(scheduler, CATCH_UP_GRACE, CATCH_UP_DEPENDENCIES)
     logger.info("=" * 60)
     logger.info("✅ ПЛАНИРОВЩИК ЗАПУЩЕН")
     logger.info("=" * 60)
     logger.info("📅 Генерация загадок: каждый день в 00:00 (20 загадок)")
     logger.info("🔄 Очистка турнирной таблицы: каждый понедельник в 00:00 (сброс рейтинга до 1000)")
-    logger.info("🎁 Выдача грантов: каждое воскресенье в 00:00 (топ-10 лидеров, 30 000₽, промокоды)")
+    logger.info("🎁 Выдача грантов: каждый понедельник в 00:05 (топ-10 лидеров закрытой недели, 30 000₽, промокоды)")
     logger.info("⏰ Напоминания о загадках: каждые 3 часа (только неактивным пользователям)")
     logger.info("✨ Новые загадки отправляются сразу после правильного ответа")
     logger.info("=" * 60)
 
 
+def holds_scheduler_lease() -> bool:
+    """Аренда планировщика сейчас точно у этой реплики (без выбора ведущего - всегда да);
+    длинные задачи проверяют ее перед каждым действием с последствиями"""
+    return election is None or election.holds_lease()
+
+
+def leader_only(func):
+    """Задача выполняется, только если аренда планировщика сейчас точно у этой реплики"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not holds_scheduler_lease():
+            logger.warning("Задача %s пропущена: аренда планировщика не у этой реплики", func.__name__)
+            return None
+        return await func(*args, **kwargs)
+    return wrapper
+
+
+def stop_scheduler():
+    """Снять задачи планировщика (реплика перестала быть ведущей)"""
+    if scheduler.running:
+        scheduler.pause()
+    scheduler.remove_all_jobs()
+    logger.warning("⏸ Планировщик остановлен: реплика больше не ведущая")
+
+
+def build_application(run_jobs: bool = True, metrics_port: int = None) -> Application:
+    """Создать приложение со всеми обработчиками (используется и нагрузочным тестом)
+    
+    run_jobs=False - без планировщика и начального набора загадок (воркер шарда, кроме первого);
+    metrics_port - порт HTTP-сервера метрик вместо config.METRICS_PORT.
+    """
+    # Время функций database попадает в метрики
+    metrics.instrument_module(database)
+    
+    # Апдейты разных пользователей обрабатываются конкурентно,
+    # апдейты одного пользователя - строго по очереди (см. user_locks)
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))
+        .concurrent_updates(config.CONCURRENT_UPDATES)
+        .post_init(partial(post_init, run_jobs=run_jobs, metrics_port=metrics_port))
+        .post_shutdown(post_shutdown)
+    )
+    if config.TELEGRAM_API_URL:
+        builder = builder.base_url(config.TELEGRAM_API_URL)
+    application = builder.build()
+    
+    # Регистрируем обработчики (время считается вместе с ожиданием очереди пользователя)
+    def wrap(name, callback):
+        return startup.track_first_reply(metrics.handler(name)(per_user(query_log.track_update(name)(callback))))
+    
+    application.add_handler(CommandHandler("start", wrap("start", start)))
+    application.add_handler(CommandHandler("riddle", wrap("riddle", riddle)))
+    application.add_handler(CommandHandler("stats", wrap("stats", stats)))
+    application.add_handler(CommandHandler("leaderboard", wrap("leaderboard", leaderboard)))
+    application.add_handler(CommandHandler("history", wrap("history", history)))
+    application.add_handler(CommandHandler("hint", wrap("hint", hint)))
+    # Служебные команды - с метриками, но без очереди пользователя: долгие из них
+    # (/export, /profile) работают в фоне и не должны задерживать другие команды админа
+    def wrap_admin(name, callback):
+        return metrics.handler(name)(callback)
+    
+    application.add_handler(CommandHandler("querylog", wrap_admin("querylog", querylog_command)))
+    application.add_handler(CommandHandler("profile", wrap_admin("profile", profile_command)))
+    application.add_handler(CommandHandler("jobs", wrap_admin("jobs", jobs_command)))
+    application.add_handler(CommandHandler("export", wrap_admin("export", export_command)))
+    application.add_handler(CommandHandler("riddlestats", wrap_admin("riddlestats", riddlestats_command)))
+    application.add_handler(CallbackQueryHandler(wrap("handle_callback", handle_callback)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, wrap("handle_message", handle_message)))
+    return application
+
+
+async def run_scheduler():
+    """Режим RUN_MODE=scheduler: только задачи планировщика, без приема апдейтов
+    
+    Апдейты обрабатывает другой процесс (RUN_MODE=bot) с той же базой; массовые рассылки
+    идут отсюда через sender, поэтому его лимит частоты не делится между процессами.
+    """
+    application = build_application(run_jobs=True)
+    await application.initialize()
+    await application.post_init(application)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    await stop.wait()
+    
+    logger.info("Остановка процесса задач планировщика...")
+    await post_shutdown(application)
+    await application.shutdown()
+
+
 def main():
     """Главная функция запуска бота"""
-    # Создаем приложение
-    application = Application.builder().token(config.BOT_TOKEN).post_init(post_init).build()
-    
-    # Регистрируем обработчики
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("riddle", riddle))
-    application.add_handler(CommandHandler("stats", stats))
-    application.add_handler(CommandHandler("leaderboard", leaderboard))
-    application.add_handler(CommandHandler("hint", hint))
-    application.add_handler(CallbackQueryHandler(handle_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    logging_setup.setup_logging(config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_ANSWER_SAMPLE_RATE)
+    startup.mark("imports")
+    
+    # Отдельный процесс задач: апдейты обрабатывает процесс с RUN_MODE=bot
+    if config.RUN_MODE == "scheduler":
+        logger.info("Запуск процесса задач планировщика...")
+        asyncio.run(run_scheduler())
+        return
+    
+    # Несколько воркеров: этот процесс только принимает апдейты и раздает их (shards.py)
+    if config.WORKERS > 1:
+        logger.info("Запуск бота: фронт и %d воркеров...", config.WORKERS)
+        shards.run(config.WORKERS)
+        return
+    
+    application = build_application(run_jobs=config.RUN_MODE == "all")
+    startup.mark("application_built")
     
     # Запускаем бота
     logger.info("Запуск бота...")
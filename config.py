@@ -14,3 +14,33 @@ BOT_NAME = os.getenv("BOT_NAME", "riddle_bbe_bot")
 GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID", "")
 GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "credentials.json")
 
+
+# Сколько апдейтов обрабатывать одновременно (апдейты одного пользователя всегда идут по очереди)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+
+# Режим запуска: "all" - апдейты и задачи планировщика в одном процессе; "bot" - только апдейты;
+# "scheduler" - только задачи (отдельный процесс с той же базой, апдейты обрабатывает процесс "bot")
+RUN_MODE = os.getenv("RUN_MODE", "all")
+if RUN_MODE not in ("all", "bot", "scheduler"):
+    raise ValueError(f"RUN_MODE must be one of: all, bot, scheduler (got {RUN_MODE!r})")
+
+# Число процессов-воркеров: больше 1 - фронт принимает апдейты и раздает их воркерам
+# по хешу user_id (см. shards.py), каждый воркер занимает свое ядро
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Адрес и порт HTTP-сервера метрик и проверок (/metrics, /healthz, /readyz); порт 0 - не запускать.
+# По умолчанию сервер слушает только localhost: наружу (например, для healthcheck Railway)
+# его открывают явно - METRICS_HOST=0.0.0.0 и METRICS_PORT, равный выданному PORT
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Telegram ID администраторов через запятую (служебные команды)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if user_id}
+
+# Адрес Bot API (для локального сервера Bot API или нагрузочного теста), например http://127.0.0.1:8081/bot
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Логирование: уровень, формат вывода ("text" или "json") и доля DEBUG-записей о каждом ответе
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_ANSWER_SAMPLE_RATE = float(os.getenv("LOG_ANSWER_SAMPLE_RATE", "0.1"))
@@ -1,15 +1,173 @@
 import aiosqlite
 import asyncio
-from datetime import datetime
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 import answer_checker
+import logging_setup
+import metrics
+import query_log
 
-DB_PATH = "riddle_bot.db"
+logger = logging.getLogger(__name__)
+answer_log = logging.getLogger(logging_setup.ANSWER_LOGGER)
+
+# Путь к базе; процессы-воркеры (shards.py) работают с одним файлом
+DB_PATH = os.getenv("DB_PATH", "riddle_bot.db")
+
+# Сколько ждать освобождения блокировки записи другим соединением (секунды)
+BUSY_TIMEOUT = 30
+
+# Рейтинг в начале каждого сезона (недели)
+INITIAL_RATING = 1000
+
+# Текущий сезон рейтинга - последний в таблице seasons
+CURRENT_SEASON = "(SELECT MAX(id) FROM seasons)"
+
+# Изменить рейтинг пользователя в текущем сезоне на delta (не ниже 0). Строка сезона
+# создается при первом изменении, до этого рейтинг пользователя - INITIAL_RATING
+CHANGE_RATING_SQL = f"""
+    INSERT INTO season_ratings (season_id, user_id, rating)
+    VALUES ({CURRENT_SEASON}, :user_id, MAX(0, {INITIAL_RATING} + :delta))
+    ON CONFLICT (season_id, user_id) DO UPDATE SET rating = MAX(0, season_ratings.rating + :delta)
+"""
+
+# Снимок итоговой таблицы закрываемого сезона :season_id, начатого на неделе :week_date.
+# Выполняется только при закрытии сезона (reset_weekly_ratings), в одной транзакции с началом
+# следующего: открытый сезон в снимок не попадает. Пишется один раз: если снимок недели уже
+# есть, ничего не меняется
+SNAPSHOT_LEADERBOARD_SQL = """
+    INSERT INTO leaderboard_snapshots
+        (week_date, position, season_id, user_id, username, first_name, rating, total_riddles_solved)
+    SELECT :week_date, ROW_NUMBER() OVER (ORDER BY sr.rating DESC, u.total_riddles_solved DESC, sr.user_id),
+           sr.season_id, sr.user_id, u.username, u.first_name, sr.rating, u.total_riddles_solved
+    FROM season_ratings sr
+    JOIN users u ON u.user_id = sr.user_id
+    WHERE sr.season_id = :season_id
+      AND NOT EXISTS (SELECT 1 FROM leaderboard_snapshots WHERE week_date = :week_date)
+"""
+
+# Сколько событий журнала упаковывается в один сегмент event_segments
+EVENT_SEGMENT_SIZE = 4096
+
+APPEND_EVENT_SQL = "INSERT INTO events (created_at, type, user_id, data) VALUES (?, ?, ?, ?)"
+
+# Начало журнала для базы, созданной до его появления: текущее состояние проекций
+# (сезоны, счетчики пользователей, рейтинги, активные загадки) как события *_imported
+_EVENT_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+EVENT_BASELINE_SQL = [
+    f"""INSERT INTO events (created_at, type, user_id, data)
+        SELECT {_EVENT_NOW}, 'season_started', NULL, json_object('season_id', id)
+        FROM seasons ORDER BY id""",
+    f"""INSERT INTO events (created_at, type, user_id, data)
+        SELECT {_EVENT_NOW}, 'user_imported', user_id, json_object(
+            'username', username, 'first_name', first_name,
+            'solved', COALESCE(total_riddles_solved, 0), 'attempted', COALESCE(total_riddles_attempted, 0),
+            'hints', COALESCE(total_hints_used, 0))
+        FROM users ORDER BY user_id""",
+    f"""INSERT INTO events (created_at, type, user_id, data)
+        SELECT {_EVENT_NOW}, 'rating_imported', user_id, json_object('season_id', season_id, 'rating', rating)
+        FROM season_ratings ORDER BY season_id, user_id""",
+    f"""INSERT INTO events (created_at, type, user_id, data)
+        SELECT {_EVENT_NOW}, 'riddle_imported', user_id, json_object(
+            'riddle_id', riddle_id, 'wrong_attempts', COALESCE(wrong_attempts, 0),
+            'hints_given', COALESCE(hints_given, 0), 'started_at', started_at)
+        FROM user_active_riddles ORDER BY user_id, riddle_id""",
+]
+
+# Рейтинг пользователя u в текущем сезоне
+USER_RATING_SQL = f"""COALESCE(
+    (SELECT rating FROM season_ratings WHERE season_id = {CURRENT_SEASON} AND user_id = u.user_id),
+    {INITIAL_RATING}
+)"""
+
+# Счетчики загадки (riddle_stats) - прибавить к строке загадки, создав ее при первом событии
+RIDDLE_STATS_COLUMNS = ("assigned", "attempts", "correct", "solved", "solve_attempts", "hints", "abandoned")
+BUMP_RIDDLE_STATS_SQL = f"""
+    INSERT INTO riddle_stats (riddle_id, {", ".join(RIDDLE_STATS_COLUMNS)})
+    VALUES (:riddle_id, {", ".join(":" + column for column in RIDDLE_STATS_COLUMNS)})
+    ON CONFLICT(riddle_id) DO UPDATE SET
+        {", ".join(f"{column} = {column} + excluded.{column}" for column in RIDDLE_STATS_COLUMNS)}
+"""
+
+# Начальные счетчики по истории попыток (миграция). Назначения восстанавливаются как пары
+# пользователь-загадка из attempts и активных загадок, подсказки - только по активным,
+# брошенные загадки до появления счетчиков неизвестны
+RIDDLE_STATS_BACKFILL_SQL = """
+    INSERT INTO riddle_stats (riddle_id, assigned, attempts, correct, solved, solve_attempts, hints, abandoned)
+    WITH pairs AS (
+        SELECT riddle_id, user_id, COUNT(*) AS attempts, SUM(is_correct = 1) AS correct,
+               MIN(CASE WHEN is_correct = 1 THEN attempt_number END) AS solved_at
+        FROM attempts
+        WHERE riddle_id IS NOT NULL
+        GROUP BY riddle_id, user_id
+    ),
+    assigned AS (
+        SELECT riddle_id, user_id FROM pairs
+        UNION
+        SELECT riddle_id, user_id FROM user_active_riddles
+    )
+    SELECT a.riddle_id, COUNT(*), COALESCE(SUM(p.attempts), 0), COALESCE(SUM(p.correct), 0),
+           COUNT(p.solved_at), COALESCE(SUM(p.solved_at), 0), COALESCE(SUM(uar.hints_given), 0), 0
+    FROM assigned a
+    LEFT JOIN pairs p ON p.riddle_id = a.riddle_id AND p.user_id = a.user_id
+    LEFT JOIN user_active_riddles uar ON uar.riddle_id = a.riddle_id AND uar.user_id = a.user_id
+    GROUP BY a.riddle_id
+"""
+
+# Сортировки отчета о сложности загадок (колонки представления riddle_difficulty)
+RIDDLE_STATS_ORDERS = {
+    "hard": "solve_rate ASC",
+    "easy": "solve_rate DESC",
+    "attempts": "mean_attempts DESC",
+    "hints": "hint_rate DESC",
+    "abandon": "abandon_rate DESC",
+}
+
+# Таблицы, которые можно выгрузить целиком (exports.py): порядок строк - порядок хранения
+EXPORT_TABLES = ("attempts", "users", "grants")
+
+# Сколько строк читать из курсора выгрузки за раз
+EXPORT_BATCH_SIZE = 5000
+
+
+def connect():
+    """Открыть соединение с базой (с записью запросов, если включен query_log)"""
+    return query_log.wrap_connection(aiosqlite.connect(DB_PATH, timeout=BUSY_TIMEOUT))
+
+
+async def _append_event(db, event_type: str, user_id: int = None, **data):
+    """Добавить событие в журнал в транзакции db - вместе с изменением, которое оно описывает"""
+    await db.execute(
+        APPEND_EVENT_SQL,
+        (time.time(), event_type, user_id, json.dumps(data, ensure_ascii=False) if data else None)
+    )
+
+
+async def _bump_riddle_stats(db, riddle_id: int, **counters):
+    """Прибавить к счетчикам загадки в транзакции db (не названные счетчики - 0)"""
+    params = {column: counters.get(column, 0) for column in RIDDLE_STATS_COLUMNS}
+    params["riddle_id"] = riddle_id
+    await db.execute(BUMP_RIDDLE_STATS_SQL, params)
 
 
 async def init_db():
     """Инициализация базы данных"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
+        # WAL: читатели не блокируют писателя, апдейты разных пользователей
+        # обрабатываются конкурентно без "database is locked"
+        cursor = await db.execute("PRAGMA journal_mode=WAL")
+        journal_mode = (await cursor.fetchone())[0]
+        if journal_mode.lower() != "wal":
+            # Например, база на сетевой файловой системе: конкурентные апдейты
+            # (CONCURRENT_UPDATES) будут упираться в блокировку записи
+            logger.warning("SQLite не включила WAL (journal_mode=%s): конкурентные апдейты "
+                           "могут получать 'database is locked'", journal_mode)
+        await db.execute("PRAGMA synchronous=NORMAL")
+        
         # Таблица загадок
         await db.execute("""
             CREATE TABLE IF NOT EXISTS riddles (
@@ -22,6 +180,9 @@ async def init_db():
             )
         """)
         
+        # Загадки ищутся по тексту вопроса (одна загадка каталога - много строк)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_riddles_question ON riddles (question)")
+        
         # Таблица пользователей
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -31,6 +192,7 @@ async def init_db():
                 total_riddles_solved INTEGER DEFAULT 0,
                 total_riddles_attempted INTEGER DEFAULT 0,
                 total_hints_used INTEGER DEFAULT 0,
+                -- рейтинг до появления сезонов, теперь - season_ratings
                 rating INTEGER DEFAULT 1000,
                 joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 last_course_recommendation_date DATE,
@@ -98,12 +260,214 @@ async def init_db():
             )
         """)
         
+        # Миграция: этапы выдачи гранта (выгрузка в Google Sheets и уведомление)
+        try:
+            await db.execute("ALTER TABLE grants ADD COLUMN exported_at TIMESTAMP")
+            await db.execute("ALTER TABLE grants ADD COLUMN notified_at TIMESTAMP")
+            # Гранты, выданные до появления этапов, считаются полностью обработанными
+            await db.execute("UPDATE grants SET exported_at = created_at, notified_at = created_at")
+            await db.commit()
+        except Exception:
+            # Поля уже существуют, игнорируем ошибку
+            pass
+        
+        # Один грант на пользователя за неделю; поиск грантов по пользователю
+        await db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_grants_week_user ON grants (week_date, user_id)"
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_grants_user ON grants (user_id)")
+        # Незавершенные гранты любой недели (get_pending_grants): в индексе только они
+        await db.execute(
+            """CREATE INDEX IF NOT EXISTS idx_grants_pending ON grants (id)
+               WHERE promo_code IS NULL OR exported_at IS NULL OR notified_at IS NULL"""
+        )
+        
+        # Пул заранее сгенерированных промокодов (grant_id IS NULL - код свободен)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS promo_codes (
+                code TEXT PRIMARY KEY,
+                grant_id INTEGER UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                issued_at TIMESTAMP,
+                FOREIGN KEY (grant_id) REFERENCES grants(id)
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_promo_codes_free ON promo_codes (code) WHERE grant_id IS NULL"
+        )
+        # Промокоды, выданные до появления пула, тоже занимают место в уникальном индексе
+        await db.execute(
+            """INSERT OR IGNORE INTO promo_codes (code, grant_id, created_at, issued_at)
+               SELECT promo_code, id, created_at, created_at FROM grants
+               WHERE promo_code IS NOT NULL"""
+        )
+        
+        # Сезоны рейтинга: еженедельный сброс - новая строка в seasons, а рейтинг
+        # пользователя за сезон появляется при его первом ответе в этом сезоне
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS seasons (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                week_date DATE
+            )
+        """)
+        # Миграция: неделя сезона (дата понедельника), по ней ищутся снимки таблицы лидеров
+        try:
+            await db.execute("ALTER TABLE seasons ADD COLUMN week_date DATE")
+            await db.execute(
+                "UPDATE seasons SET week_date = date(started_at, 'localtime', '-6 days', 'weekday 1')"
+            )
+            await db.commit()
+        except Exception:
+            # Поле уже существует, игнорируем ошибку
+            pass
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS season_ratings (
+                season_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                rating INTEGER NOT NULL,
+                PRIMARY KEY (season_id, user_id)
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_season_ratings_rank ON season_ratings (season_id, rating DESC)"
+        )
+        # Миграция: первый сезон получает рейтинги, которые до сезонов хранились в users
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO seasons (id, week_date) VALUES (1, ?)", (current_week_date(),)
+        )
+        if cursor.rowcount:
+            await db.execute(
+                """INSERT OR IGNORE INTO season_ratings (season_id, user_id, rating)
+                   SELECT 1, user_id, COALESCE(rating, ?) FROM users""",
+                (INITIAL_RATING,)
+            )
+        
+        # Итоговые таблицы лидеров прошлых недель: пишутся один раз при закрытии недели
+        # и больше не меняются (история и розыгрыш не зависят от текущих рейтингов)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS leaderboard_snapshots (
+                week_date DATE NOT NULL,
+                position INTEGER NOT NULL,
+                season_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                rating INTEGER NOT NULL,
+                total_riddles_solved INTEGER,
+                PRIMARY KEY (week_date, position)
+            ) WITHOUT ROWID
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_leaderboard_snapshots_season ON leaderboard_snapshots (season_id)"
+        )
+        for action in ("UPDATE", "DELETE"):
+            await db.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS leaderboard_snapshots_no_{action.lower()}
+                BEFORE {action} ON leaderboard_snapshots
+                BEGIN
+                    SELECT RAISE(ABORT, 'leaderboard_snapshots is append-only');
+                END
+            """)
+        
+        # Журнал событий (см. events.py): только дописывается, seq не переиспользуется.
+        # Полные пачки старых событий упаковываются в сегменты event_segments
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                type TEXT NOT NULL,
+                user_id INTEGER,
+                data TEXT
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS event_segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                first_seq INTEGER NOT NULL UNIQUE,
+                last_seq INTEGER NOT NULL,
+                events INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                body BLOB NOT NULL
+            )
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS event_segments_no_update
+            BEFORE UPDATE ON event_segments
+            BEGIN
+                SELECT RAISE(ABORT, 'event_segments is append-only');
+            END
+        """)
+        # Миграция: журнал начинается с текущего состояния базы
+        cursor = await db.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM events) AND NOT EXISTS (SELECT 1 FROM event_segments)"
+        )
+        if (await cursor.fetchone())[0]:
+            for statement in EVENT_BASELINE_SQL:
+                await db.execute(statement)
+        
+        # Сложность загадок: счетчики обновляются в той же транзакции, что и назначение,
+        # проверка ответа, подсказка и отказ от загадки; по строке на загадку
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS riddle_stats (
+                riddle_id INTEGER PRIMARY KEY,
+                assigned INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                correct INTEGER NOT NULL DEFAULT 0,
+                solved INTEGER NOT NULL DEFAULT 0,
+                solve_attempts INTEGER NOT NULL DEFAULT 0,
+                hints INTEGER NOT NULL DEFAULT 0,
+                abandoned INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Доли и средние для админов: SELECT * FROM riddle_difficulty ORDER BY solve_rate
+        await db.execute("""
+            CREATE VIEW IF NOT EXISTS riddle_difficulty AS
+            SELECT riddle_id, assigned, attempts, correct, solved, hints, abandoned,
+                   CAST(solved AS REAL) / NULLIF(assigned, 0) AS solve_rate,
+                   CAST(solve_attempts AS REAL) / NULLIF(solved, 0) AS mean_attempts,
+                   CAST(hints AS REAL) / NULLIF(assigned, 0) AS hint_rate,
+                   CAST(abandoned AS REAL) / NULLIF(assigned, 0) AS abandon_rate
+            FROM riddle_stats
+        """)
+        # Миграция: счетчики по уже накопленным попыткам
+        cursor = await db.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM riddle_stats) AND EXISTS (SELECT 1 FROM attempts)"
+        )
+        if (await cursor.fetchone())[0]:
+            await db.execute(RIDDLE_STATS_BACKFILL_SQL)
+        
+        # Запуски задач планировщика (см. job_runs.py): слот - время запуска по расписанию
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS job_runs (
+                job_id TEXT NOT NULL,
+                slot TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP,
+                error TEXT,
+                PRIMARY KEY (job_id, slot)
+            )
+        """)
+        
+        # Аренды (выбор ведущей реплики, см. leader.py); term растет при каждой смене держателя
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                term INTEGER NOT NULL DEFAULT 1,
+                expires_at REAL NOT NULL,
+                renewed_at REAL NOT NULL
+            )
+        """)
+        
         await db.commit()
 
 
 async def add_riddle(question: str, answer: str, hint: str = None):
     """Добавить новую загадку"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         await db.execute(
             "INSERT INTO riddles (question, answer, hint) VALUES (?, ?, ?)",
             (question, answer, hint)
@@ -114,9 +478,41 @@ async def add_riddle(question: str, answer: str, hint: str = None):
         return result[0] if result else None
 
 
+async def add_riddles(riddles: List[Dict]) -> int:
+    """Добавить несколько загадок одной транзакцией; возвращает количество"""
+    async with connect() as db:
+        await db.executemany(
+            "INSERT INTO riddles (question, answer, hint) VALUES (?, ?, ?)",
+            [(riddle["question"], riddle["answer"], riddle.get("hint")) for riddle in riddles]
+        )
+        await db.commit()
+        return len(riddles)
+
+
+async def update_riddles_content(riddles: List[Dict]) -> int:
+    """Привести ответ и подсказку строк riddles к загадкам с теми же вопросами (паки
+    riddle_packs.py); меняются только отличающиеся строки, возвращается их число"""
+    content = json.dumps(
+        [[riddle["question"], riddle["answer"], riddle.get("hint")] for riddle in riddles], ensure_ascii=False
+    )
+    async with connect() as db:
+        cursor = await db.execute(
+            """UPDATE riddles SET answer = c.answer, hint = c.hint
+               FROM (
+                   SELECT value ->> 0 AS question, value ->> 1 AS answer, value ->> 2 AS hint
+                   FROM json_each(?)
+               ) AS c
+               WHERE riddles.question = c.question
+                 AND (riddles.answer IS NOT c.answer OR riddles.hint IS NOT c.hint)""",
+            (content,)
+        )
+        await db.commit()
+        return cursor.rowcount
+
+
 async def get_active_riddle():
     """Получить текущую активную загадку"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
             "SELECT id, question, answer, hint FROM riddles WHERE is_active = 1 ORDER BY created_at DESC LIMIT 1"
         )
@@ -133,7 +529,7 @@ async def get_active_riddle():
 
 async def get_riddle_by_id(riddle_id: int) -> Optional[Dict]:
     """Получить загадку по ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
             "SELECT id, question, answer, hint FROM riddles WHERE id = ?",
             (riddle_id,)
@@ -151,7 +547,7 @@ async def get_riddle_by_id(riddle_id: int) -> Optional[Dict]:
 
 async def get_riddle_by_question(question: str) -> Optional[Dict]:
     """Получить загадку по вопросу"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
             "SELECT id, question, answer, hint FROM riddles WHERE question = ?",
             (question,)
@@ -169,7 +565,7 @@ async def get_riddle_by_question(question: str) -> Optional[Dict]:
 
 async def user_has_seen_riddle(user_id: int, question: str) -> bool:
     """Проверить, видел ли пользователь эту загадку (решил или пытался решить)"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         # Проверяем, есть ли попытки пользователя для загадки с таким вопросом
         cursor = await db.execute(
             """SELECT COUNT(*) FROM attempts a
@@ -195,7 +591,7 @@ async def user_has_seen_riddle(user_id: int, question: str) -> bool:
 
 async def get_unsolved_riddle_for_user(user_id: int) -> Optional[Dict]:
     """Получить нерешенную загадку для пользователя (которую пользователь еще не видел)"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         # Получаем загадки, которые пользователь еще не видел (не решал и не пытался решить)
         cursor = await db.execute(
             """SELECT r.id, r.question, r.answer, r.hint
@@ -228,9 +624,12 @@ async def get_unsolved_riddle_for_user(user_id: int) -> Optional[Dict]:
 
 async def get_or_create_user(user_id: int, username: str = None, first_name: str = None):
     """Получить или создать пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
-            "SELECT * FROM users WHERE user_id = ?", (user_id,)
+            f"""SELECT user_id, username, first_name, total_riddles_solved, total_riddles_attempted,
+                       total_hints_used, {USER_RATING_SQL}
+                FROM users u WHERE user_id = ?""",
+            (user_id,)
         )
         user = await cursor.fetchone()
         
@@ -239,6 +638,7 @@ async def get_or_create_user(user_id: int, username: str = None, first_name: str
                 "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
                 (user_id, username, first_name)
             )
+            await _append_event(db, "user_created", user_id, username=username, first_name=first_name)
             await db.commit()
             return {
                 "user_id": user_id,
@@ -247,7 +647,7 @@ async def get_or_create_user(user_id: int, username: str = None, first_name: str
                 "total_riddles_solved": 0,
                 "total_riddles_attempted": 0,
                 "total_hints_used": 0,
-                "rating": 1000
+                "rating": INITIAL_RATING
             }
         
         return {
@@ -263,19 +663,31 @@ async def get_or_create_user(user_id: int, username: str = None, first_name: str
 
 async def set_user_active_riddle(user_id: int, riddle_id: int):
     """Установить активную загадку для пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            """INSERT OR REPLACE INTO user_active_riddles 
+    async with connect() as db:
+        cursor = await db.execute(
+            """INSERT OR IGNORE INTO user_active_riddles 
                (user_id, riddle_id, wrong_attempts, hints_given) 
                VALUES (?, ?, 0, 0)""",
             (user_id, riddle_id)
         )
+        if cursor.rowcount:
+            await _bump_riddle_stats(db, riddle_id, assigned=1)
+        else:
+            # Та же загадка снова (возвращение после /stop) - счетчики начинаются заново,
+            # но новым назначением для статистики загадки это не считается
+            await db.execute(
+                """UPDATE user_active_riddles
+                   SET wrong_attempts = 0, hints_given = 0, started_at = CURRENT_TIMESTAMP
+                   WHERE user_id = ? AND riddle_id = ?""",
+                (user_id, riddle_id)
+            )
+        await _append_event(db, "riddle_assigned", user_id, riddle_id=riddle_id)
         await db.commit()
 
 
 async def check_answer(user_id: int, answer: str) -> Dict:
     """Проверить ответ пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         # Получить активную загадку пользователя
         cursor = await db.execute(
             """SELECT uar.riddle_id, uar.wrong_attempts, uar.hints_given, 
@@ -286,6 +698,9 @@ async def check_answer(user_id: int, answer: str) -> Dict:
             (user_id,)
         )
         result = await cursor.fetchone()
+        # Строк может быть несколько: закрываем курсор, чтобы не держать снимок чтения
+        # до записи ниже (в WAL это сразу дает "database is locked")
+        await cursor.close()
         
         if not result:
             return {"error": "Нет активной загадки"}
@@ -303,22 +718,27 @@ async def check_answer(user_id: int, answer: str) -> Dict:
         user_answer_clean = answer.strip() if answer else ""
         correct_answer_clean = correct_answer.strip() if correct_answer else ""
         
-        # Логирование перед проверкой
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"[ПРОВЕРКА ОТВЕТА] User ID: {user_id}, Riddle ID: {riddle_db_id}")
-        logger.info(f"[ПРОВЕРКА ОТВЕТА] Ответ пользователя (raw): '{answer}' -> (clean): '{user_answer_clean}'")
-        logger.info(f"[ПРОВЕРКА ОТВЕТА] Правильный ответ (raw): '{correct_answer}' -> (clean): '{correct_answer_clean}'")
+        # Словари морфологии грузятся в фоне при старте; если ответ пришел раньше,
+        # ждем загрузку в потоке, не блокируя event loop
+        if not answer_checker.is_ready():
+            await answer_checker.warmup()
         
         # Гибкая проверка ответа с учетом морфологии
         try:
+            check_started = time.perf_counter()
             is_correct = answer_checker.check_answer_flexible(user_answer_clean, correct_answer_clean)
-            logger.info(f"[ПРОВЕРКА ОТВЕТА] Результат: {is_correct}")
+            metrics.ANSWER_CHECK_SECONDS.observe(time.perf_counter() - check_started)
         except Exception as e:
-            logger.error(f"[ОШИБКА ПРОВЕРКИ] {e}", exc_info=True)
+            logger.error("[ОШИБКА ПРОВЕРКИ] %s", e, exc_info=True)
             # В случае ошибки проверки, делаем простую проверку
             is_correct = user_answer_clean.lower().strip() == correct_answer_clean.lower().strip()
-            logger.warning(f"[FALLBACK] Простая проверка: {is_correct}")
+            logger.warning("[FALLBACK] Простая проверка: %s", is_correct)
+        
+        # Подробности о каждом ответе - DEBUG с выборкой (LOG_ANSWER_SAMPLE_RATE)
+        answer_log.debug(
+            "[ПРОВЕРКА ОТВЕТА] User ID: %s, Riddle ID: %s, ответ: %r, правильный: %r, результат: %s",
+            user_id, riddle_db_id, user_answer_clean, correct_answer_clean, is_correct
+        )
         
         # Получить номер попытки
         cursor = await db.execute(
@@ -334,6 +754,16 @@ async def check_answer(user_id: int, answer: str) -> Dict:
             (user_id, riddle_db_id, answer, is_correct, attempt_number)
         )
         
+        first_solve = bool(is_correct and not already_solved)
+        rating_delta = 10 if first_solve else (0 if is_correct else -5)
+        await _append_event(
+            db, "answer_checked", user_id,
+            riddle_id=riddle_id, correct=bool(is_correct), first_solve=first_solve, rating_delta=rating_delta
+        )
+        await _bump_riddle_stats(
+            db, riddle_db_id, attempts=1, correct=int(bool(is_correct)), solved=int(first_solve),
+            solve_attempts=attempt_number if first_solve else 0
+        )
         if is_correct:
             # Если загадка уже была решена, не даем баллы
             if not already_solved:
@@ -341,11 +771,11 @@ async def check_answer(user_id: int, answer: str) -> Dict:
                 await db.execute(
                     """UPDATE users 
                        SET total_riddles_solved = total_riddles_solved + 1,
-                           total_riddles_attempted = total_riddles_attempted + 1,
-                           rating = rating + 10
+                           total_riddles_attempted = total_riddles_attempted + 1
                        WHERE user_id = ?""",
                     (user_id,)
                 )
+                await db.execute(CHANGE_RATING_SQL, {"user_id": user_id, "delta": rating_delta})
             else:
                 # Если уже решена, только обновляем счетчик попыток (без баллов)
                 await db.execute(
@@ -367,12 +797,10 @@ async def check_answer(user_id: int, answer: str) -> Dict:
             )
             # Обновить статистику попыток и уменьшить рейтинг на 5 баллов
             await db.execute(
-                """UPDATE users 
-                   SET total_riddles_attempted = total_riddles_attempted + 1,
-                       rating = MAX(0, rating - 5)
-                   WHERE user_id = ?""",
+                "UPDATE users SET total_riddles_attempted = total_riddles_attempted + 1 WHERE user_id = ?",
                 (user_id,)
             )
+            await db.execute(CHANGE_RATING_SQL, {"user_id": user_id, "delta": rating_delta})
         
         await db.commit()
         
@@ -393,7 +821,7 @@ async def check_answer(user_id: int, answer: str) -> Dict:
 
 async def get_user_active_riddle_info(user_id: int) -> Optional[Dict]:
     """Получить информацию об активной загадке пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
             """SELECT uar.riddle_id, uar.wrong_attempts, uar.hints_given
                FROM user_active_riddles uar
@@ -414,7 +842,7 @@ async def get_user_active_riddle_info(user_id: int) -> Optional[Dict]:
 
 async def get_hint(user_id: int) -> Optional[str]:
     """Получить подсказку для пользователя (если есть 3+ ошибки)"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
             """SELECT uar.riddle_id, uar.wrong_attempts, uar.hints_given, r.hint
                FROM user_active_riddles uar
@@ -423,6 +851,7 @@ async def get_hint(user_id: int) -> Optional[str]:
             (user_id,)
         )
         result = await cursor.fetchone()
+        await cursor.close()
         
         if not result:
             return None
@@ -440,6 +869,8 @@ async def get_hint(user_id: int) -> Optional[str]:
                 "UPDATE users SET total_hints_used = total_hints_used + 1 WHERE user_id = ?",
                 (user_id,)
             )
+            await _append_event(db, "hint_given", user_id, riddle_id=riddle_id)
+            await _bump_riddle_stats(db, riddle_id, hints=1)
             await db.commit()
             return hint
         
@@ -447,13 +878,15 @@ async def get_hint(user_id: int) -> Optional[str]:
 
 
 async def get_leaderboard(limit: int = 10) -> List[Dict]:
-    """Получить таблицу лидеров"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Получить таблицу лидеров текущего сезона"""
+    async with connect() as db:
         cursor = await db.execute(
-            """SELECT user_id, username, first_name, rating, total_riddles_solved
-               FROM users
-               ORDER BY rating DESC, total_riddles_solved DESC
-               LIMIT ?""",
+            f"""SELECT u.user_id, u.username, u.first_name, sr.rating, u.total_riddles_solved
+                FROM season_ratings sr
+                JOIN users u ON u.user_id = sr.user_id
+                WHERE sr.season_id = {CURRENT_SEASON}
+                ORDER BY sr.rating DESC, u.total_riddles_solved DESC
+                LIMIT ?""",
             (limit,)
         )
         results = await cursor.fetchall()
@@ -472,7 +905,7 @@ async def get_leaderboard(limit: int = 10) -> List[Dict]:
 async def should_send_course_recommendation(user_id: int) -> bool:
     """Проверить, нужно ли отправить рекомендацию курса (только раз в день)"""
     from datetime import date
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
             "SELECT last_course_recommendation_date FROM users WHERE user_id = ?",
             (user_id,)
@@ -496,7 +929,7 @@ async def should_send_course_recommendation(user_id: int) -> bool:
 async def mark_course_recommendation_sent(user_id: int):
     """Отметить, что рекомендация курса была отправлена сегодня"""
     from datetime import date
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         today = date.today().isoformat()
         await db.execute(
             "UPDATE users SET last_course_recommendation_date = ? WHERE user_id = ?",
@@ -507,9 +940,12 @@ async def mark_course_recommendation_sent(user_id: int):
 
 async def get_user_stats(user_id: int) -> Optional[Dict]:
     """Получить статистику пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
-            "SELECT * FROM users WHERE user_id = ?", (user_id,)
+            f"""SELECT user_id, username, first_name, total_riddles_solved, total_riddles_attempted,
+                       total_hints_used, {USER_RATING_SQL}
+                FROM users u WHERE user_id = ?""",
+            (user_id,)
         )
         result = await cursor.fetchone()
         if result:
@@ -527,15 +963,37 @@ async def get_user_stats(user_id: int) -> Optional[Dict]:
 
 async def get_all_users():
     """Получить всех пользователей"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute("SELECT user_id FROM users")
         results = await cursor.fetchall()
         return [row[0] for row in results]
 
 
+async def is_bot_active(user_id: int) -> bool:
+    """Включен ли бот у пользователя (получает ли он напоминания)"""
+    async with connect() as db:
+        cursor = await db.execute(
+            "SELECT bot_active FROM users WHERE user_id = ?",
+            (user_id,)
+        )
+        result = await cursor.fetchone()
+        # Новые пользователи и старые записи без значения считаются активными
+        return result is None or result[0] is None or bool(result[0])
+
+
+async def set_bot_active(user_id: int, active: bool):
+    """Включить или выключить бота для пользователя"""
+    async with connect() as db:
+        await db.execute(
+            "UPDATE users SET bot_active = ? WHERE user_id = ?",
+            (1 if active else 0, user_id)
+        )
+        await db.commit()
+
+
 async def get_users_with_active_riddles():
     """Получить пользователей с активными загадками"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute("SELECT DISTINCT user_id FROM user_active_riddles")
         results = await cursor.fetchall()
         return [row[0] for row in results]
@@ -543,7 +1001,7 @@ async def get_users_with_active_riddles():
 
 async def get_user_active_riddle_id(user_id: int) -> Optional[int]:
     """Получить ID активной загадки пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cursor = await db.execute(
             "SELECT riddle_id FROM user_active_riddles WHERE user_id = ?",
             (user_id,)
@@ -554,92 +1012,635 @@ async def get_user_active_riddle_id(user_id: int) -> Optional[int]:
 
 async def clear_user_active_riddle(user_id: int):
     """Удалить активную загадку пользователя"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "DELETE FROM user_active_riddles WHERE user_id = ?",
+    async with connect() as db:
+        cursor = await db.execute(
+            "DELETE FROM user_active_riddles WHERE user_id = ? RETURNING riddle_id",
             (user_id,)
         )
+        cleared = await cursor.fetchall()
+        if cleared:
+            await _append_event(db, "riddle_cleared", user_id)
+        # Загадка снята без правильного ответа - брошена
+        for (riddle_id,) in cleared:
+            await _bump_riddle_stats(db, riddle_id, abandoned=1)
         await db.commit()
 
 
-async def reset_weekly_ratings():
-    """Очистить турнирную таблицу - сбросить рейтинг всех пользователей до начального значения каждый понедельник"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Сбрасываем рейтинг всех пользователей до базового значения (1000)
-        # Это "очистка турнирной таблицы" - начинаем новую неделю с чистого листа
-        await db.execute("UPDATE users SET rating = 1000")
-        
+def _riddle_difficulty_row(row) -> Dict:
+    return {
+        "riddle_id": row[0],
+        "assigned": row[1],
+        "attempts": row[2],
+        "correct": row[3],
+        "solved": row[4],
+        "hints": row[5],
+        "abandoned": row[6],
+        "solve_rate": row[7],
+        "mean_attempts": row[8],
+        "hint_rate": row[9],
+        "abandon_rate": row[10]
+    }
+
+
+async def get_riddle_stats(riddle_ids: List[int] = None) -> Dict[int, Dict]:
+    """Сложность загадок {riddle_id: счетчики и доли} - одно чтение riddle_stats
+
+    Без riddle_ids - весь каталог. Доли считаются от назначений (solve_rate, hint_rate,
+    abandon_rate), mean_attempts - среднее число попыток до первого решения; None, если
+    делить не на что.
+    """
+    async with connect() as db:
+        if riddle_ids is None:
+            cursor = await db.execute("SELECT * FROM riddle_difficulty")
+        else:
+            cursor = await db.execute(
+                "SELECT * FROM riddle_difficulty WHERE riddle_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(riddle_ids)),)
+            )
+        return {row[0]: _riddle_difficulty_row(row) for row in await cursor.fetchall()}
+
+
+async def get_riddle_stats_report(order: str = "hard", limit: int = 10, min_assigned: int = 10) -> List[Dict]:
+    """Загадки для админа в порядке RIDDLE_STATS_ORDERS[order] с текстом вопроса;
+    загадки, назначенные меньше min_assigned раз, не показываются"""
+    async with connect() as db:
+        cursor = await db.execute(
+            f"""SELECT d.*, r.question
+                FROM riddle_difficulty d
+                LEFT JOIN riddles r ON r.id = d.riddle_id
+                WHERE d.assigned >= ?
+                ORDER BY d.{RIDDLE_STATS_ORDERS[order]}, d.assigned DESC
+                LIMIT ?""",
+            (min_assigned, limit)
+        )
+        report = []
+        for row in await cursor.fetchall():
+            item = _riddle_difficulty_row(row)
+            item["question"] = row[11]
+            report.append(item)
+        return report
+
+
+async def get_difficulty_by_question() -> Dict[str, tuple]:
+    """Счетчики сложности по тексту вопроса {question: (назначений, решений)}
+
+    Одна и та же загадка каталога лежит в riddles многими строками (загадки на день),
+    поэтому счетчики складываются по вопросу. Для индекса подбора (riddle_selector.py).
+    """
+    async with connect() as db:
+        cursor = await db.execute(
+            """SELECT r.question, SUM(s.assigned), SUM(s.solved)
+               FROM riddle_stats s
+               JOIN riddles r ON r.id = s.riddle_id
+               GROUP BY r.question"""
+        )
+        return {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+
+
+async def get_skill_quantiles(buckets: int, prior_attempts: int) -> List[float]:
+    """Границы уровней игроков: buckets групп равного размера по решениям на попытку
+    (solved / (attempted + prior_attempts)); возвращается верхняя граница каждой группы,
+    кроме последней. Играли ли пользователи - по total_riddles_attempted > 0."""
+    async with connect() as db:
+        cursor = await db.execute(
+            """SELECT MAX(skill) FROM (
+                   SELECT skill, NTILE(?) OVER (ORDER BY skill) AS bucket
+                   FROM (
+                       SELECT CAST(total_riddles_solved AS REAL) / (total_riddles_attempted + ?) AS skill
+                       FROM users
+                       WHERE total_riddles_attempted > 0
+                   )
+               )
+               GROUP BY bucket
+               ORDER BY bucket""",
+            (buckets, prior_attempts)
+        )
+        return [row[0] for row in await cursor.fetchall()][:-1]
+
+
+def current_week_date(now: datetime = None) -> str:
+    """Ключ недели - дата понедельника недели, в которую попадает now"""
+    now = now or datetime.now()
+    return (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+
+
+async def reset_weekly_ratings() -> int:
+    """Очистить турнирную таблицу - начать новый сезон, рейтинг всех пользователей снова начальный
+
+    Одна вставка в seasons независимо от числа пользователей; строки рейтинга нового
+    сезона создаются при первом ответе пользователя. Итоговая таблица закрытого сезона
+    сохраняется в leaderboard_snapshots в той же транзакции - по рейтингам на момент
+    закрытия, со всеми ответами последнего дня. Возвращает номер нового сезона.
+    """
+    async with connect() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute(f"SELECT id, week_date FROM seasons WHERE id = {CURRENT_SEASON}")
+        row = await cursor.fetchone()
+        if row and row[1]:
+            await db.execute(SNAPSHOT_LEADERBOARD_SQL, {"season_id": row[0], "week_date": row[1]})
+        cursor = await db.execute("INSERT INTO seasons (week_date) VALUES (?)", (current_week_date(),))
+        await _append_event(db, "season_started", season_id=cursor.lastrowid)
         await db.commit()
-        logger.info("Турнирная таблица очищена: рейтинг всех пользователей сброшен до 1000")
+        logger.info("Турнирная таблица очищена: начат сезон #%s, рейтинг всех пользователей - %s",
+                    cursor.lastrowid, INITIAL_RATING)
+        return cursor.lastrowid
 
 
-async def get_weekly_leaderboard(limit: int = 10) -> List[Dict]:
-    """Получить лидеров недели для розыгрыша"""
-    async with aiosqlite.connect(DB_PATH) as db:
+async def get_closed_week() -> Optional[str]:
+    """Неделя сезона, закрытого на этой неделе (ключ его снимка в leaderboard_snapshots);
+    None - текущий сезон начат раньше этой недели, то есть прошлая неделя еще не закрыта"""
+    async with connect() as db:
         cursor = await db.execute(
-            """SELECT user_id, username, first_name, rating, total_riddles_solved
-               FROM users
-               WHERE rating > 0
-               ORDER BY rating DESC, total_riddles_solved DESC
+            f"""SELECT closed.week_date
+                FROM seasons current
+                JOIN seasons closed ON closed.id = (SELECT MAX(id) FROM seasons WHERE id < current.id)
+                WHERE current.id = {CURRENT_SEASON} AND current.week_date = ?""",
+            (current_week_date(),)
+        )
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+
+async def get_current_season() -> int:
+    """Номер текущего сезона рейтинга"""
+    async with connect() as db:
+        cursor = await db.execute(f"SELECT {CURRENT_SEASON}")
+        return (await cursor.fetchone())[0]
+
+
+async def get_leaderboard_snapshot(week_date: str, limit: int = 10) -> List[Dict]:
+    """Таблица лидеров прошлой недели из снимка"""
+    async with connect() as db:
+        cursor = await db.execute(
+            """SELECT position, user_id, username, first_name, rating, total_riddles_solved
+               FROM leaderboard_snapshots
+               WHERE week_date = ?
+               ORDER BY position
                LIMIT ?""",
-            (limit,)
+            (week_date, limit)
         )
         results = await cursor.fetchall()
         return [
             {
-                "user_id": row[0],
-                "username": row[1],
-                "first_name": row[2],
-                "rating": row[3],
-                "total_riddles_solved": row[4]
+                "position": row[0],
+                "user_id": row[1],
+                "username": row[2],
+                "first_name": row[3],
+                "rating": row[4],
+                "total_riddles_solved": row[5]
             }
             for row in results
         ]
 
 
-async def save_grant_winner(user_id: int, promo_code: str, grant_amount: int = 30000, week_date: str = None):
-    """Сохранить победителя гранта с промокодом"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        if not week_date:
-            from datetime import datetime
-            week_date = datetime.now().strftime("%Y-%m-%d")
+async def get_snapshot_weeks(limit: int = 8) -> List[str]:
+    """Недели, для которых есть снимок таблицы лидеров, от последней"""
+    async with connect() as db:
+        # Перебираются недели сезонов (их немного), а не строки снимков
+        cursor = await db.execute(
+            """SELECT DISTINCT s.week_date
+               FROM seasons s
+               WHERE EXISTS (SELECT 1 FROM leaderboard_snapshots ls WHERE ls.week_date = s.week_date)
+               ORDER BY s.week_date DESC
+               LIMIT ?""",
+            (limit,)
+        )
+        return [row[0] for row in await cursor.fetchall()]
+
+
+async def select_weekly_grant_winners(week_date: str, limit: int = 10, grant_amount: int = 30000) -> int:
+    """Выбрать победителей недели одним запросом: топ лидеров без ранее полученных грантов
+
+    Лидеры берутся из снимка итоговой таблицы закрытой недели week_date (leaderboard_snapshots,
+    пишется при закрытии сезона в reset_weekly_ratings). Повторный вызов для той же недели
+    ничего не меняет. Возвращает число победителей недели.
+    """
+    async with connect() as db:
+        # Выбор и сохранение победителей в одной транзакции: либо записаны все, либо никто
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("SELECT COUNT(*) FROM grants WHERE week_date = ?", (week_date,))
+        already_selected = (await cursor.fetchone())[0]
+        if already_selected:
+            await db.rollback()
+            return already_selected
         
-        await db.execute(
-            "INSERT INTO grants (user_id, grant_amount, promo_code, week_date) VALUES (?, ?, ?, ?)",
-            (user_id, grant_amount, promo_code, week_date)
+        cursor = await db.execute(
+            """INSERT OR IGNORE INTO grants (user_id, grant_amount, week_date)
+               SELECT leaders.user_id, ?, ?
+               FROM (
+                   SELECT user_id
+                   FROM leaderboard_snapshots
+                   WHERE week_date = ? AND rating > 0
+                   ORDER BY position
+                   LIMIT ?
+               ) leaders
+               WHERE NOT EXISTS (SELECT 1 FROM grants g WHERE g.user_id = leaders.user_id)""",
+            (grant_amount, week_date, week_date, limit)
         )
         await db.commit()
+        return cursor.rowcount
+
+
+async def get_week_grants(week_date: str) -> List[Dict]:
+    """Получить гранты недели вместе с состоянием этапов выдачи"""
+    async with connect() as db:
+        cursor = await db.execute(
+            """SELECT g.id, g.user_id, u.username, u.first_name, g.grant_amount,
+                      g.promo_code, g.exported_at, g.notified_at
+               FROM grants g
+               LEFT JOIN users u ON u.user_id = g.user_id
+               WHERE g.week_date = ?
+               ORDER BY g.id""",
+            (week_date,)
+        )
+        results = await cursor.fetchall()
+        return [
+            {
+                "id": row[0],
+                "user_id": row[1],
+                "username": row[2],
+                "first_name": row[3],
+                "grant_amount": row[4],
+                "promo_code": row[5],
+                "exported_at": row[6],
+                "notified_at": row[7]
+            }
+            for row in results
+        ]
 
 
-async def get_all_promo_codes() -> List[str]:
-    """Получить все существующие промокоды"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("SELECT promo_code FROM grants WHERE promo_code IS NOT NULL")
+async def get_pending_grants() -> List[Dict]:
+    """Гранты любой недели, у которых не пройден какой-то этап выдачи: нет промокода,
+    не выгружены в Google Sheets или победитель не уведомлен"""
+    async with connect() as db:
+        cursor = await db.execute(
+            """SELECT g.id, g.user_id, u.username, u.first_name, g.grant_amount,
+                      g.promo_code, g.exported_at, g.notified_at, g.week_date
+               FROM grants g
+               LEFT JOIN users u ON u.user_id = g.user_id
+               WHERE g.promo_code IS NULL OR g.exported_at IS NULL OR g.notified_at IS NULL
+               ORDER BY g.id"""
+        )
         results = await cursor.fetchall()
-        return [row[0] for row in results if row[0]]
+        return [
+            {
+                "id": row[0],
+                "user_id": row[1],
+                "username": row[2],
+                "first_name": row[3],
+                "grant_amount": row[4],
+                "promo_code": row[5],
+                "exported_at": row[6],
+                "notified_at": row[7],
+                "week_date": row[8]
+            }
+            for row in results
+        ]
 
 
-async def has_received_grant_this_week(user_id: int) -> bool:
-    """Проверить, получал ли пользователь грант на этой неделе"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        from datetime import datetime, timedelta
-        week_start = (datetime.now() - timedelta(days=datetime.now().weekday())).strftime("%Y-%m-%d")
+async def count_free_promo_codes() -> int:
+    """Количество свободных промокодов в пуле"""
+    async with connect() as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM promo_codes WHERE grant_id IS NULL")
+        return (await cursor.fetchone())[0]
+
+
+async def add_promo_codes(codes: List[str]) -> int:
+    """Добавить промокоды в пул; дубликаты отбрасывает уникальный ключ. Возвращает число добавленных"""
+    async with connect() as db:
+        before = db.total_changes
+        await db.executemany(
+            "INSERT OR IGNORE INTO promo_codes (code) VALUES (?)",
+            [(code,) for code in codes]
+        )
+        await db.commit()
+        return db.total_changes - before
+
+
+async def claim_promo_code(grant_id: int) -> Optional[str]:
+    """Атомарно выдать гранту свободный промокод из пула
+
+    Повторный вызов для того же гранта возвращает уже выданный код.
+    None - пул пуст.
+    """
+    async with connect() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("SELECT promo_code FROM grants WHERE id = ?", (grant_id,))
+        result = await cursor.fetchone()
+        if result and result[0]:
+            await db.rollback()
+            return result[0]
+        
+        cursor = await db.execute(
+            """UPDATE promo_codes
+               SET grant_id = ?, issued_at = CURRENT_TIMESTAMP
+               WHERE code = (SELECT code FROM promo_codes WHERE grant_id IS NULL LIMIT 1)
+               RETURNING code""",
+            (grant_id,)
+        )
+        result = await cursor.fetchone()
+        if not result:
+            await db.rollback()
+            return None
         
+        promo_code = result[0]
+        await db.execute("UPDATE grants SET promo_code = ? WHERE id = ?", (promo_code, grant_id))
+        await db.commit()
+        return promo_code
+
+
+async def mark_grant_exported(grant_id: int):
+    """Отметить, что грант выгружен в Google Sheets"""
+    async with connect() as db:
+        await db.execute(
+            "UPDATE grants SET exported_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (grant_id,)
+        )
+        await db.commit()
+
+
+async def mark_grant_notified(grant_id: int):
+    """Отметить, что победителю отправлено сообщение с промокодом"""
+    async with connect() as db:
+        await db.execute(
+            "UPDATE grants SET notified_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (grant_id,)
+        )
+        await db.commit()
+
+
+async def acquire_lease(name: str, holder: str, ttl: float) -> Optional[int]:
+    """Взять свободную (или истекшую) аренду либо продлить свою на ttl секунд
+
+    Возвращает номер срока аренды (term) или None, если аренду держит другой.
+    """
+    now = time.time()
+    async with connect() as db:
         cursor = await db.execute(
-            "SELECT COUNT(*) FROM grants WHERE user_id = ? AND week_date >= ?",
-            (user_id, week_start)
+            """INSERT INTO leases (name, holder, term, expires_at, renewed_at) VALUES (?, ?, 1, ?, ?)
+               ON CONFLICT (name) DO UPDATE SET
+                   term = CASE WHEN leases.holder = excluded.holder THEN leases.term ELSE leases.term + 1 END,
+                   holder = excluded.holder,
+                   expires_at = excluded.expires_at,
+                   renewed_at = excluded.renewed_at
+               WHERE leases.holder = excluded.holder OR leases.expires_at < excluded.renewed_at
+               RETURNING term""",
+            (name, holder, now + ttl, now)
         )
-        count = (await cursor.fetchone())[0]
-        return count > 0
+        result = await cursor.fetchone()
+        await cursor.close()
+        await db.commit()
+        return result[0] if result else None
 
 
-async def has_ever_received_grant(user_id: int) -> bool:
-    """Проверить, получал ли пользователь грант когда-либо"""
-    async with aiosqlite.connect(DB_PATH) as db:
+async def release_lease(name: str, holder: str):
+    """Отпустить свою аренду (истекает сразу, term сохраняется)"""
+    async with connect() as db:
+        await db.execute(
+            "UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?",
+            (name, holder)
+        )
+        await db.commit()
+
+
+async def get_lease(name: str) -> Optional[Dict]:
+    """Текущий держатель аренды: holder, term, expires_at, renewed_at"""
+    async with connect() as db:
         cursor = await db.execute(
-            "SELECT COUNT(*) FROM grants WHERE user_id = ?",
-            (user_id,)
+            "SELECT holder, term, expires_at, renewed_at FROM leases WHERE name = ?",
+            (name,)
+        )
+        result = await cursor.fetchone()
+        if result:
+            return {
+                "holder": result[0],
+                "term": result[1],
+                "expires_at": result[2],
+                "renewed_at": result[3]
+            }
+        return None
+
+
+async def claim_job_run(job_id: str, slot: str) -> Optional[int]:
+    """Занять запуск задачи за слот; возвращает номер попытки или None, если слот уже выполнен"""
+    async with connect() as db:
+        cursor = await db.execute(
+            """INSERT INTO job_runs (job_id, slot, status) VALUES (?, ?, 'running')
+               ON CONFLICT (job_id, slot) DO UPDATE SET
+                   status = 'running',
+                   attempts = job_runs.attempts + 1,
+                   started_at = CURRENT_TIMESTAMP,
+                   finished_at = NULL,
+                   error = NULL
+               WHERE job_runs.status != 'done'
+               RETURNING attempts""",
+            (job_id, slot)
+        )
+        result = await cursor.fetchone()
+        await cursor.close()
+        await db.commit()
+        return result[0] if result else None
+
+
+async def finish_job_run(job_id: str, slot: str, error: str = None):
+    """Записать результат запуска: done или failed с текстом ошибки"""
+    async with connect() as db:
+        await db.execute(
+            """UPDATE job_runs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+               WHERE job_id = ? AND slot = ?""",
+            ("failed" if error else "done", error, job_id, slot)
+        )
+        await db.commit()
+
+
+async def is_job_run_done(job_id: str, slot: str) -> bool:
+    """Выполнен ли запуск задачи за слот"""
+    async with connect() as db:
+        cursor = await db.execute(
+            "SELECT 1 FROM job_runs WHERE job_id = ? AND slot = ? AND status = 'done'",
+            (job_id, slot)
+        )
+        return await cursor.fetchone() is not None
+
+
+async def has_job_runs(job_id: str) -> bool:
+    """Есть ли хоть одна запись о запуске задачи"""
+    async with connect() as db:
+        cursor = await db.execute("SELECT 1 FROM job_runs WHERE job_id = ? LIMIT 1", (job_id,))
+        return await cursor.fetchone() is not None
+
+
+async def get_last_job_runs() -> List[Dict]:
+    """Последний запуск каждой задачи"""
+    async with connect() as db:
+        cursor = await db.execute(
+            """SELECT job_id, slot, status, attempts, MAX(started_at), finished_at, error
+               FROM job_runs GROUP BY job_id ORDER BY job_id"""
         )
-        count = (await cursor.fetchone())[0]
-        return count > 0
+        results = await cursor.fetchall()
+        return [
+            {
+                "job_id": row[0],
+                "slot": row[1],
+                "status": row[2],
+                "attempts": row[3],
+                "started_at": row[4],
+                "finished_at": row[5],
+                "error": row[6]
+            }
+            for row in results
+        ]
+
+
+async def delete_old_job_runs(days: int) -> int:
+    """Удалить записи о запусках старше days дней"""
+    async with connect() as db:
+        cursor = await db.execute(
+            "DELETE FROM job_runs WHERE started_at < datetime('now', ?)",
+            (f"-{days} days",)
+        )
+        await db.commit()
+        return cursor.rowcount
+
+
+async def seal_event_segments(segment_size: int = EVENT_SEGMENT_SIZE) -> int:
+    """Упаковать полные пачки старых событий из events в сегменты; вернуть число новых сегментов
+
+    Сегмент - segment_size событий подряд одной сжатой строкой: журнал читается при
+    воспроизведении последовательно и крупными блоками. Неполный хвост остается в events.
+    """
+    sealed = 0
+    async with connect() as db:
+        while True:
+            await db.execute("BEGIN IMMEDIATE")
+            cursor = await db.execute(
+                "SELECT seq, created_at, type, user_id, data FROM events ORDER BY seq LIMIT ?",
+                (segment_size,)
+            )
+            rows = await cursor.fetchall()
+            if len(rows) < segment_size:
+                await db.rollback()
+                return sealed
+            batch = [[seq, created_at, event_type, user_id, json.loads(data) if data else None]
+                     for seq, created_at, event_type, user_id, data in rows]
+            body = zlib.compress(json.dumps(batch, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            await db.execute(
+                "INSERT INTO event_segments (first_seq, last_seq, events, created_at, body) VALUES (?, ?, ?, ?, ?)",
+                (rows[0][0], rows[-1][0], len(rows), time.time(), body)
+            )
+            await db.execute("DELETE FROM events WHERE seq <= ?", (rows[-1][0],))
+            await db.commit()
+            sealed += 1
+
+
+async def get_event_log_stats() -> Dict:
+    """Размер журнала событий: сегменты и хвост"""
+    async with connect() as db:
+        cursor = await db.execute("SELECT COUNT(*), COALESCE(SUM(events), 0), COALESCE(SUM(LENGTH(body)), 0) FROM event_segments")
+        segments, sealed_events, sealed_bytes = await cursor.fetchone()
+        cursor = await db.execute("SELECT COUNT(*), MAX(seq) FROM events")
+        tail_events, last_seq = await cursor.fetchone()
+        if last_seq is None:
+            cursor = await db.execute("SELECT MAX(last_seq) FROM event_segments")
+            last_seq = (await cursor.fetchone())[0]
+        return {
+            "segments": segments,
+            "sealed_events": sealed_events,
+            "sealed_bytes": sealed_bytes,
+            "tail_events": tail_events,
+            "last_seq": last_seq or 0
+        }
+
+
+async def iter_event_log(db, batch_size: int = EVENT_SEGMENT_SIZE):
+    """События журнала по порядку пачками [seq, created_at, type, user_id, data]
+
+    Сначала сегменты, затем хвост events. Читается в соединении db, чтобы пересборка
+    проекций видела журнал и писала проекции в одной транзакции.
+    """
+    last_seq = 0
+    cursor = await db.execute("SELECT last_seq, body FROM event_segments ORDER BY first_seq")
+    while True:
+        rows = await cursor.fetchmany(16)
+        if not rows:
+            break
+        for segment_last_seq, body in rows:
+            yield json.loads(zlib.decompress(body))
+            last_seq = segment_last_seq
+    await cursor.close()
+    
+    cursor = await db.execute(
+        "SELECT seq, created_at, type, user_id, data FROM events WHERE seq > ? ORDER BY seq",
+        (last_seq,)
+    )
+    while True:
+        rows = await cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield [[seq, created_at, event_type, user_id, json.loads(data) if data else None]
+               for seq, created_at, event_type, user_id, data in rows]
+    await cursor.close()
+
+
+async def read_projections(db) -> Dict:
+    """Текущие проекции журнала в том же виде, что строит events.Projections"""
+    cursor = await db.execute(
+        "SELECT user_id, total_riddles_solved, total_riddles_attempted, total_hints_used FROM users"
+    )
+    users = {row[0]: (row[1] or 0, row[2] or 0, row[3] or 0) for row in await cursor.fetchall()}
+    cursor = await db.execute("SELECT user_id, riddle_id, wrong_attempts, hints_given FROM user_active_riddles")
+    active = {(row[0], row[1]): (row[2] or 0, row[3] or 0) for row in await cursor.fetchall()}
+    cursor = await db.execute("SELECT season_id, user_id, rating FROM season_ratings")
+    ratings = {(row[0], row[1]): row[2] for row in await cursor.fetchall()}
+    return {"users": users, "active": active, "ratings": ratings}
+
+
+async def write_projections(db, users: Dict, active: Dict, ratings: Dict):
+    """Заменить проекции (счетчики пользователей, активные загадки, рейтинги сезонов)
+
+    users - {user_id: [username, first_name, решено, попыток, подсказок]},
+    active - {(user_id, riddle_id): [ошибок, подсказок, время назначения]},
+    ratings - {(season_id, user_id): рейтинг}. Вызывать в транзакции db.
+    """
+    await db.executemany(
+        "INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+        ((user_id, user[0], user[1]) for user_id, user in users.items())
+    )
+    await db.executemany(
+        """UPDATE users SET total_riddles_solved = ?, total_riddles_attempted = ?, total_hints_used = ?
+           WHERE user_id = ?""",
+        ((user[2], user[3], user[4], user_id) for user_id, user in users.items())
+    )
+    await db.execute("DELETE FROM user_active_riddles")
+    await db.executemany(
+        """INSERT INTO user_active_riddles (user_id, riddle_id, wrong_attempts, hints_given, started_at)
+           VALUES (?, ?, ?, ?, ?)""",
+        ((user_id, riddle_id, state[0], state[1], state[2]) for (user_id, riddle_id), state in active.items())
+    )
+    await db.execute("DELETE FROM season_ratings")
+    await db.executemany(
+        "INSERT INTO season_ratings (season_id, user_id, rating) VALUES (?, ?, ?)",
+        ((season_id, user_id, rating) for (season_id, user_id), rating in ratings.items())
+    )
+
+
+async def iter_table_rows(table: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Все строки таблицы из EXPORT_TABLES: сначала список колонок, затем пачки строк
 
+    Строки читаются курсором по batch_size, в памяти только одна пачка. Чтение идет
+    в одной транзакции, поэтому выгрузка - снимок на момент начала; запись бота
+    в режиме WAL она не останавливает.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Таблица {table} не выгружается")
+    async with connect() as db:
+        await db.execute("BEGIN")
+        cursor = await db.execute(f"SELECT * FROM {table} ORDER BY rowid")
+        yield [column[0] for column in cursor.description]
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        await cursor.close()
+        await db.rollback()
@@ -0,0 +1,213 @@
+"""
+Журнал событий и проекции, которые по нему можно пересобрать
+
+Каждое изменение состояния игрока (новый пользователь, назначенная загадка, ответ,
+подсказка, новый сезон) дописывается в таблицу events в той же транзакции, что и само
+изменение (database._append_event). Таблицы users (счетчики), user_active_riddles и
+season_ratings - проекции журнала: по ним отвечают обработчики, а при расхождении или
+после ручной правки базы их можно построить заново, воспроизведя журнал.
+
+Журнал только дописывается. Задача seal_job раз в SEAL_INTERVAL_MINUTES упаковывает полные
+пачки по database.EVENT_SEGMENT_SIZE событий в сжатые сегменты (event_segments), поэтому
+воспроизведение читает журнал последовательно крупными блоками. База, созданная до
+появления журнала, начинает его с событий *_imported - снимка текущих проекций.
+
+Запуск из корня проекта:
+    python -m events verify     # сравнить проекции с журналом, ничего не меняя
+    python -m events rebuild    # пересобрать проекции из журнала
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Как часто упаковывать журнал в сегменты
+SEAL_INTERVAL_MINUTES = 10
+
+
+def _timestamp(created_at: float) -> str:
+    """Время события в формате CURRENT_TIMESTAMP (UTC)"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(created_at))
+
+
+class Projections:
+    """Проекции журнала в памяти: применяются события по порядку seq"""
+
+    def __init__(self):
+        # user_id -> [username, first_name, решено, попыток, подсказок]
+        self.users = {}
+        # user_id -> {riddle_id: [ошибок, подсказок, время назначения]}
+        self.active = {}
+        # (season_id, user_id) -> рейтинг
+        self.ratings = {}
+        self.season = None
+        self.events = 0
+        self.last_seq = 0
+        self._handlers = {
+            "user_created": self._user_created,
+            "user_imported": self._user_imported,
+            "riddle_assigned": self._riddle_assigned,
+            "riddle_imported": self._riddle_imported,
+            "riddle_cleared": self._riddle_cleared,
+            "answer_checked": self._answer_checked,
+            "hint_given": self._hint_given,
+            "season_started": self._season_started,
+            "rating_imported": self._rating_imported,
+        }
+
+    def apply_batch(self, batch: list):
+        handlers = self._handlers
+        for seq, created_at, event_type, user_id, data in batch:
+            handler = handlers.get(event_type)
+            if handler is not None:
+                handler(user_id, data, created_at)
+        if batch:
+            self.events += len(batch)
+            self.last_seq = batch[-1][0]
+
+    def _user(self, user_id: int) -> list:
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = [None, None, 0, 0, 0]
+        return user
+
+    def _user_created(self, user_id, data, created_at):
+        if user_id not in self.users:
+            self.users[user_id] = [data.get("username"), data.get("first_name"), 0, 0, 0]
+
+    def _user_imported(self, user_id, data, created_at):
+        self.users[user_id] = [data["username"], data["first_name"], data["solved"], data["attempted"], data["hints"]]
+
+    def active_rows(self) -> dict:
+        """Активные загадки в виде {(user_id, riddle_id): [ошибок, подсказок, время назначения]}"""
+        return {
+            (user_id, riddle_id): state
+            for user_id, riddles in self.active.items()
+            for riddle_id, state in riddles.items()
+        }
+
+    def _riddle_assigned(self, user_id, data, created_at):
+        self.active.setdefault(user_id, {})[data["riddle_id"]] = [0, 0, _timestamp(created_at)]
+
+    def _riddle_imported(self, user_id, data, created_at):
+        self.active.setdefault(user_id, {})[data["riddle_id"]] = [
+            data["wrong_attempts"], data["hints_given"], data["started_at"] or _timestamp(created_at)
+        ]
+
+    def _riddle_cleared(self, user_id, data, created_at):
+        self.active.pop(user_id, None)
+
+    def _answer_checked(self, user_id, data, created_at):
+        user = self._user(user_id)
+        user[3] += 1
+        riddles = self.active.get(user_id)
+        state = riddles.get(data["riddle_id"]) if riddles else None
+        if data["correct"]:
+            if data["first_solve"]:
+                user[2] += 1
+            if state is not None:
+                del riddles[data["riddle_id"]]
+                if not riddles:
+                    del self.active[user_id]
+        elif state is not None:
+            state[0] += 1
+        delta = data["rating_delta"]
+        if delta:
+            rating_key = (self.season, user_id)
+            self.ratings[rating_key] = max(0, self.ratings.get(rating_key, database.INITIAL_RATING) + delta)
+
+    def _hint_given(self, user_id, data, created_at):
+        self._user(user_id)[4] += 1
+        state = self.active.get(user_id, {}).get(data["riddle_id"])
+        if state is not None:
+            state[1] += 1
+
+    def _season_started(self, user_id, data, created_at):
+        self.season = data["season_id"]
+
+    def _rating_imported(self, user_id, data, created_at):
+        self.ratings[(data["season_id"], user_id)] = data["rating"]
+
+
+async def replay(db) -> Projections:
+    """Воспроизвести весь журнал в соединении db"""
+    projections = Projections()
+    async for batch in database.iter_event_log(db):
+        projections.apply_batch(batch)
+    return projections
+
+
+def diff(projections: Projections, current: dict) -> dict:
+    """Число расхождений проекций из журнала с таблицами базы (database.read_projections)"""
+    users = {user_id: tuple(user[2:]) for user_id, user in projections.users.items()}
+    active = {key: tuple(state[:2]) for key, state in projections.active_rows().items()}
+    result = {}
+    for name, expected in (("users", users), ("active", active), ("ratings", projections.ratings)):
+        actual = current[name]
+        result[name] = sum(1 for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key))
+    return result
+
+
+async def rebuild(apply: bool = True) -> dict:
+    """Пересобрать проекции из журнала (apply=False - только сравнить с текущими)
+
+    Журнал читается и проекции пишутся в одной транзакции с блокировкой записи:
+    события, пришедшие во время пересборки, подождут и не потеряются.
+    """
+    started = time.perf_counter()
+    async with database.connect() as db:
+        # Один снимок базы: упаковка сегментов во время чтения не сдвинет журнал
+        await db.execute("BEGIN IMMEDIATE" if apply else "BEGIN")
+        projections = await replay(db)
+        replay_seconds = time.perf_counter() - started
+        mismatches = diff(projections, await database.read_projections(db))
+        if apply:
+            await database.write_projections(db, projections.users, projections.active_rows(), projections.ratings)
+            await db.commit()
+        else:
+            await db.rollback()
+    seconds = time.perf_counter() - started
+    result = {
+        "events": projections.events,
+        "last_seq": projections.last_seq,
+        "mismatches": mismatches,
+        "replay_seconds": round(replay_seconds, 3),
+        "seconds": round(seconds, 3),
+        "events_per_second": round(projections.events / replay_seconds) if replay_seconds else None
+    }
+    if apply:
+        logger.info("[СОБЫТИЯ] Проекции пересобраны из %d событий за %.2f с, расхождений было: %s",
+                    projections.events, seconds, mismatches)
+    return result
+
+
+async def seal_job():
+    """Задача планировщика: упаковать накопившиеся события в сегменты"""
+    sealed = await database.seal_event_segments()
+    if sealed:
+        logger.info("[СОБЫТИЯ] Упаковано сегментов журнала: %d", sealed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("verify", "rebuild", "seal"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    async def run():
+        await database.init_db()
+        if args.command == "seal":
+            await seal_job()
+            return await database.get_event_log_stats()
+        return await rebuild(apply=args.command == "rebuild")
+
+    print(json.dumps(asyncio.run(run()), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
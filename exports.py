@@ -0,0 +1,202 @@
+"""
+Выгрузка таблиц attempts, users и grants в CSV (или CSV.gz) для админов: /export и CLI
+
+Строки читаются курсором пачками по database.EXPORT_BATCH_SIZE (database.iter_table_rows)
+и сразу дописываются в файл, поэтому память не зависит от размера таблицы. Запись и
+сжатие идут в отдельном потоке, event loop бота свободен. Выгрузка - снимок таблицы
+на момент начала.
+
+Файл делится на части не больше EXPORT_PART_MB (Telegram принимает от бота документы
+до 50 МБ): <таблица>-<время>-001.csv.gz, -002... Каждая часть - самостоятельный файл
+со строкой заголовка. В Telegram части отправляются в чат админа и затем удаляются.
+
+Запуск из корня проекта:
+    python -m exports attempts users grants
+    python -m exports attempts --format csv --part-mb 0    # один файл без сжатия
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import gzip
+import io
+import logging
+import os
+import time
+from datetime import datetime
+
+import database
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+# Наибольший размер части; с запасом до лимита Telegram на отправку документа (50 МБ)
+EXPORT_PART_MB = float(os.getenv("EXPORT_PART_MB", "45"))
+EXPORT_COMPRESS_LEVEL = int(os.getenv("EXPORT_COMPRESS_LEVEL", "6"))
+# Сколько ждать загрузки одной части в Telegram (секунды)
+EXPORT_UPLOAD_TIMEOUT = 300
+
+FORMATS = ("gz", "csv")
+
+_running = False
+
+
+def is_running() -> bool:
+    return _running
+
+
+class PartWriter:
+    """CSV в файлы-части не больше part_bytes (0 - без деления), у каждой части свой заголовок"""
+
+    def __init__(self, prefix: str, header: list, compress: bool = True, part_bytes: int = 0):
+        self.prefix = prefix
+        self.header = header
+        self.compress = compress
+        self.part_bytes = part_bytes
+        self.paths = []
+        self.rows = 0
+        # Наибольший прирост файла за одну пачку: новая часть начинается заранее,
+        # чтобы следующая пачка не вывела текущую за предел
+        self._batch_bytes = 0
+        self._raw = None
+        self._text = None
+        self._writer = None
+
+    def _open(self):
+        path = f"{self.prefix}-{len(self.paths) + 1:03d}.csv" + (".gz" if self.compress else "")
+        self._raw = open(path, "wb")
+        stream = self._raw
+        if self.compress:
+            stream = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=EXPORT_COMPRESS_LEVEL)
+        # write_through: размер файла (tell) виден после каждой пачки без сброса буферов
+        self._text = io.TextIOWrapper(stream, encoding="utf-8", newline="", write_through=True)
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(self.header)
+        self.paths.append(path)
+
+    def _close(self):
+        self._text.close()
+        self._raw.close()
+        self._raw = None
+
+    def write(self, rows: list):
+        if self._raw is None:
+            self._open()
+        elif self.part_bytes and self._raw.tell() + self._batch_bytes > self.part_bytes:
+            self._close()
+            self._open()
+        before = self._raw.tell()
+        self._writer.writerows(rows)
+        self._batch_bytes = max(self._batch_bytes, self._raw.tell() - before)
+        self.rows += len(rows)
+
+    def close(self) -> list:
+        """Закрыть последнюю часть (у пустой таблицы - файл с одним заголовком)"""
+        if self._raw is None:
+            self._open()
+        self._close()
+        return self.paths
+
+    def discard(self):
+        """Закрыть и удалить все части (выгрузка прервана)"""
+        if self._raw is not None:
+            self._close()
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def export_table(table: str, directory: str = None, compress: bool = True, part_mb: float = None) -> dict:
+    """Выгрузить таблицу в файлы-части; вернуть пути и размеры"""
+    directory = directory or EXPORT_DIR
+    part_mb = EXPORT_PART_MB if part_mb is None else part_mb
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, f"{table}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    started = time.perf_counter()
+    writer = None
+    try:
+        async with contextlib.aclosing(database.iter_table_rows(table)) as batches:
+            async for batch in batches:
+                if writer is None:
+                    writer = PartWriter(prefix, batch, compress, int(part_mb * 1024 * 1024))
+                else:
+                    await asyncio.to_thread(writer.write, batch)
+        paths = await asyncio.to_thread(writer.close)
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+    result = {
+        "table": table,
+        "rows": writer.rows,
+        "parts": paths,
+        "bytes": sum(os.path.getsize(path) for path in paths),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+    logger.info(
+        "[ВЫГРУЗКА] %s: %d строк, %d частей, %.1f МБ за %.1f с",
+        table, result["rows"], len(paths), result["bytes"] / (1024 * 1024), result["seconds"]
+    )
+    return result
+
+
+async def send_export(bot, chat_id: int, result: dict):
+    """Отправить части выгрузки документами в чат и удалить файлы
+
+    Файл части читается в память при отправке, поэтому память ограничена EXPORT_PART_MB.
+    """
+    parts = result["parts"]
+    try:
+        for number, path in enumerate(parts, 1):
+            with open(path, "rb") as document:
+                await bot.send_document(
+                    chat_id=chat_id,
+                    document=document,
+                    filename=os.path.basename(path),
+                    caption=f"{result['table']}: часть {number} из {len(parts)}, строк всего {result['rows']}",
+                    write_timeout=EXPORT_UPLOAD_TIMEOUT
+                )
+    finally:
+        for path in parts:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def export_to_chat(bot, chat_id: int, tables: list, compress: bool = True) -> list:
+    """Выгрузить таблицы по очереди и отправить в чат; одновременно идет одна выгрузка"""
+    global _running
+    if _running:
+        raise RuntimeError("Выгрузка уже идет")
+    _running = True
+    results = []
+    try:
+        for table in tables:
+            result = await export_table(table, compress=compress)
+            await send_export(bot, chat_id, result)
+            results.append(result)
+    finally:
+        _running = False
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tables", nargs="+", choices=database.EXPORT_TABLES)
+    parser.add_argument("--format", choices=FORMATS, default="gz", help="gz - CSV со сжатием (по умолчанию)")
+    parser.add_argument("--dir", default=EXPORT_DIR, help="куда писать файлы")
+    parser.add_argument("--part-mb", type=float, default=EXPORT_PART_MB, help="размер части, МБ (0 - не делить)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    async def run():
+        await database.init_db()
+        for table in args.tables:
+            result = await export_table(table, args.dir, args.format == "gz", args.part_mb)
+            for path in result["parts"]:
+                print(f"{path}  {os.path.getsize(path) / (1024 * 1024):.1f} МБ")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,19 @@
 """
 Интеграция с Google Sheets для записи выданных грантов
 """
+import asyncio
+import importlib.util
+import json
 import os
 import logging
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-try:
-    import gspread
-    from google.oauth2.service_account import Credentials
-    GSPREAD_AVAILABLE = True
-except ImportError:
-    GSPREAD_AVAILABLE = False
+# gspread и google-auth импортируются только при создании клиента: импорт тяжелый,
+# а при выключенной интеграции они не нужны вовсе
+GSPREAD_AVAILABLE = importlib.util.find_spec("gspread") is not None
+if not GSPREAD_AVAILABLE:
     logger.warning("gspread не установлен. Google Sheets интеграция будет отключена.")
 
 # Настройки Google Sheets
@@ -33,6 +35,18 @@ except:
 # Название листа в таблице
 SHEET_NAME = "Гранты"
 
+HEADER = [
+    "Дата выдачи",
+    "User ID",
+    "Имя пользователя",
+    "Имя",
+    "Промокод",
+    "Сумма гранта (руб)"
+]
+
+# Локальный файл для строк, которые не удалось записать (Sheets недоступен)
+SPOOL_FILE = os.getenv("GOOGLE_SHEETS_SPOOL_FILE", "sheets_spool.jsonl")
+
 
 def get_google_sheets_client():
     """Получить клиент Google Sheets"""
@@ -44,6 +58,9 @@ def get_google_sheets_client():
             logger.warning(f"Файл {CREDENTIALS_FILE} не найден. Google Sheets интеграция отключена.")
             return None
         
+        import gspread
+        from google.oauth2.service_account import Credentials
+        
         creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPE)
         client = gspread.authorize(creds)
         return client
@@ -52,59 +69,162 @@ def get_google_sheets_client():
         return None
 
 
-async def add_grant_to_sheet(user_id: int, username: str, first_name: str, promo_code: str, grant_amount: int = 30000):
-    """Добавить запись о гранте в Google Sheets"""
-    if not GSPREAD_AVAILABLE:
-        logger.warning("gspread не установлен. Google Sheets интеграция отключена.")
-        return False
-    
-    try:
-        client = get_google_sheets_client()
-        if not client:
-            logger.warning("Google Sheets клиент недоступен, пропускаем запись")
-            return False
-        
-        if not SPREADSHEET_ID:
-            logger.warning("SPREADSHEET_ID не указан, пропускаем запись")
+def make_grant_row(user_id: int, username: str, first_name: str, promo_code: str, grant_amount: int = 30000) -> list:
+    """Строка таблицы для одного гранта"""
+    return [
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        user_id,
+        username or "",
+        first_name or "",
+        promo_code,
+        grant_amount
+    ]
+
+
+class SheetsExporter:
+    """Пакетная запись строк в Google Sheets с локальной очередью на время недоступности
+
+    Клиент и лист открываются один раз и переиспользуются. Все сетевые вызовы gspread
+    выполняются в отдельном потоке, чтобы не блокировать event loop. Строки пишутся
+    одним append_rows вместе с накопленными в спул-файле.
+
+    client_factory позволяет подставить локальную заглушку вместо gspread:
+    она должна возвращать объект с open_by_key(id) -> таблица с worksheet(name),
+    add_worksheet(title, rows, cols); у листа должен быть append_rows(rows).
+    """
+
+    def __init__(self, spreadsheet_id: str, client_factory=None, spool_path: str = SPOOL_FILE,
+                 sheet_name: str = SHEET_NAME):
+        self.spreadsheet_id = spreadsheet_id
+        self.spool_path = spool_path
+        self.sheet_name = sheet_name
+        self._client_factory = client_factory or get_google_sheets_client
+        self._client = None
+        self._worksheet = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Настроена ли запись (иначе строки не копятся в спуле)"""
+        if not self.spreadsheet_id:
             return False
-        
-        # Открываем таблицу
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        
-        # Получаем или создаем лист
+        if self._client_factory is get_google_sheets_client:
+            return GSPREAD_AVAILABLE and os.path.exists(CREDENTIALS_FILE)
+        return True
+
+    def _get_worksheet(self):
+        """Открыть лист (один раз), создав его с заголовками при необходимости"""
+        if self._worksheet is not None:
+            return self._worksheet
+        if self._client is None:
+            self._client = self._client_factory()
+            if self._client is None:
+                raise RuntimeError("Google Sheets клиент недоступен")
+
+        spreadsheet = self._client.open_by_key(self.spreadsheet_id)
         try:
-            worksheet = spreadsheet.worksheet(SHEET_NAME)
-        except gspread.exceptions.WorksheetNotFound:
-            worksheet = spreadsheet.add_worksheet(title=SHEET_NAME, rows=1000, cols=10)
-            # Добавляем заголовки
-            worksheet.append_row([
-                "Дата выдачи",
-                "User ID",
-                "Имя пользователя",
-                "Имя",
-                "Промокод",
-                "Сумма гранта (руб)"
-            ])
-        
-        # Добавляем запись
-        from datetime import datetime
-        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        worksheet.append_row([
-            current_date,
-            user_id,
-            username or "",
-            first_name or "",
-            promo_code,
-            grant_amount
-        ])
-        
-        logger.info(f"Грант {promo_code} записан в Google Sheets для пользователя {user_id}")
+            worksheet = spreadsheet.worksheet(self.sheet_name)
+        except Exception as e:
+            if type(e).__name__ != "WorksheetNotFound":
+                raise
+            worksheet = spreadsheet.add_worksheet(title=self.sheet_name, rows=1000, cols=10)
+            worksheet.append_rows([HEADER])
+        self._worksheet = worksheet
+        return worksheet
+
+    def _read_spool(self) -> list:
+        if not os.path.exists(self.spool_path):
+            return []
+        with open(self.spool_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _write_spool(self, rows: list):
+        if not rows:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.spool_path)
+
+    def _flush_sync(self, rows: list) -> int:
+        """Записать спул и новые строки одним запросом; при ошибке сохранить все в спул"""
+        pending = self._read_spool() + rows
+        if not pending:
+            return 0
+        try:
+            self._get_worksheet().append_rows(pending, value_input_option="USER_ENTERED")
+        except Exception as e:
+            # Переоткроем клиент при следующей попытке (например, истек токен)
+            self._client = None
+            self._worksheet = None
+            self._write_spool(pending)
+            logger.warning(f"Google Sheets недоступен ({e}), {len(pending)} строк сохранено в {self.spool_path}")
+            return 0
+        self._write_spool([])
+        return len(pending)
+
+    async def append_rows(self, rows: list) -> bool:
+        """Записать строки (или поставить их в спул). False - интеграция не настроена"""
+        if not self.enabled:
+            return False
+        async with self._lock:
+            written = await asyncio.to_thread(self._flush_sync, list(rows))
+        if written:
+            logger.info(f"В Google Sheets записано {written} строк")
         return True
-        
-    except Exception as e:
-        logger.error(f"Ошибка при записи в Google Sheets: {e}", exc_info=True)
+
+    async def sync_spool(self) -> int:
+        """Дописать накопленные в спуле строки; возвращает число записанных строк"""
+        if not self.enabled or not os.path.exists(self.spool_path):
+            return 0
+        async with self._lock:
+            return await asyncio.to_thread(self._flush_sync, [])
+
+
+exporter = SheetsExporter(SPREADSHEET_ID)
+
+
+async def add_grants_to_sheet(grants: list) -> bool:
+    """Добавить записи о нескольких грантах одним запросом
+
+    grants - словари с полями user_id, username, first_name, promo_code, grant_amount.
+    True - строки записаны или надежно сохранены в спул до восстановления Sheets.
+    """
+    if not exporter.enabled:
+        logger.warning("Google Sheets не настроен, пропускаем запись")
         return False
+    rows = [
+        make_grant_row(
+            grant["user_id"], grant.get("username"), grant.get("first_name"),
+            grant["promo_code"], grant.get("grant_amount", 30000)
+        )
+        for grant in grants
+    ]
+    return await exporter.append_rows(rows)
+
+
+async def add_grant_to_sheet(user_id: int, username: str, first_name: str, promo_code: str, grant_amount: int = 30000):
+    """Добавить запись о гранте в Google Sheets"""
+    return await add_grants_to_sheet([{
+        "user_id": user_id,
+        "username": username,
+        "first_name": first_name,
+        "promo_code": promo_code,
+        "grant_amount": grant_amount
+    }])
+
+
+async def sync_spool():
+    """Задача планировщика: дописать строки, накопленные пока Sheets был недоступен"""
+    try:
+        written = await exporter.sync_spool()
+        if written:
+            logger.info(f"Из спула в Google Sheets дописано {written} строк")
+    except Exception as e:
+        logger.error(f"Ошибка при синхронизации спула Google Sheets: {e}", exc_info=True)
 
 
 def create_sample_credentials_template():
@@ -127,4 +247,3 @@ def create_sample_credentials_template():
         json.dump(template, f, indent=2, ensure_ascii=False)
     
     logger.info("Создан шаблон credentials_template.json. Заполните его своими данными и переименуйте в credentials.json")
-
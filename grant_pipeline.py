@@ -0,0 +1,188 @@
+"""
+Еженедельная выдача грантов: поэтапный конвейер, который можно безопасно перезапускать
+
+Выдача идет после закрытия недели (сброс рейтинга в понедельник 00:00 пишет снимок итоговой
+таблицы в leaderboard_snapshots), победители выбираются по этому снимку. Пока неделя
+не закрыта, запуск завершается ошибкой WeekNotClosed и догоняется позже.
+
+Этапы (каждый идемпотентен для пары неделя + победитель):
+1. Выбор победителей - один запрос по снимку недели, победители сохраняются в grants одной транзакцией
+2. Резервирование промокодов - только грантам недели, у которых промокода еще нет
+3. Выгрузка в Google Sheets - только невыгруженные гранты
+4. Уведомление победителей - только неуведомленные, через sender с ограничением частоты
+
+Этапы 2-4 каждый запуск проходят для всех незавершенных грантов, независимо от недели
+(database.get_pending_grants): грант, которому не хватило промокода или не дошло сообщение,
+дообрабатывается следующим запуском. Если после этапов у кого-то из победителей нет промокода
+или сообщения, запуск завершается ошибкой GrantsPending - job_runs отмечает слот как
+неудачный, и его догоняет следующий старт бота. Вручную: python -m grant_pipeline.
+Если процесс упал посередине, повторный запуск для той же недели продолжит с места остановки.
+Если задачу выполняет ведущая реплика (holds_lease), аренда проверяется перед выгрузкой и перед
+каждым сообщением победителю: реплика, потерявшая аренду, останавливается, и новая ведущая
+продолжает по тем же отметкам exported_at/notified_at без повторных сообщений.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+import database
+import google_sheets
+import leader
+import promo_pool
+import sender
+
+logger = logging.getLogger(__name__)
+
+GRANT_AMOUNT = 30000
+WINNERS_LIMIT = 10
+
+
+class GrantsPending(Exception):
+    """После запуска остались победители без промокода или без сообщения"""
+
+
+class WeekNotClosed(Exception):
+    """Сезон прошлой недели еще не закрыт: снимка итоговой таблицы нет"""
+
+
+def current_week_date(now: datetime = None) -> str:
+    """Ключ недели - дата понедельника текущей недели"""
+    return database.current_week_date(now)
+
+
+def format_grant_message(promo_code: str) -> str:
+    """Текст сообщения победителю"""
+    return (
+        "🎉 <b>Поздравляем!</b>\n\n"
+        "Привет, мы видели твои классные способности, вот тебе грант на 30 тысяч на любую профессию школы Банбэнк Эдюкейшн.\n\n"
+        f"🎫 <b>Твой промокод:</b> <code>{promo_code}</code>\n\n"
+        "🔗 <a href='https://bangbangeducation.ru/sale'>Bang Bang Education</a>"
+    )
+
+
+def check_lease(holds_lease, stage: str):
+    """LeaseLost, если задача выполняется по аренде и аренда уже не наша"""
+    if holds_lease is not None and not holds_lease():
+        raise leader.LeaseLost(f"Выдача грантов остановлена перед этапом '{stage}': аренда потеряна")
+
+
+async def reserve_promo_codes(grants: list):
+    """Этап 2: закрепить промокоды из пула за грантами, у которых их еще нет"""
+    for grant in grants:
+        if not grant["promo_code"]:
+            grant["promo_code"] = await promo_pool.take(grant["id"])
+
+
+async def export_grants(grants: list) -> int:
+    """Этап 3: выгрузить в Google Sheets гранты, которые еще не выгружены (одним запросом)"""
+    pending = [grant for grant in grants if not grant["exported_at"] and grant["promo_code"]]
+    if not pending:
+        return 0
+    if not await google_sheets.add_grants_to_sheet(pending):
+        return 0
+    for grant in pending:
+        await database.mark_grant_exported(grant["id"])
+    return len(pending)
+
+
+async def notify_winners(bot, grants: list, holds_lease=None) -> int:
+    """Этап 4: отправить промокоды победителям, которые их еще не получили
+
+    holds_lease() проверяется перед каждой отправкой; как только аренды нет - LeaseLost.
+    """
+    notified = 0
+    for grant in grants:
+        if grant["notified_at"] or not grant["promo_code"]:
+            continue
+        check_lease(holds_lease, "уведомление победителей")
+        try:
+            await sender.send_message(
+                bot,
+                grant["user_id"],
+                format_grant_message(grant["promo_code"]),
+                parse_mode='HTML',
+                disable_web_page_preview=False
+            )
+            await database.mark_grant_notified(grant["id"])
+            notified += 1
+            logger.info(f"Грант с промокодом {grant['promo_code']} отправлен пользователю {grant['user_id']}")
+        except Exception as e:
+            # notified_at не отмечен: грант вернет следующий запуск (get_pending_grants)
+            logger.error(f"Ошибка при отправке гранта пользователю {grant['user_id']}: {e}", exc_info=True)
+    return notified
+
+
+async def process_pending_grants(bot, holds_lease=None) -> dict:
+    """Этапы 2-4 для всех незавершенных грантов; вернуть, сколько сделано и сколько осталось"""
+    grants = await database.get_pending_grants()
+    await reserve_promo_codes(grants)
+    check_lease(holds_lease, "выгрузка в Google Sheets")
+    exported = await export_grants(grants)
+    notified = await notify_winners(bot, grants, holds_lease)
+    # Выгрузка без настроенного Sheets не проходит никогда, поэтому в остаток она не входит
+    undelivered = [
+        grant for grant in await database.get_pending_grants()
+        if not grant["promo_code"] or not grant["notified_at"]
+    ]
+    return {"pending": len(grants), "exported": exported, "notified": notified, "undelivered": undelivered}
+
+
+async def run_weekly_grants(bot, week_date: str = None, holds_lease=None) -> dict:
+    """Провести выдачу грантов за закрытую неделю и дообработать незавершенные гранты
+
+    week_date - неделя снимка итоговой таблицы; по умолчанию - неделя, закрытая сбросом
+    рейтинга в этот понедельник (WeekNotClosed, если сброса еще не было).
+    holds_lease - проверка аренды ведущей реплики (None - без проверки, например из CLI).
+    GrantsPending - кто-то из победителей остался без промокода или без сообщения.
+    """
+    week_date = week_date or await database.get_closed_week()
+    if week_date is None:
+        raise WeekNotClosed("Прошлая неделя еще не закрыта (сброс рейтинга не выполнен), победителей выбрать не по чему")
+
+    winners = await database.select_weekly_grant_winners(
+        week_date, limit=WINNERS_LIMIT, grant_amount=GRANT_AMOUNT
+    )
+    if not winners:
+        logger.info(f"Нет подходящих лидеров для выдачи грантов за неделю {week_date}")
+
+    result = await process_pending_grants(bot, holds_lease)
+    logger.info(
+        f"Гранты за неделю {week_date}: победителей {winners}, незавершенных грантов {result['pending']}, "
+        f"выгружено сейчас {result['exported']}, уведомлено сейчас {result['notified']}"
+    )
+    if result["undelivered"]:
+        raise GrantsPending(
+            f"Без промокода или сообщения осталось грантов: {len(result['undelivered'])} "
+            f"(id {', '.join(str(grant['id']) for grant in result['undelivered'])})"
+        )
+    return {"week_date": week_date, "winners": winners, "exported": result["exported"], "notified": result["notified"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Дообработать незавершенные гранты (промокод, выгрузка, сообщение победителю)"
+    )
+    parser.add_argument("--week", help="также выбрать победителей закрытой недели YYYY-MM-DD (по ее снимку)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    import config
+    from telegram import Bot
+
+    async def run():
+        await database.init_db()
+        async with Bot(config.BOT_TOKEN) as bot:
+            if args.week:
+                result = await run_weekly_grants(bot, args.week)
+            else:
+                result = await process_pending_grants(bot)
+                if result["undelivered"]:
+                    raise GrantsPending(f"Без промокода или сообщения осталось грантов: {len(result['undelivered'])}")
+        print(result)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Проверки живости и готовности (/healthz, /readyz) и сторож event loop
+
+/healthz отвечает сам event loop: если ответ пришел, loop не завис. В теле - последняя
+задержка loop. /readyz проверяет, что бот может обрабатывать апдейты: база открывается
+и схема создана, словари морфологии загружены, post_init завершен.
+
+Сторож: корутина-пульс раз в WATCHDOG_INTERVAL_MS отмечает время и меряет задержку loop,
+а отдельный поток следит за пульсом. Если loop не отвечает дольше WATCHDOG_THRESHOLD_MS,
+поток пишет в лог стек потока event loop - то место, которое его блокирует
+(синхронный вызов gspread, долгий разбор pymorphy и т.п.).
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+import answer_checker
+import database
+import metrics
+import startup
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_INTERVAL_MS = float(os.getenv("WATCHDOG_INTERVAL_MS", "100"))
+WATCHDOG_THRESHOLD_MS = float(os.getenv("WATCHDOG_THRESHOLD_MS", "500"))
+READY_CHECK_TIMEOUT = 2.0
+
+LOOP_STALLS = metrics.Counter("bot_event_loop_stalls_total", "Сколько раз event loop был заблокирован дольше порога")
+
+
+class Watchdog:
+    """Пульс в event loop и поток, который снимает стек, когда пульс пропадает"""
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_beat = time.monotonic()
+        self.lag = 0.0
+        self._loop_thread_id = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    async def heartbeat(self):
+        """Корутина-пульс: отмечает время и меряет задержку пробуждения loop"""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.last_beat = time.monotonic()
+            metrics.LOOP_LAG_SECONDS.observe(self.lag)
+            metrics.LOOP_LAG_CURRENT.set(self.lag)
+
+    def start(self) -> asyncio.Task:
+        """Запустить пульс в текущем loop и поток-сторож"""
+        self._loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        return asyncio.create_task(self.heartbeat())
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _watch(self):
+        stalled_since = None
+        while not self._stop_event.wait(self.interval):
+            silence = time.monotonic() - self.last_beat
+            if silence <= self.threshold + self.interval:
+                if stalled_since is not None:
+                    logger.warning(
+                        "[WATCHDOG] Event loop снова отвечает после блокировки на %.2f с",
+                        time.monotonic() - stalled_since
+                    )
+                    stalled_since = None
+                continue
+            if stalled_since is None:
+                stalled_since = self.last_beat
+                LOOP_STALLS.inc()
+                logger.warning(
+                    "[WATCHDOG] Event loop не отвечает %.2f с, стек потока loop:\n%s",
+                    silence, self.loop_stack()
+                )
+
+    def loop_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        return "".join(traceback.format_stack(frame)) if frame is not None else "(поток loop не найден)"
+
+
+watchdog = Watchdog(WATCHDOG_INTERVAL_MS / 1000, WATCHDOG_THRESHOLD_MS / 1000)
+
+
+def _json_response(status: int, payload: dict):
+    return status, "application/json; charset=utf-8", json.dumps(payload, ensure_ascii=False) + "\n"
+
+
+def healthz():
+    return _json_response(200, {"status": "ok", "loop_lag_ms": round(watchdog.lag * 1000, 1)})
+
+
+async def _check_db():
+    async with database.connect() as db:
+        cursor = await db.execute("SELECT 1 FROM users LIMIT 1")
+        await cursor.fetchall()
+
+
+async def readyz():
+    checks = {}
+    try:
+        await asyncio.wait_for(_check_db(), READY_CHECK_TIMEOUT)
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"error: {e.__class__.__name__}: {e}"
+    checks["morphology"] = "ok" if answer_checker.is_ready() else "loading"
+    checks["startup"] = "ok" if "serving" in startup.phases else "starting"
+    ready = all(value == "ok" for value in checks.values())
+    return _json_response(200 if ready else 503, {"status": "ready" if ready else "not ready", "checks": checks})
+
+
+def register_routes():
+    """Добавить /healthz и /readyz в HTTP-сервер метрик"""
+    metrics.ROUTES["/healthz"] = healthz
+    metrics.ROUTES["/readyz"] = readyz
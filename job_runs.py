@@ -0,0 +1,122 @@
+"""
+Запуски задач планировщика в базе: каждый запуск по расписанию - один раз, пропущенные догоняются
+
+Запуск задачи по cron привязан к слоту - времени по расписанию, за которое он выполняется
+(например, "generate_daily_riddles" за 2024-03-04 00:00). Перед выполнением слот занимается
+в таблице job_runs; уже выполненный слот второй раз не запускается - ни после рестарта
+в полночь, ни на другой реплике. Упавший или прерванный запуск можно повторить.
+
+Если бот не работал в момент запуска (понедельник 00:00 и т.п.), при старте планировщика
+задача с невыполненным последним слотом запускается сразу, если с него прошло не больше
+JOB_GRACE_SECONDS. Задачи по интервалу (напоминания, синхронизация таблицы) тоже
+записываются, но не догоняются: они и так скоро выполнятся снова.
+
+Задачи выполняет только ведущая реплика (leader.py), поэтому слот в состоянии running -
+это запуск, прерванный падением процесса, и его можно занять снова.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from functools import wraps
+
+from apscheduler.triggers.cron import CronTrigger
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Сколько времени после пропущенного запуска его еще стоит догонять (секунды)
+JOB_GRACE_SECONDS = float(os.getenv("JOB_GRACE_SECONDS", str(6 * 3600)))
+
+# Насколько далеко в прошлом искать последний слот (самый редкий cron - раз в неделю)
+SLOT_LOOKBACK = timedelta(days=8)
+
+# Сколько хранить записи о запусках
+KEEP_RUNS_DAYS = 60
+
+# Через сколько после догоняемой задачи запускать догоняемую зависимую (секунды)
+DEPENDENCY_DELAY_SECONDS = 60
+
+
+def previous_fire_time(trigger, now: datetime = None):
+    """Последний запуск cron-триггера не позже now (None - не cron или запусков не было)"""
+    if not isinstance(trigger, CronTrigger):
+        return None
+    now = now or datetime.now(trigger.timezone)
+    fire_time = trigger.get_next_fire_time(None, now - SLOT_LOOKBACK)
+    last = None
+    while fire_time is not None and fire_time <= now:
+        last = fire_time
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time + timedelta(microseconds=1))
+    return last
+
+
+def slot_key(trigger, now: datetime = None) -> str:
+    """Слот текущего запуска: время по расписанию для cron, иначе фактическое время"""
+    fire_time = previous_fire_time(trigger, now)
+    if fire_time is None:
+        return (now or datetime.now()).isoformat(timespec="seconds")
+    return fire_time.isoformat(timespec="seconds")
+
+
+def tracked(job_id: str, trigger):
+    """Декоратор задачи: занять слот в job_runs, выполнить, записать результат
+
+    Если слот уже выполнен, задача не запускается. Исключение задачи записывается
+    как failed и пробрасывается дальше (метрики, лог планировщика).
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            slot = slot_key(trigger)
+            attempt = await database.claim_job_run(job_id, slot)
+            if attempt is None:
+                logger.info("Задача %s за %s уже выполнена, пропускаем", job_id, slot)
+                return None
+            if attempt > 1:
+                logger.warning("Задача %s за %s: повторная попытка %d", job_id, slot, attempt)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                await database.finish_job_run(job_id, slot, error=f"{e.__class__.__name__}: {e}")
+                raise
+            await database.finish_job_run(job_id, slot)
+            return result
+        return wrapper
+    return decorator
+
+
+async def catch_up(scheduler, grace_overrides: dict = None, dependencies: dict = None) -> list:
+    """Запустить сейчас cron-задачи, последний слот которых пропущен и не старше
+    JOB_GRACE_SECONDS (для задач из grace_overrides - своего срока)
+
+    Задача без единой записи о запусках не догоняется: возможно, слот уже выполнил код
+    до появления job_runs (сброс рейтинга второй раз за понедельник). Исключение -
+    задачи из grace_overrides, их повтор безопасен. dependencies - {задача: задача, после
+    которой она выполняется}: если догоняются обе, зависимая запускается на
+    DEPENDENCY_DELAY_SECONDS позже. Возвращает id запущенных задач.
+    """
+    await database.delete_old_job_runs(KEEP_RUNS_DAYS)
+    caught_up = []
+    for job in scheduler.get_jobs():
+        now = datetime.now(job.trigger.timezone) if isinstance(job.trigger, CronTrigger) else None
+        fire_time = previous_fire_time(job.trigger, now)
+        grace = (grace_overrides or {}).get(job.id, JOB_GRACE_SECONDS)
+        if fire_time is None or (now - fire_time).total_seconds() > grace:
+            continue
+        if job.id not in (grace_overrides or {}) and not await database.has_job_runs(job.id):
+            continue
+        if await database.is_job_run_done(job.id, fire_time.isoformat(timespec="seconds")):
+            continue
+        logger.warning(
+            "Задача %s пропустила запуск %s (бот не работал), запускаем сейчас",
+            job.id, fire_time.isoformat(timespec="minutes")
+        )
+        job.modify(next_run_time=now)
+        caught_up.append(job.id)
+    for job_id, dependency in (dependencies or {}).items():
+        if job_id in caught_up and dependency in caught_up:
+            job = scheduler.get_job(job_id)
+            job.modify(next_run_time=job.next_run_time + timedelta(seconds=DEPENDENCY_DELAY_SECONDS))
+            logger.info("Задача %s догоняется после %s", job_id, dependency)
+    return caught_up
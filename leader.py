@@ -0,0 +1,146 @@
+"""
+Выбор ведущей реплики через аренду в базе: задачи планировщика выполняет только одна
+
+Каждая реплика раз в LEASE_RENEW_SECONDS пытается взять или продлить аренду (строка
+в таблице leases) на LEASE_TTL_SECONDS. Держатель аренды - ведущий: у него запущен
+планировщик. Остальные ждут; если ведущий упал и перестал продлевать аренду, ее заберет
+другая реплика не позже чем через LEASE_TTL_SECONDS + LEASE_RENEW_SECONDS. При штатной
+остановке аренда отпускается сразу, и переход занимает не больше LEASE_RENEW_SECONDS.
+
+Ведущий, который не смог продлить аренду (база недоступна), слагает полномочия раньше,
+чем аренда истечет у остальных: две реплики не выполняют задачи одновременно.
+Номер срока (term) растет при каждой смене ведущего и пишется в лог.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import socket
+import time
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL_SECONDS = float(os.getenv("LEASE_TTL_SECONDS", "15"))
+LEASE_RENEW_SECONDS = float(os.getenv("LEASE_RENEW_SECONDS", "5"))
+
+# Аренда, которая дает право выполнять задачи планировщика
+SCHEDULER_LEASE = "scheduler"
+
+IS_LEADER = metrics.Gauge("bot_leader", "1 - реплика держит аренду и выполняет задачи планировщика")
+LEADER_TRANSITIONS = metrics.Counter("bot_leader_transitions_total", "Смены роли реплики", ["transition"])
+
+
+class LeaseLost(Exception):
+    """Задача остановлена посередине: аренда больше не у этой реплики"""
+
+
+def make_holder_id() -> str:
+    """Идентификатор реплики: хост, pid и случайный суффикс (pid переиспользуется после рестарта)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+
+
+class LeaderElection:
+    """Цикл взятия и продления аренды; on_elected/on_lost вызываются при смене роли"""
+
+    def __init__(self, name: str, on_elected, on_lost, ttl: float = LEASE_TTL_SECONDS,
+                 renew_interval: float = LEASE_RENEW_SECONDS, holder: str = None):
+        if renew_interval * 2 > ttl:
+            raise ValueError("Аренду нужно продлевать хотя бы дважды за ее срок")
+        self.name = name
+        self.on_elected = on_elected
+        self.on_lost = on_lost
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.holder = holder or make_holder_id()
+        self.is_leader = False
+        self.term = None
+        # До какого момента (time.monotonic) аренда точно наша
+        self._valid_until = 0.0
+        self._stopped = asyncio.Event()
+        self._task = None
+
+    async def run(self):
+        """Работать до stop(): при выходе сложить полномочия и отпустить аренду"""
+        logger.info("[ВЕДУЩИЙ] Реплика %s участвует в выборе (%s)", self.holder, self.name)
+        try:
+            while not self._stopped.is_set():
+                await self._tick()
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), self.renew_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self.is_leader:
+                await self._step_down("остановка реплики")
+            try:
+                await asyncio.wait_for(database.release_lease(self.name, self.holder), self.renew_interval)
+            except Exception as e:
+                logger.warning("[ВЕДУЩИЙ] Не удалось отпустить аренду %s: %s", self.name, e)
+
+    def holds_lease(self) -> bool:
+        """Аренда точно наша прямо сейчас: проверять в задаче перед действиями с последствиями
+
+        Ведущий, процесс которого был заморожен дольше срока аренды, узнает об этом
+        только на следующем продлении; эта проверка не даст ему продолжить задачу раньше.
+        """
+        return self.is_leader and time.monotonic() < self._valid_until
+
+    def start(self) -> asyncio.Task:
+        """Запустить цикл выбора в текущем loop"""
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """Остановить цикл и дождаться, пока аренда будет отпущена"""
+        self._stopped.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _tick(self):
+        started = time.monotonic()
+        try:
+            # Зависший запрос не должен пережить аренду: ждем не дольше интервала продления
+            term = await asyncio.wait_for(
+                database.acquire_lease(self.name, self.holder, self.ttl), self.renew_interval
+            )
+        except Exception as e:
+            logger.warning("[ВЕДУЩИЙ] Не удалось продлить аренду %s: %s", self.name, e)
+            # Слагаем полномочия заранее: следующая попытка (пауза и сам запрос) может
+            # закончиться уже после истечения аренды
+            if self.is_leader and time.monotonic() + 2 * self.renew_interval >= self._valid_until:
+                await self._step_down("аренду не удалось продлить")
+            return
+
+        if term is None:
+            if self.is_leader:
+                await self._step_down("аренду забрала другая реплика")
+            return
+
+        if self.is_leader and term != self.term:
+            # Между продлениями аренда успела истечь и смениться (например, loop был заблокирован)
+            await self._step_down("аренда истекла между продлениями")
+        self._valid_until = started + self.ttl
+        if not self.is_leader:
+            self.is_leader, self.term = True, term
+            IS_LEADER.set(1)
+            LEADER_TRANSITIONS.inc("elected")
+            logger.info("[ВЕДУЩИЙ] Реплика %s стала ведущей (%s, срок %d)", self.holder, self.name, term)
+            await self._call(self.on_elected)
+
+    async def _step_down(self, reason: str):
+        self.is_leader = False
+        IS_LEADER.set(0)
+        LEADER_TRANSITIONS.inc("lost")
+        logger.warning("[ВЕДУЩИЙ] Реплика %s больше не ведущая (%s): %s", self.holder, self.name, reason)
+        await self._call(self.on_lost)
+
+    async def _call(self, callback):
+        try:
+            result = callback()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            logger.error("[ВЕДУЩИЙ] Ошибка при смене роли: %s", e, exc_info=True)
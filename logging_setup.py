@@ -0,0 +1,121 @@
+"""
+Неблокирующее логирование: обработчики вызываются через очередь в отдельном потоке
+(QueueHandler/QueueListener), вывод текстом или JSON, выборочные логи на каждый ответ
+
+Event loop только кладет запись в очередь; запись в stderr или файл, форматирование
+времени и JSON делает поток QueueListener.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Логгер подробностей о каждом ответе: при уровне DEBUG пишется только доля записей
+ANSWER_LOGGER = "answers"
+
+# Стандартные атрибуты LogRecord; все остальное пришло через extra= и попадает в JSON
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON; поля из extra= добавляются в объект"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает примерно долю rate записей"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не форматирует запись целиком в вызывающем потоке
+
+    Аргументы подставляются сразу (объекты могут измениться, пока запись в очереди),
+    трейсбек превращается в текст отдельно от сообщения, а время и JSON оформляет
+    обработчик в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", answer_sample_rate: float = 1.0, stream=None):
+    """Настроить корневой логгер: очередь в event loop, вывод в отдельном потоке
+
+    fmt - "text" или "json"; answer_sample_rate - доля DEBUG-записей логгера ANSWER_LOGGER,
+    которые попадают в лог. Повторный вызов заменяет прежнюю настройку.
+    """
+    global _listener
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level)
+
+    # httpx пишет INFO на каждый запрос к Bot API - это по строке лога на каждое сообщение
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    answers = logging.getLogger(ANSWER_LOGGER)
+    for old_filter in [f for f in answers.filters if isinstance(f, SamplingFilter)]:
+        answers.removeFilter(old_filter)
+    if answer_sample_rate < 1:
+        answers.addFilter(SamplingFilter(answer_sample_rate))
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Дописать оставшиеся в очереди записи и остановить поток логирования"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,257 @@
+"""
+Метрики бота в памяти и HTTP-эндпоинт /metrics в формате Prometheus
+
+Все значения агрегируются на месте (счетчики и корзины гистограмм), поэтому
+наблюдение стоит несколько микросекунд и не зависит от числа апдейтов.
+"""
+import asyncio
+import bisect
+import inspect
+import logging
+import time
+from functools import wraps
+
+from telegram.request import HTTPXRequest
+
+import user_locks
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {value}")
+        return lines
+
+
+class Gauge:
+    """Текущее значение с метками; можно задать функцию, которая считает значение при выгрузке"""
+
+    def __init__(self, name: str, documentation: str, labels=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.function = function
+        self._values = {}
+        _registry.append(self)
+
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        if self.function is not None:
+            lines.append(f"{self.name} {self.function()}")
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма длительностей с метками (корзины, сумма, количество)"""
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики корзин (последняя - +Inf), сумма]
+        self._series = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Метрики бота
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработки апдейта обработчиком", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ["handler"])
+ROUTE_SECONDS = Histogram("bot_route_seconds", "Время обработки маршрута кнопки", ["router", "route"])
+ROUTE_ERRORS = Counter("bot_route_errors_total", "Исключения в маршрутах кнопок", ["router", "route"])
+DB_SECONDS = Histogram("bot_db_seconds", "Время выполнения функций database", ["function"])
+DB_ERRORS = Counter("bot_db_errors_total", "Исключения в функциях database", ["function"])
+ANSWER_CHECK_SECONDS = Histogram("bot_answer_check_seconds", "Время проверки ответа (answer_checker)")
+TELEGRAM_SECONDS = Histogram("bot_telegram_request_seconds", "Время запросов к Telegram Bot API", ["method"])
+TELEGRAM_ERRORS = Counter("bot_telegram_request_errors_total", "Ошибки запросов к Telegram Bot API", ["method"])
+JOB_SECONDS = Histogram("bot_job_seconds", "Длительность задач планировщика", ["job"])
+JOB_ERRORS = Counter("bot_job_errors_total", "Исключения в задачах планировщика", ["job"])
+LOOP_LAG_SECONDS = Histogram(
+    "bot_event_loop_lag_seconds", "Задержка пробуждения event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_LAG_CURRENT = Gauge("bot_event_loop_lag_current_seconds", "Последняя измеренная задержка event loop")
+STARTUP_SECONDS = Gauge("bot_startup_phase_seconds", "Завершение фазы старта, секунд от запуска процесса", ["phase"])
+ACTIVE_USERS = Gauge(
+    "bot_users_in_progress", "Пользователи, чьи апдейты сейчас обрабатываются",
+    function=lambda: user_locks.active_users_count()
+)
+
+
+def timed(histogram: Histogram, *label_values, errors: Counter = None):
+    """Декоратор async-функции: длительность в гистограмму, исключения в счетчик"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(*label_values)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, *label_values)
+        return wrapper
+    return decorator
+
+
+def handler(name: str):
+    """Декоратор обработчика апдейтов"""
+    return timed(HANDLER_SECONDS, name, errors=HANDLER_ERRORS)
+
+
+def job(name: str):
+    """Декоратор задачи планировщика"""
+    return timed(JOB_SECONDS, name, errors=JOB_ERRORS)
+
+
+def instrument_module(module, histogram: Histogram = DB_SECONDS, errors: Counter = DB_ERRORS):
+    """Обернуть все публичные async-функции модуля таймером (метка - имя функции)
+
+    Вызовы через атрибут модуля (database.check_answer(...)) начинают попадать в метрики.
+    Повторный вызов ничего не делает.
+    """
+    for name, func in list(vars(module).items()):
+        if name.startswith("_") or not inspect.iscoroutinefunction(func):
+            continue
+        if getattr(func, "__module__", None) != module.__name__ or hasattr(func, "__wrapped__"):
+            continue
+        setattr(module, name, timed(histogram, name, errors=errors)(func))
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTP-клиент Bot API, который меряет каждый исходящий запрос (sendMessage и т.д.)"""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data=request_data, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.inc(api_method)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, api_method)
+        if code >= 400:
+            TELEGRAM_ERRORS.inc(api_method)
+        return code, payload
+
+
+# Пути HTTP-сервера: путь -> функция (или корутина) без аргументов,
+# возвращающая (статус, content-type, тело)
+ROUTES = {
+    "/metrics": lambda: (200, "text/plain; version=0.0.4; charset=utf-8", render())
+}
+
+_STATUS_TEXT = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки запроса не нужны, но их нужно дочитать
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?", 1)[0] if len(parts) > 1 else "/"
+        route = ROUTES.get(path)
+        if route is None:
+            status, content_type, body = 404, "text/plain; charset=utf-8", "not found\n"
+        else:
+            result = route()
+            if inspect.isawaitable(result):
+                result = await result
+            status, content_type, body = result
+        data = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Ошибка HTTP-запроса к метрикам: {e}")
+    finally:
+        writer.close()
+
+
+async def start_http_server(port: int, host: str = "127.0.0.1"):
+    """Запустить HTTP-сервер метрик (port=0 - не запускать)"""
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
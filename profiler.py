@@ -0,0 +1,224 @@
+"""
+Профилирование работающего бота по запросу: /profile у админа или сигнал SIGUSR1
+
+За ограниченное время снимается профиль event loop, дамп asyncio-задач в начале
+и в конце и предупреждения asyncio о медленных колбэках. Результаты пишутся в файлы
+в PROFILE_DIR/<время>/. Пока профилирование не запущено, ничего не установлено
+и накладных расходов нет.
+
+Режимы:
+- "sample" - поток раз в PROFILE_INTERVAL_MS снимает стек потока event loop
+  (sys._current_frames); дешево, время в синхронных вызовах тоже видно.
+  stacks.folded подходит для flamegraph.pl и speedscope
+- "cprofile" - cProfile в потоке event loop; точные счетчики вызовов, но заметно
+  замедляет бота на время профилирования
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "100"))
+
+MAX_SECONDS = 300
+MODES = ("sample", "cprofile")
+
+_running = False
+
+# Ссылки на задачи, запущенные из обработчика сигнала
+_signal_tasks = set()
+
+
+def is_running() -> bool:
+    return _running
+
+
+def dump_tasks() -> str:
+    """Текстовый дамп всех asyncio-задач со стеками корутин"""
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    out = io.StringIO()
+    out.write(f"Задач: {len(tasks)}\n\n")
+    for task in tasks:
+        coro = task.get_coro()
+        out.write(f"{task.get_name()}: {getattr(coro, '__qualname__', coro)}\n")
+        task.print_stack(limit=20, file=out)
+        out.write("\n")
+    return out.getvalue()
+
+
+class _StackSampler(threading.Thread):
+    """Поток, который периодически снимает стек целевого потока"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, limit: int = 30) -> str:
+        """Функции с наибольшей долей сэмплов: собственное время и вместе с вложенными"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        samples = max(self.samples, 1)
+        lines = [f"Сэмплов: {self.samples}, интервал {self.interval * 1000:.1f}ms\n", "Собственное время:"]
+        lines += [f"  {count / samples:6.1%}  {name}" for name, count in own.most_common(limit)]
+        lines += ["", "С вложенными вызовами:"]
+        lines += [f"  {count / samples:6.1%}  {name}" for name, count in total.most_common(limit)]
+        return "\n".join(lines) + "\n"
+
+
+class _ListHandler(logging.Handler):
+    """Собирает записи в список (предупреждения asyncio о медленных колбэках)"""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+async def profile(seconds: float = PROFILE_SECONDS, mode: str = "sample", directory: str = PROFILE_DIR) -> dict:
+    """Профилировать event loop seconds секунд; возвращает {"dir": ..., "summary": ...}"""
+    global _running
+    if _running:
+        raise RuntimeError("Профилирование уже идет")
+    if mode not in MODES:
+        raise ValueError(f"Неизвестный режим профилирования: {mode}")
+    seconds = max(1.0, min(float(seconds), MAX_SECONDS))
+
+    loop = asyncio.get_running_loop()
+    out_dir = os.path.join(directory, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(out_dir, exist_ok=True)
+    files = {"tasks_start.txt": dump_tasks()}
+    _running = True
+    logger.info("Профилирование (%s) на %.0f с, результаты в %s", mode, seconds, out_dir)
+
+    # Медленные колбэки asyncio сообщает только в debug-режиме loop
+    was_debug, was_slow = loop.get_debug(), loop.slow_callback_duration
+    slow_handler = _ListHandler()
+    slow_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    asyncio_logger = logging.getLogger("asyncio")
+    asyncio_logger.addHandler(slow_handler)
+    loop.slow_callback_duration = SLOW_CALLBACK_MS / 1000
+    loop.set_debug(True)
+
+    sampler = profiler = None
+    started = time.perf_counter()
+    try:
+        if mode == "sample":
+            sampler = _StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+            sampler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        await asyncio.sleep(seconds)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        if profiler is not None:
+            profiler.disable()
+        loop.set_debug(was_debug)
+        loop.slow_callback_duration = was_slow
+        asyncio_logger.removeHandler(slow_handler)
+        _running = False
+
+    elapsed = time.perf_counter() - started
+    files["tasks_end.txt"] = dump_tasks()
+    files["slow_callbacks.log"] = "\n".join(slow_handler.lines) + ("\n" if slow_handler.lines else "")
+    if sampler is not None:
+        summary = sampler.summary()
+        files["stacks.folded"] = sampler.folded()
+        files["stacks.txt"] = summary
+    else:
+        stats_out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stats_out)
+        stats.sort_stats("cumulative").print_stats(40)
+        stats.sort_stats("tottime").print_stats(40)
+        summary = stats_out.getvalue()
+        files["profile.txt"] = summary
+        profiler.dump_stats(os.path.join(out_dir, "profile.prof"))
+
+    # Запись файлов - вне event loop
+    await asyncio.to_thread(_write_files, out_dir, files)
+    logger.info(
+        "Профилирование завершено за %.1f с: %s, медленных колбэков: %d",
+        elapsed, out_dir, len(slow_handler.lines)
+    )
+    return {"dir": out_dir, "summary": summary, "slow_callbacks": len(slow_handler.lines)}
+
+
+def _write_files(out_dir: str, files: dict):
+    for name, content in files.items():
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+def _on_signal_task_done(task: asyncio.Task):
+    _signal_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Ошибка профилирования по сигналу: %s", task.exception(), exc_info=task.exception())
+
+
+def install_signal_handler(sig=getattr(signal, "SIGUSR1", None), seconds: float = PROFILE_SECONDS) -> bool:
+    """По сигналу (по умолчанию SIGUSR1) запускать профилирование в текущем event loop
+
+    Возвращает False, если сигналы в loop не поддерживаются (Windows).
+    """
+    if sig is None:
+        return False
+    loop = asyncio.get_running_loop()
+
+    def on_signal():
+        if _running:
+            logger.warning("Профилирование уже идет, сигнал пропущен")
+            return
+        task = loop.create_task(profile(seconds))
+        _signal_tasks.add(task)
+        task.add_done_callback(_on_signal_task_done)
+
+    try:
+        loop.add_signal_handler(sig, on_signal)
+    except (NotImplementedError, RuntimeError):
+        return False
+    logger.info("Профилирование по сигналу %s: kill -%s %d", sig.name, sig.name[3:], os.getpid())
+    return True
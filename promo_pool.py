@@ -0,0 +1,47 @@
+"""
+Пул заранее сгенерированных промокодов: выдача при гранте без поиска по выданным кодам
+"""
+import logging
+
+import database
+import promo_generator
+
+logger = logging.getLogger(__name__)
+
+# Сколько свободных кодов держать в пуле (с запасом на несколько недель розыгрышей)
+POOL_SIZE = 100
+PROMO_PREFIX = "BBE"
+
+
+async def refill(target: int = POOL_SIZE) -> int:
+    """Дополнить пул до target свободных кодов; возвращает число добавленных"""
+    added = 0
+    free = await database.count_free_promo_codes()
+    while free < target:
+        inserted = await database.add_promo_codes(
+            promo_generator.generate_promo_codes(target - free, prefix=PROMO_PREFIX)
+        )
+        added += inserted
+        free += inserted
+    if added:
+        logger.info(f"Пул промокодов пополнен на {added}, свободно {free}")
+    return added
+
+
+async def take(grant_id: int) -> str:
+    """Выдать гранту промокод из пула (тот же код при повторном вызове)"""
+    promo_code = await database.claim_promo_code(grant_id)
+    if promo_code is None:
+        # Пул опустел раньше фонового пополнения - пополняем сразу
+        logger.warning("Пул промокодов пуст, пополняем во время выдачи гранта")
+        await refill()
+        promo_code = await database.claim_promo_code(grant_id)
+    return promo_code
+
+
+async def refill_job():
+    """Задача планировщика: поддерживать пул заполненным"""
+    try:
+        await refill()
+    except Exception as e:
+        logger.error(f"Ошибка при пополнении пула промокодов: {e}", exc_info=True)
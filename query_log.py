@@ -0,0 +1,270 @@
+"""
+Инструментирование SQL-запросов: отпечаток запроса, время, строки, место вызова,
+журнал медленных запросов с планом выполнения и сводка запросов на апдейт
+
+Включается и выключается во время работы (enable/disable, /querylog у админа).
+Когда выключено, database.connect() отдает обычное соединение aiosqlite без оберток.
+"""
+import contextvars
+import logging
+import os
+import re
+import sys
+import time
+from functools import wraps
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+enabled = os.getenv("QUERY_LOG", "0") == "1"
+slow_query_seconds = float(os.getenv("SLOW_QUERY_MS", "100")) / 1000
+
+QUERIES_PER_UPDATE = metrics.Histogram(
+    "bot_db_queries_per_update", "Количество SQL-запросов на один апдейт (при включенном query_log)",
+    ["handler"], buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+
+# Отпечаток -> агрегированная статистика
+_stats = {}
+# Отпечаток -> уже снятый план (снимаем один раз)
+_plans = {}
+
+_current_update = contextvars.ContextVar("query_log_update", default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+_SKIP_FILES = (os.path.abspath(__file__), "aiosqlite")
+
+
+def enable():
+    global enabled
+    enabled = True
+    logger.info("Инструментирование SQL-запросов включено")
+
+
+def disable():
+    global enabled
+    enabled = False
+    logger.info("Инструментирование SQL-запросов выключено")
+
+
+def reset():
+    """Сбросить накопленную статистику"""
+    _stats.clear()
+    _plans.clear()
+
+
+def fingerprint(sql: str) -> str:
+    """Запрос без литералов и лишних пробелов - ключ для группировки"""
+    return _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip()
+
+
+def _call_site() -> str:
+    """Первый кадр стека вне этого модуля и aiosqlite: файл:строка функция"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not any(skip in filename for skip in _SKIP_FILES) and "contextlib" not in filename:
+            return f"{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class _Record:
+    """Один выполненный запрос; завершается, когда курсор выбран до конца или закрыт
+    (или сразу, если запрос не возвращает строк)"""
+
+    __slots__ = ("sql", "params", "site", "seconds", "rows", "done")
+
+    def __init__(self, sql, params, site):
+        self.sql = sql
+        self.params = params
+        self.site = site
+        self.seconds = 0.0
+        self.rows = 0
+        self.done = False
+
+
+class InstrumentedCursor:
+    """Курсор, который досчитывает время и строки при каждой выборке
+
+    Запись завершается, когда строки кончились (fetchone вернул None, fetchall,
+    пустая или неполная пачка fetchmany) или курсор закрыт. Незакрытые курсоры
+    завершает выход из соединения.
+    """
+
+    def __init__(self, cursor, record: _Record, connection):
+        self._cursor = cursor
+        self._record = record
+        self._connection = connection
+
+    async def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = await getattr(self._cursor, method)(*args)
+        self._record.seconds += time.perf_counter() - started
+        return result
+
+    async def fetchone(self):
+        row = await self._fetch("fetchone")
+        if row is None:
+            await self._connection._finish(self._record)
+        else:
+            self._record.rows += 1
+        return row
+
+    async def fetchall(self):
+        rows = await self._fetch("fetchall")
+        self._record.rows += len(rows)
+        await self._connection._finish(self._record)
+        return rows
+
+    async def fetchmany(self, size=None):
+        size = self._cursor.arraysize if size is None else size
+        rows = await self._fetch("fetchmany", size)
+        self._record.rows += len(rows)
+        if len(rows) < size:
+            await self._connection._finish(self._record)
+        return rows
+
+    async def close(self):
+        await self._connection._finish(self._record)
+        await self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Обертка над соединением aiosqlite, которая записывает каждый запрос"""
+
+    def __init__(self, connection):
+        self._connection = connection
+        # Записи курсоров, которые еще не выбраны до конца и не закрыты
+        self._open_records = []
+
+    async def __aenter__(self):
+        await self._connection.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._finish_open()
+        return await self._connection.__aexit__(*exc_info)
+
+    async def close(self):
+        await self._finish_open()
+        await self._connection.close()
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def _open(self):
+        await self._connection
+        return self
+
+    async def execute(self, sql: str, parameters=None):
+        record = _Record(sql, parameters, _call_site())
+        started = time.perf_counter()
+        try:
+            cursor = await self._connection.execute(sql, parameters)
+        finally:
+            record.seconds = time.perf_counter() - started
+        if cursor.description is None:
+            await self._finish(record)
+        else:
+            self._open_records.append(record)
+        return InstrumentedCursor(cursor, record, self)
+
+    async def executemany(self, sql: str, parameters):
+        parameters = list(parameters)
+        record = _Record(sql, None, _call_site())
+        started = time.perf_counter()
+        try:
+            return await self._connection.executemany(sql, parameters)
+        finally:
+            record.seconds = time.perf_counter() - started
+            record.rows = len(parameters)
+            await self._finish(record)
+
+    async def _finish_open(self):
+        """Завершить записи курсоров, брошенных без выборки до конца"""
+        records, self._open_records = self._open_records, []
+        for record in records:
+            await self._finish(record)
+
+    async def _finish(self, record: _Record):
+        if record.done:
+            return
+        record.done = True
+        if record in self._open_records:
+            self._open_records.remove(record)
+        key = fingerprint(record.sql)
+
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "sites": set()}
+        stats["count"] += 1
+        stats["seconds"] += record.seconds
+        stats["max_seconds"] = max(stats["max_seconds"], record.seconds)
+        stats["rows"] += record.rows
+        stats["sites"].add(record.site)
+
+        update = _current_update.get()
+        if update is not None:
+            update["queries"] += 1
+            update["seconds"] += record.seconds
+
+        if record.seconds >= slow_query_seconds:
+            plan = await self._explain(key, record)
+            logger.warning(
+                "[МЕДЛЕННЫЙ ЗАПРОС] %.1fms, строк: %d, %s\n  %s\n  план: %s",
+                record.seconds * 1000, record.rows, record.site, key, plan
+            )
+
+    async def _explain(self, key: str, record: _Record) -> str:
+        """EXPLAIN QUERY PLAN для медленного запроса (один раз на отпечаток)"""
+        if key in _plans:
+            return _plans[key]
+        try:
+            cursor = await self._connection.execute(f"EXPLAIN QUERY PLAN {record.sql}", record.params)
+            plan = "; ".join(row[-1] for row in await cursor.fetchall())
+        except Exception as e:
+            plan = f"недоступен ({e})"
+        _plans[key] = plan
+        return plan
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def wrap_connection(connection):
+    """Обернуть соединение, если инструментирование включено"""
+    return InstrumentedConnection(connection) if enabled else connection
+
+
+def track_update(handler_name: str):
+    """Декоратор обработчика: сводка SQL-запросов, выполненных за один апдейт"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not enabled:
+                return await func(*args, **kwargs)
+            summary = {"queries": 0, "seconds": 0.0}
+            token = _current_update.set(summary)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _current_update.reset(token)
+                QUERIES_PER_UPDATE.observe(summary["queries"], handler_name)
+                logger.info(
+                    "[SQL НА АПДЕЙТ] %s: %d запросов, %.1fms",
+                    handler_name, summary["queries"], summary["seconds"] * 1000
+                )
+        return wrapper
+    return decorator
+
+
+def top(limit: int = 10, key: str = "seconds") -> list:
+    """Самые тяжелые запросы по суммарному времени (или по count/rows/max_seconds)"""
+    items = sorted(_stats.items(), key=lambda item: item[1][key], reverse=True)[:limit]
+    return [{"fingerprint": sql, **stats, "sites": sorted(stats["sites"])} for sql, stats in items]
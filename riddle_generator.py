@@ -1,290 +1,16 @@
 """
-Генератор дизайнерских загадок
+Генератор дизайнерских загадок: случайная загадка из каталога паков (riddle_packs.py)
 """
+import random
 
-DESIGN_RIDDLES = [
-    # Смешные и простые загадки
-    {
-        "question": "Почему дизайнеры не любят Comic Sans?",
-        "answer": "Потому что он слишком веселый",
-        "hint": "Этот шрифт часто используют не по назначению"
-    },
-    {
-        "question": "Что делает дизайнер, когда ему скучно?",
-        "answer": "Кернит",
-        "hint": "Играет с расстоянием между буквами"
-    },
-    {
-        "question": "Какой цвет получается, если смешать красный и синий?",
-        "answer": "Фиолетовый",
-        "hint": "Вторичный цвет в палитре"
-    },
-    {
-        "question": "Почему дизайнер всегда носит черное?",
-        "answer": "Чтобы не отвлекать от работы",
-        "hint": "Минималистичный подход к одежде"
-    },
-    {
-        "question": "Что общего у дизайнера и кота?",
-        "answer": "Оба любят коробки",
-        "hint": "Речь о макетах и контейнерах"
-    },
-    {
-        "question": "Почему дизайнеры боятся белого листа?",
-        "answer": "Потому что это пустота",
-        "hint": "Страх чистого холста"
-    },
-    {
-        "question": "Какой шрифт используют для всего?",
-        "answer": "Comic Sans",
-        "hint": "Самый популярный шрифт (к сожалению)"
-    },
-    {
-        "question": "Что делает дизайнер первым делом утром?",
-        "answer": "Проверяет Dribbble",
-        "hint": "Популярная платформа для дизайнеров"
-    },
-    {
-        "question": "Почему дизайнеры не спят ночью?",
-        "answer": "Потому что работают",
-        "hint": "Креативный процесс не знает времени"
-    },
-    {
-        "question": "Какой цвет самый популярный в дизайне?",
-        "answer": "Синий",
-        "hint": "Цвет доверия и спокойствия"
-    },
-    {
-        "question": "Что делает дизайнер, когда клиент говорит 'сделай красиво'?",
-        "answer": "Плачет",
-        "hint": "Самая неконкретная задача"
-    },
-    {
-        "question": "Почему дизайнеры любят минимализм?",
-        "answer": "Меньше работы",
-        "hint": "Простота и элегантность"
-    },
-    {
-        "question": "Какой инструмент дизайнер использует чаще всего?",
-        "answer": "Мышь",
-        "hint": "Компьютерная мышь для работы"
-    },
-    {
-        "question": "Что делает дизайнер, когда заканчивает проект?",
-        "answer": "Начинает новый",
-        "hint": "Бесконечный цикл творчества"
-    },
-    {
-        "question": "Почему дизайнеры не используют желтый текст на белом?",
-        "answer": "Потому что не видно",
-        "hint": "Проблема контраста"
-    },
-    {
-        "question": "Что общего между дизайнером и пиццей?",
-        "answer": "Оба работают с пикселями",
-        "hint": "Игра слов: пиксели и пицца"
-    },
-    {
-        "question": "Какой формат изображения самый популярный?",
-        "answer": "JPG",
-        "hint": "Самый распространенный формат фото"
-    },
-    {
-        "question": "Почему дизайнеры любят сетки?",
-        "answer": "Порядок и структура",
-        "hint": "Grid система в дизайне"
-    },
-    {
-        "question": "Что делает дизайнер, когда не знает, что делать?",
-        "answer": "Добавляет тень",
-        "hint": "Классический прием"
-    },
-    {
-        "question": "Почему дизайнеры ненавидят Word?",
-        "answer": "Плохая типографика",
-        "hint": "Не подходит для дизайна"
-    },
-    {
-        "question": "Что общего между дизайнером и программистом?",
-        "answer": "Оба работают за компьютером",
-        "hint": "Общее рабочее место"
-    },
-    {
-        "question": "Какой цвет используют для ошибок?",
-        "answer": "Красный",
-        "hint": "Цвет предупреждения"
-    },
-    {
-        "question": "Почему дизайнеры любят Apple?",
-        "answer": "Красивый дизайн",
-        "hint": "Эстетика и качество"
-    },
-    {
-        "question": "Что делает дизайнер, когда клиент просит 'покрупнее'?",
-        "answer": "Увеличивает размер",
-        "hint": "Простая просьба"
-    },
-    {
-        "question": "Какой шрифт используют для заголовков?",
-        "answer": "Жирный",
-        "hint": "Bold для выделения"
-    },
-    {
-        "question": "Почему дизайнеры не используют все цвета сразу?",
-        "answer": "Это будет слишком ярко",
-        "hint": "Умеренность в палитре"
-    },
-    {
-        "question": "Что делает дизайнер, когда проект не нравится?",
-        "answer": "Переделывает",
-        "hint": "Итеративный процесс"
-    },
-    {
-        "question": "Какой инструмент используют для векторной графики?",
-        "answer": "Illustrator",
-        "hint": "Программа от Adobe"
-    },
-    {
-        "question": "Почему дизайнеры любят пастельные цвета?",
-        "answer": "Они мягкие",
-        "hint": "Спокойная палитра"
-    },
-    {
-        "question": "Что делает дизайнер, когда нужно сделать быстро?",
-        "answer": "Использует шаблон",
-        "hint": "Готовые решения"
-    },
-    # Старые загадки (более сложные)
-    {
-        "question": "Что общего между шрифтом Helvetica и швейцарским флагом?",
-        "answer": "Оба созданы в Швейцарии",
-        "hint": "Страна происхождения имеет значение"
-    },
-    {
-        "question": "Какой цвет получается при смешении всех цветов в аддитивной модели?",
-        "answer": "Белый",
-        "hint": "Противоположность черному в свете"
-    },
-    {
-        "question": "Как называется принцип дизайна, когда элементы визуально сбалансированы?",
-        "answer": "Баланс",
-        "hint": "Один из основных принципов композиции"
-    },
-    {
-        "question": "Какой формат изображения поддерживает прозрачность без потери качества?",
-        "answer": "PNG",
-        "hint": "Популярный формат для веб-графики"
-    },
-    {
-        "question": "Что означает CMYK в полиграфии?",
-        "answer": "Cyan Magenta Yellow Key",
-        "hint": "Цветовая модель для печати"
-    },
-    {
-        "question": "Как называется минимальное расстояние между элементами в дизайне?",
-        "answer": "Отступ",
-        "hint": "Пространство между объектами"
-    },
-    {
-        "question": "Какой шрифт был создан специально для экранов компьютеров?",
-        "answer": "Verdana",
-        "hint": "Разработан Microsoft для читаемости на экране"
-    },
-    {
-        "question": "Что такое 'золотое сечение' в дизайне?",
-        "answer": "Пропорция 1:1.618",
-        "hint": "Математическая пропорция, считающаяся идеальной"
-    },
-    {
-        "question": "Как называется сетка из пересекающихся линий в графическом редакторе?",
-        "answer": "Сетка",
-        "hint": "Вспомогательный инструмент для выравнивания"
-    },
-    {
-        "question": "Какой цвет является комплементарным к красному?",
-        "answer": "Зеленый",
-        "hint": "Противоположный цвет в цветовом круге"
-    },
-    {
-        "question": "Что означает RGB в цифровом дизайне?",
-        "answer": "Red Green Blue",
-        "hint": "Цветовая модель для экранов"
-    },
-    {
-        "question": "Как называется шрифт без засечек?",
-        "answer": "Sans-serif",
-        "hint": "Буквально 'без засечек'"
-    },
-    {
-        "question": "Какой принцип дизайна предполагает повторение элементов?",
-        "answer": "Ритм",
-        "hint": "Музыкальный термин в дизайне"
-    },
-    {
-        "question": "Что такое 'кернинг' в типографике?",
-        "answer": "Расстояние между буквами",
-        "hint": "Настройка межбуквенного интервала"
-    },
-    {
-        "question": "Как называется основной цвет в цветовой схеме?",
-        "answer": "Доминирующий цвет",
-        "hint": "Главный цвет композиции"
-    },
-    {
-        "question": "Что означает DPI в печати?",
-        "answer": "Dots Per Inch",
-        "hint": "Количество точек на дюйм"
-    },
-    {
-        "question": "Как называется эффект размытия фона на фотографии?",
-        "answer": "Боке",
-        "hint": "Японский термин для размытия"
-    },
-    {
-        "question": "Какой формат векторной графики наиболее распространен?",
-        "answer": "SVG",
-        "hint": "Масштабируемая векторная графика"
-    },
-    {
-        "question": "Что такое 'иерархия' в дизайне?",
-        "answer": "Визуальная организация важности",
-        "hint": "Принцип выделения главного"
-    },
-    {
-        "question": "Как называется шрифт с засечками?",
-        "answer": "Serif",
-        "hint": "Классический стиль шрифта"
-    },
-    {
-        "question": "Что означает 'responsive design'?",
-        "answer": "Адаптивный дизайн",
-        "hint": "Дизайн, подстраивающийся под размер экрана"
-    },
-    {
-        "question": "Какой цвет получается при смешении красного и синего?",
-        "answer": "Фиолетовый",
-        "hint": "Вторичный цвет в RGB"
-    },
-    {
-        "question": "Что такое 'макет' в дизайне?",
-        "answer": "Структура расположения элементов",
-        "hint": "План размещения контента"
-    },
-    {
-        "question": "Как называется минималистичный стиль дизайна?",
-        "answer": "Минимализм",
-        "hint": "Стиль 'меньше - значит больше'"
-    },
-    {
-        "question": "Что означает 'UI' в дизайне интерфейсов?",
-        "answer": "User Interface",
-        "hint": "Пользовательский интерфейс"
-    }
-]
+import riddle_packs
+
+
+def get_catalog() -> list:
+    """Все загадки текущего каталога"""
+    return riddle_packs.get_catalog().riddles
 
 
 def get_random_riddle():
     """Получить случайную загадку"""
-    import random
-    return random.choice(DESIGN_RIDDLES)
-
+    return random.choice(get_catalog())
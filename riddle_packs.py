@@ -0,0 +1,349 @@
+"""
+Каталог загадок из файлов-паков с перезагрузкой на ходу
+
+Загадки лежат в RIDDLE_PACKS_DIR (по умолчанию riddle_packs/) файлами-паками:
+- *.json - {"pack": "design", "version": 2, "riddles": [{"question", "answer", "hint"}, ...]};
+- *.jsonl - первая строка - заголовок {"pack", "version"}, дальше по загадке на строку;
+  разбирается построчно, в памяти не бывает всего документа - формат для больших паков;
+- *.yaml, *.yml - то же, что JSON (PyYAML из requirements.txt; если его нет, такие файлы
+  не загружаются, с ошибкой в логе).
+
+Каждая загадка индексируется хэшем содержимого (вопрос, ответ, подсказка): одинаковые
+загадки из разных паков - одна запись. Вопрос уникален: при конфликте остается загадка
+из файла, который идет раньше по имени (а в нем - раньше по порядку).
+
+Раз в RIDDLE_PACKS_POLL_SECONDS каталог сверяется с диском: у файла с прежними
+размером и mtime ничего не читается, измененный файл сначала хэшируется целиком и
+разбирается заново, только если хэш другой. Разбор идет в отдельном потоке, новый
+каталог подменяет старый целиком - апдейты, которые уже взяли загадку из старого,
+доработают с ней. Файл с ошибкой (например, недописанный при сохранении) не ломает
+каталог: до исправления остаются его прежние загадки. Если у загадки поменялись ответ
+или подсказка, строки riddles с тем же вопросом обновляются, и проверка ответа сразу
+идет по новому ответу.
+
+Проверка паков из корня проекта:
+    python -m riddle_packs [каталог]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+try:
+    import yaml
+    # Загрузчик на libyaml в разы быстрее чистого Python
+    YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+except ImportError:
+    yaml = None
+
+RIDDLE_PACKS_DIR = os.getenv("RIDDLE_PACKS_DIR", "riddle_packs")
+# Как часто проверять паки на диске (0 - только при старте)
+RIDDLE_PACKS_POLL_SECONDS = float(os.getenv("RIDDLE_PACKS_POLL_SECONDS", "5"))
+
+PACK_SUFFIXES = (".json", ".jsonl", ".yaml", ".yml")
+
+# Блок чтения при хэшировании файла
+HASH_CHUNK = 1024 * 1024
+
+
+def riddle_hash(question: str, answer: str, hint: Optional[str]) -> str:
+    """Хэш содержимого загадки (пустая подсказка и None - одно и то же)"""
+    content = "\0".join((question, answer, hint or ""))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PackFile:
+    """Разобранный файл-пак: заголовок, загадки по порядку и отпечаток файла"""
+
+    def __init__(self, path: str, mtime_ns: int, size: int, digest: str):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.version = None
+        self.riddles = []
+        self.skipped = 0
+
+    def add(self, item):
+        """Проверить и добавить загадку из файла; негодные пропускаются"""
+        if not isinstance(item, dict):
+            self.skipped += 1
+            return
+        question, answer, hint = item.get("question"), item.get("answer"), item.get("hint")
+        if not isinstance(question, str) or not question.strip() or not isinstance(answer, str) or not answer.strip():
+            self.skipped += 1
+            return
+        if not isinstance(hint, str) or not hint.strip():
+            hint = None
+        question, answer = question.strip(), answer.strip()
+        self.riddles.append({
+            "question": question,
+            "answer": answer,
+            "hint": hint,
+            "hash": riddle_hash(question, answer, hint)
+        })
+
+    def set_header(self, header):
+        if not isinstance(header, dict):
+            raise ValueError("заголовок пака должен быть объектом")
+        self.name = str(header.get("pack") or self.name)
+        self.version = header.get("version")
+
+
+def parse_pack(path: str, mtime_ns: int, size: int, digest: str) -> PackFile:
+    """Разобрать файл-пак; ValueError, если файл не читается как пак"""
+    pack = PackFile(path, mtime_ns, size, digest)
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            header = None
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"строка {number}: {e}") from None
+                if header is None:
+                    header = item
+                    pack.set_header(header)
+                else:
+                    pack.add(item)
+        return pack
+
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            try:
+                document = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(str(e)) from None
+        elif yaml is None:
+            raise ValueError("PyYAML не установлен")
+        else:
+            try:
+                document = yaml.load(f, Loader=YamlLoader)
+            except yaml.YAMLError as e:
+                raise ValueError(str(e)) from None
+    pack.set_header(document)
+    riddles = document.get("riddles")
+    if not isinstance(riddles, list):
+        raise ValueError("нет списка riddles")
+    for item in riddles:
+        pack.add(item)
+    return pack
+
+
+class Catalog:
+    """Загадки всех паков: список для случайного выбора и индексы по хэшу и вопросу"""
+
+    def __init__(self, files: dict):
+        # путь -> PackFile
+        self.files = files
+        self.riddles = []
+        self.by_hash = {}
+        self.by_question = {}
+        self.conflicts = 0
+        for path in sorted(files):
+            for riddle in files[path].riddles:
+                if riddle["hash"] in self.by_hash:
+                    continue
+                if riddle["question"] in self.by_question:
+                    self.conflicts += 1
+                    continue
+                self.by_hash[riddle["hash"]] = riddle
+                self.by_question[riddle["question"]] = riddle
+                self.riddles.append(riddle)
+        self.loaded_at = time.time()
+
+    def stats(self) -> dict:
+        return {
+            "riddles": len(self.riddles),
+            "conflicts": self.conflicts,
+            "packs": [
+                {
+                    "pack": pack.name,
+                    "version": pack.version,
+                    "file": os.path.basename(path),
+                    "riddles": len(pack.riddles),
+                    "skipped": pack.skipped
+                }
+                for path, pack in sorted(self.files.items())
+            ]
+        }
+
+
+def diff(old: "Catalog", new: "Catalog") -> dict:
+    """Что изменилось между каталогами: новые и удаленные вопросы, измененные загадки"""
+    old_questions = old.by_question if old else {}
+    edited = [
+        riddle for question, riddle in new.by_question.items()
+        if question in old_questions and old_questions[question]["hash"] != riddle["hash"]
+    ]
+    return {
+        "added": sum(1 for question in new.by_question if question not in old_questions),
+        "removed": sum(1 for question in old_questions if question not in new.by_question),
+        "edited": edited
+    }
+
+
+def scan(directory: str) -> dict:
+    """Файлы-паки каталога: {путь: (mtime_ns, size)}"""
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return {}
+    files = {}
+    for entry in entries:
+        if entry.is_file() and entry.name.endswith(PACK_SUFFIXES) and not entry.name.startswith("."):
+            stat = entry.stat()
+            files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+# Файлы, которые не удалось разобрать: путь -> (mtime_ns, size); пока файл не изменится,
+# он не разбирается снова и ошибка не повторяется в логе
+_failed = {}
+
+
+def load_files(directory: str, previous: dict = None) -> dict:
+    """Разобрать паки каталога, повторно используя неизмененные файлы из previous"""
+    previous = previous or {}
+    files = {}
+    for path, (mtime_ns, size) in scan(directory).items():
+        old = previous.get(path)
+        if old is not None and old.mtime_ns == mtime_ns and old.size == size:
+            files[path] = old
+            continue
+        if _failed.get(path) == (mtime_ns, size):
+            if old is not None:
+                files[path] = old
+            continue
+        try:
+            digest = file_digest(path)
+            if old is not None and old.digest == digest:
+                # Файл перезаписан без изменений: разбирать нечего
+                old.mtime_ns, old.size = mtime_ns, size
+                files[path] = old
+                continue
+            pack = parse_pack(path, mtime_ns, size, digest)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            logger.error("[ПАКИ] Не удалось загрузить %s: %s", path, e)
+            _failed[path] = (mtime_ns, size)
+            if old is not None:
+                files[path] = old
+            continue
+        _failed.pop(path, None)
+        if pack.skipped:
+            logger.warning("[ПАКИ] %s: пропущено загадок без вопроса или ответа: %d", path, pack.skipped)
+        files[path] = pack
+    return files
+
+
+catalog = None
+
+# Ожидающие изменения каталога: вызываются после каждой перезагрузки с изменениями
+_listeners = []
+
+
+def get_catalog() -> Catalog:
+    """Текущий каталог; если он еще не загружен - загрузить синхронно"""
+    global catalog
+    if catalog is None:
+        catalog = Catalog(load_files(RIDDLE_PACKS_DIR))
+    return catalog
+
+
+def on_change(callback):
+    """Подписать корутинную функцию callback() на изменения каталога (индексы, кэши)"""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+async def sync_database() -> int:
+    """Привести ответы и подсказки в riddles к каталогу: паки могли исправить, пока бот не работал"""
+    updated = await database.update_riddles_content(get_catalog().riddles)
+    if updated:
+        logger.info("[ПАКИ] Обновлены ответы и подсказки загадок в базе: %d строк", updated)
+    return updated
+
+
+async def reload(directory: str = None) -> Optional[dict]:
+    """Сверить каталог с диском; вернуть изменения (None - ничего не поменялось)"""
+    global catalog
+    directory = directory or RIDDLE_PACKS_DIR
+    old = catalog
+    previous = old.files if old else {}
+    files = await asyncio.to_thread(load_files, directory, previous)
+    if old is not None and files.keys() == previous.keys() and all(files[path] is previous[path] for path in files):
+        return None
+    new = await asyncio.to_thread(Catalog, files)
+    changes = diff(old, new)
+    catalog = new
+    if changes["edited"]:
+        updated = await database.update_riddles_content(changes["edited"])
+        logger.info("[ПАКИ] Обновлены ответы и подсказки загадок в базе: %d строк", updated)
+    logger.info(
+        "[ПАКИ] Каталог загадок: %d (новых %d, удалено %d, изменено %d), паки: %s",
+        len(new.riddles), changes["added"], changes["removed"], len(changes["edited"]),
+        ", ".join(f"{pack['pack']} v{pack['version']}" for pack in new.stats()["packs"])
+    )
+    if not new.riddles:
+        logger.error("[ПАКИ] В %s нет ни одной загадки", directory)
+    for callback in _listeners:
+        try:
+            await callback()
+        except Exception as e:
+            logger.error("Ошибка обновления после перезагрузки паков: %s", e, exc_info=True)
+    return changes
+
+
+async def watch():
+    """Проверять паки на диске раз в RIDDLE_PACKS_POLL_SECONDS"""
+    while True:
+        await asyncio.sleep(RIDDLE_PACKS_POLL_SECONDS)
+        try:
+            await reload()
+        except Exception as e:
+            logger.error("Ошибка перезагрузки паков загадок: %s", e, exc_info=True)
+
+
+def start_watcher() -> Optional[asyncio.Task]:
+    if RIDDLE_PACKS_POLL_SECONDS <= 0:
+        return None
+    return asyncio.create_task(watch())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=RIDDLE_PACKS_DIR)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    started = time.perf_counter()
+    result = Catalog(load_files(args.directory)).stats()
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    raise SystemExit(0 if result["riddles"] else 1)
+
+
+if __name__ == "__main__":
+    main()
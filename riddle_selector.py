@@ -0,0 +1,145 @@
+"""
+Подбор загадки по уровню игрока: сложность загадок против умения пользователя
+
+Индекс строится заранее (раз в SELECTOR_REFRESH_SECONDS в каждом процессе бота и сразу
+после изменения каталога паков riddle_packs.py): загадки каталога сортируются по сложности
+и делятся на SELECTOR_BUCKETS корзин равного размера, а игроки - на столько же уровней
+по границам из database.get_skill_quantiles. Выбор
+загадки - уровень игрока по двум его счетчикам и случайная загадка из корзины того же
+номера; по каталогу при выборе ничего не считается.
+
+Сложность - доля назначений без решения (riddle_stats) со сглаживанием к средней по
+каталогу: у загадки с парой назначений оценка почти средняя. Пока данных нет, порядок
+берется из каталога (сначала простые). Умение - решений на попытку с PRIOR_ATTEMPTS
+попытками без решения в запасе: новичок начинает с простых загадок.
+
+С вероятностью SELECTOR_EXPLORE_RATE загадка берется из соседней корзины, чтобы
+статистика копилась по всему каталогу и оценки сложности не застывали.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from bisect import bisect_left
+
+import database
+import riddle_generator
+
+logger = logging.getLogger(__name__)
+
+SELECTOR_BUCKETS = int(os.getenv("SELECTOR_BUCKETS", "5"))
+SELECTOR_REFRESH_SECONDS = float(os.getenv("SELECTOR_REFRESH_SECONDS", "600"))
+SELECTOR_EXPLORE_RATE = float(os.getenv("SELECTOR_EXPLORE_RATE", "0.1"))
+
+# Сколько назначений весит средняя по каталогу доля решений в оценке одной загадки
+PRIOR_ASSIGNMENTS = 10
+# Сколько попыток без решения добавляется к счетчикам игрока
+PRIOR_ATTEMPTS = 5
+# Доля решений, пока по каталогу нет ни одного назначения
+DEFAULT_SOLVE_RATE = 0.5
+
+
+def skill(solved: int, attempted: int) -> float:
+    """Умение игрока; та же формула - в database.get_skill_quantiles"""
+    return (solved or 0) / ((attempted or 0) + PRIOR_ATTEMPTS)
+
+
+class DifficultyIndex:
+    """Загадки по корзинам сложности (0 - самые простые) и границы уровней игроков"""
+
+    def __init__(self, buckets: list, skill_bounds: list, difficulty: dict = None):
+        self.buckets = buckets
+        self.skill_bounds = skill_bounds
+        # question -> оценка сложности (0..1), для отладки и бенчмарка
+        self.difficulty = difficulty or {}
+        self.built_at = time.time()
+
+    def bucket_for(self, solved: int, attempted: int) -> int:
+        """Номер корзины для игрока с такими счетчиками"""
+        level = bisect_left(self.skill_bounds, skill(solved, attempted)) if attempted else 0
+        return min(level, len(self.buckets) - 1)
+
+    def pick(self, bucket: int, spread: int = 0, rng=random) -> dict:
+        """Случайная загадка из корзины bucket или из корзины не дальше spread от нее"""
+        if rng.random() < SELECTOR_EXPLORE_RATE:
+            spread = max(spread, 1)
+        if spread:
+            bucket += rng.randint(-spread, spread)
+        bucket = min(max(bucket, 0), len(self.buckets) - 1)
+        return rng.choice(self.buckets[bucket])
+
+
+def build_index(catalog: list, counts: dict, skill_bounds: list, buckets: int = SELECTOR_BUCKETS) -> DifficultyIndex:
+    """Индекс по каталогу и счетчикам {question: (назначений, решений)}"""
+    assigned = sum(item[0] or 0 for item in counts.values())
+    solved = sum(item[1] or 0 for item in counts.values())
+    prior = solved / assigned if assigned else DEFAULT_SOLVE_RATE
+
+    difficulty = {}
+    for riddle in catalog:
+        riddle_assigned, riddle_solved = counts.get(riddle["question"], (0, 0))
+        solve_rate = ((riddle_solved or 0) + PRIOR_ASSIGNMENTS * prior) / ((riddle_assigned or 0) + PRIOR_ASSIGNMENTS)
+        difficulty[riddle["question"]] = 1 - solve_rate
+
+    # sorted устойчива: при равной оценке сохраняется порядок каталога (от простых к сложным)
+    ranked = sorted(catalog, key=lambda riddle: difficulty[riddle["question"]])
+    buckets = max(1, min(buckets, len(ranked)))
+    size, extra = divmod(len(ranked), buckets)
+    parts, start = [], 0
+    for number in range(buckets):
+        end = start + size + (1 if number < extra else 0)
+        parts.append(ranked[start:end])
+        start = end
+    # Уровней игроков столько же, сколько корзин
+    return DifficultyIndex(parts, skill_bounds[:buckets - 1], difficulty)
+
+
+# Текущий индекс; до первой сборки загадка выбирается случайно
+index = None
+
+
+async def rebuild() -> DifficultyIndex:
+    """Пересобрать индекс по текущей статистике и заменить им текущий"""
+    global index
+    started = time.perf_counter()
+    counts = await database.get_difficulty_by_question()
+    skill_bounds = await database.get_skill_quantiles(SELECTOR_BUCKETS, PRIOR_ATTEMPTS)
+    # Сортировка большого каталога - в потоке, чтобы не держать event loop
+    index = await asyncio.to_thread(build_index, riddle_generator.get_catalog(), counts, skill_bounds)
+    logger.debug(
+        "[ПОДБОР] Индекс сложности: %d загадок в %d корзинах, границы уровней %s, за %.3f с",
+        sum(len(bucket) for bucket in index.buckets), len(index.buckets),
+        [round(bound, 3) for bound in index.skill_bounds], time.perf_counter() - started
+    )
+    return index
+
+
+async def refresh_loop():
+    """Пересобирать индекс раз в SELECTOR_REFRESH_SECONDS (в каждом процессе, отвечающем пользователям)"""
+    while True:
+        try:
+            await rebuild()
+        except Exception as e:
+            logger.error("Ошибка сборки индекса подбора загадок: %s", e, exc_info=True)
+        await asyncio.sleep(SELECTOR_REFRESH_SECONDS)
+
+
+def start() -> asyncio.Task:
+    return asyncio.create_task(refresh_loop())
+
+
+async def user_bucket(user_id: int) -> int:
+    """Корзина сложности для пользователя по его счетчикам"""
+    stats = await database.get_user_stats(user_id)
+    if not stats or index is None:
+        return 0
+    return index.bucket_for(stats["total_riddles_solved"], stats["total_riddles_attempted"])
+
+
+def pick_for(bucket: int, attempt: int = 0) -> dict:
+    """Загадка для корзины bucket; с каждой третьей неудачной попыткой (загадка уже
+    встречалась пользователю) поиск расширяется на соседние корзины"""
+    if index is None or not index.buckets[0]:
+        return riddle_generator.get_random_riddle()
+    return index.pick(bucket, spread=attempt // 3)
@@ -0,0 +1,94 @@
+"""
+Маршрутизация сообщений и callback-кнопок по таблице вместо цепочки проверок подстрок
+"""
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+# Надписи кнопок ReplyKeyboard - единственный источник правды для клавиатур и маршрутов
+BTN_NEW_RIDDLE = "🎲 Новая загадка"
+BTN_STATS = "📊 Моя статистика"
+BTN_LEADERBOARD = "🏆 Лидерборд"
+BTN_HINT = "💡 Подсказка"
+BTN_STOP = "⏸ Остановить бота"
+BTN_RESUME = "▶️ Начать разгадывать загадки"
+
+MAIN_KEYBOARD = [
+    [BTN_NEW_RIDDLE, BTN_STATS],
+    [BTN_LEADERBOARD, BTN_HINT],
+    [BTN_STOP]
+]
+PAUSED_KEYBOARD = [
+    [BTN_RESUME]
+]
+
+
+def normalize_label(text: str) -> str:
+    """Привести текст к ключу таблицы маршрутов"""
+    return " ".join(text.split()).casefold()
+
+
+class Router:
+    """Таблица маршрутов: точное совпадение ключа -> обработчик"""
+
+    def __init__(self, name: str, key: Callable[[str], str] = lambda value: value):
+        self.name = name
+        self._key = key
+        self._routes: Dict[str, Tuple[str, Callable]] = {}
+
+    def add(self, route: str, handler: Callable, *keys: str):
+        """Зарегистрировать обработчик маршрута для одного или нескольких ключей"""
+        for key in keys:
+            self._routes[self._key(key)] = (route, handler)
+
+    def resolve(self, value: str) -> Optional[Tuple[str, Callable]]:
+        """Найти маршрут для значения (None - маршрута нет)"""
+        return self._routes.get(self._key(value))
+
+    async def dispatch(self, route: str, handler: Callable, *args, **kwargs):
+        """Вызвать обработчик маршрута, учитывая время выполнения и ошибки в метриках"""
+        started = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            metrics.ROUTE_ERRORS.inc(self.name, route)
+            raise
+        finally:
+            metrics.ROUTE_SECONDS.observe(time.perf_counter() - started, self.name, route)
+
+
+# Кнопки ReplyKeyboard: ключ - нормализованная надпись кнопки
+message_router = Router("message", key=normalize_label)
+
+# Inline-кнопки: ключ - действие из callback_data
+callback_router = Router("callback")
+
+
+# Кодек callback_data: "<действие>" или "<действие>:<арг>:<арг>"
+CALLBACK_SEPARATOR = ":"
+
+# Старый формат "<действие>_<user_id>" у кнопок, уже отправленных пользователям
+LEGACY_CALLBACK_PREFIXES = ("new_riddle", "leaderboard", "stats", "hint")
+
+
+def encode_callback(action: str, *args) -> str:
+    """Собрать callback_data (лимит Telegram - 64 байта)"""
+    data = CALLBACK_SEPARATOR.join([action, *(str(arg) for arg in args)])
+    if len(data.encode("utf-8")) > 64:
+        raise ValueError(f"callback_data длиннее 64 байт: {data}")
+    return data
+
+
+def decode_callback(data: str) -> Tuple[str, List[str]]:
+    """Разобрать callback_data в (действие, аргументы)"""
+    if not data:
+        return "", []
+    if CALLBACK_SEPARATOR in data:
+        action, *args = data.split(CALLBACK_SEPARATOR)
+        return action, args
+    for prefix in LEGACY_CALLBACK_PREFIXES:
+        if data == prefix or data.startswith(prefix + "_"):
+            rest = data[len(prefix) + 1:]
+            return prefix, [rest] if rest else []
+    return data, []
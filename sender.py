@@ -0,0 +1,63 @@
+"""
+Отправка массовых сообщений с учетом лимитов Telegram Bot API
+"""
+import asyncio
+import logging
+import time
+
+from telegram.error import Forbidden, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram допускает ~30 сообщений в секунду на бота, оставляем запас
+MESSAGES_PER_SECOND = 25
+MAX_RETRIES = 3
+
+
+class RateLimiter:
+    """Равномерно распределяет отправки: не чаще rate сообщений в секунду"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_limiter = None
+
+
+def get_limiter() -> RateLimiter:
+    """Общий лимитер процесса (создается в работающем event loop)"""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(MESSAGES_PER_SECOND)
+    return _limiter
+
+
+async def send_message(bot, chat_id: int, text: str, **kwargs):
+    """Отправить сообщение с ограничением частоты
+
+    Возвращает отправленное сообщение или None, если пользователь заблокировал бота.
+    При RetryAfter ждет указанное Telegram время и повторяет отправку.
+    """
+    limiter = get_limiter()
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.wait()
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except RetryAfter as e:
+            if attempt == MAX_RETRIES:
+                raise
+            logger.warning(f"Telegram просит подождать {e.retry_after}s перед отправкой пользователю {chat_id}")
+            await asyncio.sleep(e.retry_after)
+        except Forbidden:
+            logger.info(f"Пользователь {chat_id} заблокировал бота, сообщение не отправлено")
+            return None
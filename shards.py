@@ -0,0 +1,271 @@
+"""
+Несколько процессов-воркеров: фронт принимает апдейты и раздает их по хешу user_id
+
+Один процесс asyncio занимает одно ядро, и проверка ответов (pymorphy3) упирается в него.
+При WORKERS > 1 главный процесс становится фронтом: он забирает апдейты через getUpdates
+(long polling) и отправляет каждый в очередь воркера shard_for(user_id, WORKERS).
+Воркер - отдельный процесс с обычным приложением из bot.build_application: те же
+обработчики, свои словари морфологии и кэши, ответы в Telegram он отправляет сам.
+
+Порядок апдейтов одного пользователя сохраняется: все его апдейты попадают к одному
+воркеру через одну FIFO-очередь, а внутри воркера их упорядочивает user_locks.
+Задачи планировщика и начальный набор загадок - только в воркере 0 (при RUN_MODE=bot - ни в одном).
+Воркеры работают с одной базой (DB_PATH, режим WAL). Метрики воркера i - на порту
+METRICS_PORT + 1 + i, на METRICS_PORT - метрики фронта и /healthz, /readyz.
+
+Режим webhook не поддерживается: он требует python-telegram-bot[webhooks].
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+import threading
+import time
+
+from telegram import Bot, Update
+
+import config
+import database
+import logging_setup
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Таймаут long polling у фронта (секунды)
+POLL_TIMEOUT = 30
+# Сколько ждать готовности воркеров при старте и их завершения при остановке (секунды)
+WORKER_START_TIMEOUT = 60
+WORKER_STOP_TIMEOUT = 30
+
+SHARD_UPDATES = metrics.Counter("bot_shard_updates_total", "Апдейтов передано воркеру", ["shard"])
+WORKER_RESTARTS = metrics.Counter("bot_shard_worker_restarts_total", "Перезапусков упавших воркеров", ["shard"])
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(key: int) -> int:
+    """Перемешать биты ключа (финализатор splitmix64): id пользователей идут почти подряд"""
+    key = (key + 0x9E3779B97F4A7C15) & _MASK64
+    key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return key ^ (key >> 31)
+
+
+def shard_for(key: int, shards: int) -> int:
+    """Номер шарда для ключа - jump consistent hash (Lamping, Veach, 2014)
+
+    При изменении числа шардов с N на N+1 к новому шарду переезжает около 1/(N+1) ключей,
+    остальные пользователи остаются у своих воркеров.
+    """
+    key = _mix64(key & _MASK64)
+    bucket, candidate = -1, 0
+    while candidate < shards:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & _MASK64
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def update_key(update: Update) -> int:
+    """Ключ шардирования: id пользователя, иначе id чата"""
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return 0
+
+
+def worker_main(index: int, shards: int, updates, ready, parent_pid: int):
+    """Точка входа процесса-воркера"""
+    # Останавливает воркер фронт (через очередь), а не сигнал группе процессов
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging_setup.setup_logging(config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_ANSWER_SAMPLE_RATE)
+    asyncio.run(_serve(index, shards, updates, ready, parent_pid))
+
+
+async def _serve(index: int, shards: int, updates, ready, parent_pid: int):
+    import bot
+
+    port = config.METRICS_PORT + 1 + index if config.METRICS_PORT else 0
+    application = bot.build_application(run_jobs=index == 0 and config.RUN_MODE == "all", metrics_port=port)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+
+    def feed(data: dict):
+        application.update_queue.put_nowait(Update.de_json(data, application.bot))
+
+    def read():
+        # Чтение очереди - в отдельном потоке, чтобы не блокировать event loop
+        while True:
+            try:
+                data = updates.get(timeout=1)
+            except queue_module.Empty:
+                if os.getppid() != parent_pid:
+                    logger.error("[ШАРДЫ] Воркер %d: фронт завершился, останавливаемся", index)
+                    break
+                continue
+            if data is None:
+                break
+            loop.call_soon_threadsafe(feed, json.loads(data))
+        loop.call_soon_threadsafe(stopped.set_result, None)
+
+    threading.Thread(target=read, name=f"shard-{index}-reader", daemon=True).start()
+    ready.put(index)
+    logger.info("[ШАРДЫ] Воркер %d/%d запущен (pid %d)", index, shards, os.getpid())
+    await stopped
+
+    await application.stop()
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    logger.info("[ШАРДЫ] Воркер %d остановлен", index)
+
+
+class Front:
+    """Фронт: забирает апдейты из Telegram и раздает их воркерам по шардам"""
+
+    def __init__(self, shards: int):
+        self.shards = shards
+        self.offset = None
+        self.bot = None
+        self.queues = []
+        self.processes = []
+        self._context = multiprocessing.get_context("spawn")
+        self._ready = self._context.Queue()
+        self._stopping = False
+
+    def _spawn(self, index: int) -> multiprocessing.Process:
+        process = self._context.Process(
+            target=worker_main,
+            args=(index, self.shards, self.queues[index], self._ready, os.getpid()),
+            name=f"shard-{index}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    async def start(self):
+        """Создать схему БД, запустить воркеры и дождаться их готовности"""
+        # Схема создается один раз до старта воркеров, чтобы они не мигрировали базу наперегонки
+        await database.init_db()
+        self.queues = [self._context.Queue() for _ in range(self.shards)]
+        self.processes = [self._spawn(index) for index in range(self.shards)]
+        await asyncio.to_thread(self._wait_ready)
+
+        kwargs = {"base_url": config.TELEGRAM_API_URL} if config.TELEGRAM_API_URL else {}
+        self.bot = Bot(config.BOT_TOKEN, **kwargs)
+        await self.bot.initialize()
+        logger.info("[ШАРДЫ] Фронт запущен, воркеров: %d", self.shards)
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        started = 0
+        while started < self.shards:
+            try:
+                self._ready.get(timeout=1)
+                started += 1
+            except queue_module.Empty:
+                dead = [process.name for process in self.processes if not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Воркеры завершились при старте: {', '.join(dead)}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Воркеры не запустились за {WORKER_START_TIMEOUT} с")
+
+    def dispatch(self, update: Update) -> int:
+        """Отправить апдейт воркеру его шарда"""
+        shard = shard_for(update_key(update), self.shards)
+        # JSON, а не pickle объектов telegram: воркер собирает Update заново со своим bot
+        self.queues[shard].put(json.dumps(update.to_dict()))
+        SHARD_UPDATES.inc(str(shard))
+        return shard
+
+    def check_workers(self):
+        """Перезапустить упавшие воркеры; их очередь с необработанными апдейтами сохраняется"""
+        for index, process in enumerate(self.processes):
+            if process.is_alive() or self._stopping:
+                continue
+            logger.error("[ШАРДЫ] Воркер %d завершился с кодом %s, перезапуск", index, process.exitcode)
+            WORKER_RESTARTS.inc(str(index))
+            self.processes[index] = self._spawn(index)
+
+    async def run(self):
+        """Цикл long polling: getUpdates и раздача апдейтов"""
+        while not self._stopping:
+            self.check_workers()
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self.offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("[ШАРДЫ] Ошибка getUpdates: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                self.dispatch(update)
+                self.offset = update.update_id + 1
+
+    async def stop(self):
+        """Подтвердить полученные апдейты, дать воркерам доделать очереди и остановить их"""
+        self._stopping = True
+        if self.bot is not None:
+            if self.offset is not None:
+                try:
+                    await self.bot.get_updates(offset=self.offset, timeout=0, limit=1)
+                except Exception as e:
+                    logger.warning("[ШАРДЫ] Не удалось подтвердить апдейты: %s", e)
+            await self.bot.shutdown()
+        for updates in self.queues:
+            updates.put(None)
+        await asyncio.to_thread(self._join)
+        logger.info("[ШАРДЫ] Фронт остановлен")
+
+    def _join(self):
+        for process in self.processes:
+            process.join(WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("[ШАРДЫ] Воркер %s не остановился, завершаем принудительно", process.name)
+                process.terminate()
+                process.join()
+
+    def readyz(self):
+        alive = [process.is_alive() for process in self.processes]
+        ready = bool(alive) and all(alive) and not self._stopping
+        payload = {"status": "ready" if ready else "not ready", "workers": alive}
+        return 200 if ready else 503, "application/json; charset=utf-8", json.dumps(payload) + "\n"
+
+
+async def serve(shards: int):
+    """Запустить фронт с воркерами и работать до SIGINT/SIGTERM"""
+    front = Front(shards)
+    metrics.ROUTES["/healthz"] = lambda: (200, "text/plain; charset=utf-8", "ok\n")
+    metrics.ROUTES["/readyz"] = front.readyz
+    await metrics.start_http_server(config.METRICS_PORT, config.METRICS_HOST)
+    await front.start()
+
+    task = asyncio.create_task(front.run())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await front.stop()
+
+
+def run(shards: int):
+    """Запуск из bot.main() при WORKERS > 1"""
+    asyncio.run(serve(shards))
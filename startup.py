@@ -0,0 +1,65 @@
+"""
+Фазы холодного старта и время до первого ответа (от запуска процесса)
+"""
+import logging
+import os
+import time
+from functools import wraps
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Цель по времени от запуска процесса до первого обработанного апдейта (секунды)
+FIRST_REPLY_TARGET_SECONDS = float(os.getenv("FIRST_REPLY_TARGET_SECONDS", "3"))
+
+
+def _process_start_time() -> float:
+    """Время запуска процесса (time.time()) по /proc; иначе - время импорта модуля"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Поля после имени процесса; starttime - 22-е поле stat
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.time()
+
+
+PROCESS_STARTED = _process_start_time()
+
+# Фаза -> секунды от запуска процесса
+phases = {}
+_first_reply_seen = False
+
+
+def elapsed() -> float:
+    return time.time() - PROCESS_STARTED
+
+
+def mark(phase: str) -> float:
+    """Отметить завершение фазы старта"""
+    seconds = elapsed()
+    phases[phase] = seconds
+    metrics.STARTUP_SECONDS.set(round(seconds, 3), phase)
+    logger.info("[СТАРТ] %s: %.3f с от запуска процесса", phase, seconds)
+    return seconds
+
+
+def track_first_reply(handler):
+    """Декоратор обработчика: отметить время до первого обработанного апдейта"""
+    @wraps(handler)
+    async def wrapper(*args, **kwargs):
+        global _first_reply_seen
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            if not _first_reply_seen:
+                _first_reply_seen = True
+                seconds = mark("first_reply")
+                if seconds > FIRST_REPLY_TARGET_SECONDS:
+                    logger.warning(
+                        "[СТАРТ] Первый ответ через %.2f с, цель - %.1f с", seconds, FIRST_REPLY_TARGET_SECONDS
+                    )
+    return wrapper
@@ -0,0 +1,48 @@
+"""
+Упорядоченная обработка апдейтов одного пользователя при конкурентной обработке
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from functools import wraps
+
+# Блокировка на каждого пользователя, у которого сейчас есть апдейты в обработке.
+# asyncio.Lock отдает владение ожидающим в порядке FIFO, поэтому апдейты одного
+# пользователя обрабатываются в том порядке, в котором пришли.
+_locks = {}
+_holders = {}
+
+
+@asynccontextmanager
+async def user_lock(user_id: int):
+    """Захватить блокировку пользователя на время обработки апдейта"""
+    lock = _locks.get(user_id)
+    if lock is None:
+        lock = _locks[user_id] = asyncio.Lock()
+    _holders[user_id] = _holders.get(user_id, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        # Удаляем блокировку, когда апдейтов пользователя больше нет,
+        # чтобы словарь не рос вместе с числом пользователей
+        _holders[user_id] -= 1
+        if not _holders[user_id]:
+            del _holders[user_id]
+            del _locks[user_id]
+
+
+def active_users_count() -> int:
+    """Количество пользователей, у которых сейчас обрабатываются апдейты"""
+    return len(_locks)
+
+
+def per_user(handler):
+    """Обернуть обработчик так, чтобы апдейты одного пользователя шли по очереди"""
+    @wraps(handler)
+    async def wrapper(update, context):
+        user = update.effective_user if update else None
+        if user is None:
+            return await handler(update, context)
+        async with user_lock(user.id):
+            return await handler(update, context)
+    return wrapper